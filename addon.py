@@ -18,11 +18,11 @@
 from __future__ import unicode_literals
 
 import sys
-import traceback
-import xbmc, xbmcgui
+import time
 
-from resources.lib.sysvolume.mixer import Mixer
-from resources.lib.sysvolume import debug, config
+# Only the modules for a command sent to the service are imported here, the others
+# when they are needed: a key press shouldn't wait for the mixer and dialog modules.
+from resources.lib.sysvolume import debug, config, commands, client, stats
 from resources.lib.sysvolume.config import settings, _T
 
 #------------------------------------------------------------------------------
@@ -45,41 +45,60 @@ def get_argv_int(idx, default=0):
         pass
     return retval
 
-def show_progress(mixer):
+def show_progress(volume, muted):
     if settings.show_progress:
-        dia = xbmcgui.DialogProgressBG()
-        dia.create(heading=settings.addon_name)
-        dia.update(percent=mixer.volume, message='[%s] %s: %s%% %s' % (settings.device_name,
-                                                                       settings.mixer_name,
-                                                                       mixer.volume, _T(30104) if mixer.muted else ''))
-        xbmc.sleep(settings.progress_time)
-        dia.close()
+        from resources.lib.sysvolume import osd
+        osd.show_shared(volume, muted)
+
+def mixer_label(name, control):
+    if not control or control.get('volume') is None:
+        return name
+    return '%s (%s%%) %s' % (name, control['volume'], _T(30104) if control.get('muted') else '')
 
 def select_device():
+    import xbmcgui
+    from resources.lib.sysvolume.mixer import Mixer
     debug.logInfo('Selecting mixer device')
     devices = Mixer.getDevices()
     devkeys = list(devices.keys())
     devlist = []
     for key in devkeys:
         deviceName = '[%s] %s' % (key, devices[key]['name'])
-        debug.logInfo('Found device: %s' % deviceName)
+        debug.logInfo('Found device: %s', deviceName)
         devlist.append(deviceName)
         for mixer in devices[key]['mixer']:
-            debug.logInfo('Found mixer: %s' % mixer)
+            debug.logInfo('Found mixer: %s', mixer)
     if len(devlist) == 0:
         xbmcgui.Dialog().ok(_T(30101), _T(30102))
     else:
         device = xbmcgui.Dialog().select(_T(30101), devlist)
         if device >= 0:
             mixers = devices[devkeys[device]]['mixer']
+            controls = devices[devkeys[device]].get('controls', {})
+            if any(control.get('volume') is None for control in controls.values()):
+                # The cached device list has no levels, they are read for this device only
+                levels = Mixer.getLevels(devkeys[device])
+                controls = dict((name, dict(control, **levels.get(name, {}))) for name, control in controls.items())
             if len(mixers) > 0:
-                mixer = xbmcgui.Dialog().select(_T(30103), mixers)
+                mixer = xbmcgui.Dialog().select(_T(30103), [mixer_label(name, controls.get(name)) for name in mixers])
                 mixer_name = mixers[mixer]
             else:
                 mixer_name = ''
             config.setSetting('device_name', devkeys[device].encode('utf-8'))
             config.setSetting('mixer_name', mixer_name.encode('utf-8'))
-            debug.logInfo("Selected device '%s' with mixer '%s'" % (devkeys[device], mixer_name))
+            debug.logInfo("Selected device '%s' with mixer '%s'", devkeys[device], mixer_name)
+
+def dump_stats():
+    ''' Writes the statistics of the service, or of this process if it is not running, to stats.json '''
+    import json
+    from resources.lib.sysvolume import storage
+    from resources.lib.sysvolume.executor import executor
+    result = client.send_command('stats') if settings.enable_service else None
+    if result is None:
+        result = {'stats': stats.snapshot(), 'executor': executor.stats()}
+    path = storage.profile_path(stats.STATS_FILE)
+    storage.save_json(path, result)
+    debug.xbmcLog('Performance statistics written to %s: %s' % (path, json.dumps(result['stats']['counters'])), level=debug.LOGNOTICE)
 
 #------------------------------------------------------------------------------
 # MAIN
@@ -88,32 +107,33 @@ def select_device():
 if __name__ == '__main__':
 
     try:
-        mixer = Mixer.create(settings.device_name, settings.mixer_name,
-                             settings.step_up, settings.step_down,
-                             settings.max_volume)
         cmd = get_argv(1, '').lower()
-        if cmd == 'up':
-            mixer.volumeUp(step=get_argv_int(2, default=settings.step_up))
-            show_progress(mixer)
-        elif cmd == 'down':
-            mixer.volumeDown(step=get_argv_int(2, default=settings.step_down))
-            show_progress(mixer)
-        elif cmd == 'change':
-            mixer.changeVolume(step=get_argv_int(2, default=0))
-            show_progress(mixer)
-        elif cmd == 'set':
-            mixer.setVolume(volume=get_argv_int(2, default=mixer.volume))
-            show_progress(mixer)
-        elif cmd == 'mute':
-            newMute = get_argv(2, default= 'true' if mixer.muted else 'false').lower()
-            mixer.setMute(mute= True if newMute == 'true' else False)
-            show_progress(mixer)
-        elif cmd == 'mutetoggle':
-            mixer.muteToggle()
-            show_progress(mixer)
+        if cmd == 'stats':
+            dump_stats()
+        elif cmd in commands.COMMANDS:
+            start = time.time()
+            mixer_state = None
+            if settings.enable_service:
+                # Let the mixer service do the work if it is running
+                mixer_state = client.send_command(cmd, sys.argv[2:])
+            if mixer_state is None:
+                from resources.lib.sysvolume import lock
+                from resources.lib.sysvolume.mixer import Mixer
+                mixer = Mixer.create(settings.device_name, settings.mixer_name,
+                                     settings.step_up, settings.step_down,
+                                     settings.max_volume, group=settings.mixer_group)
+                mixer_state = lock.execute(mixer, cmd, sys.argv[2:])
+                if settings.publish_state:
+                    from resources.lib.sysvolume import monitor
+                    monitor.publish(mixer_state['volume'], mixer_state['muted'])
+            stats.record('addon.%s' % cmd, time.time() - start)
+            if commands.shows_osd(cmd, sys.argv[2:]) and not mixer_state.get('osd'):
+                # Only for changes of the volume, and the service shows the dialog itself
+                show_progress(mixer_state['volume'], mixer_state['muted'])
         else:
             select_device()
             pass
     except Exception as e:
+        import traceback
         debug.logException(e)
         traceback.print_exc()
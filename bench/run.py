@@ -0,0 +1,718 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+''' Benchmarks for the mixer classes and the addon script.
+
+Runs without Kodi and without a sound card: the Kodi modules are replaced by
+the stubs in bench/stubs, and amixer/osascript by the stub programs in
+bench/stubs/bin which are put in front of the PATH. libasound is replaced by
+bench/stubs/libasound.c, which is built with the C compiler if there is one.
+
+    python3 bench/run.py --output results.json
+    python3 bench/run.py --compare results.json
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCH_DIR)
+STUB_DIR = os.path.join(BENCH_DIR, 'stubs')
+
+MIXER_OPS = [
+    ('getVolume', lambda m: m.getVolume()),
+    ('setVolume', lambda m: m.setVolume(40)),
+    ('changeVolume', lambda m: m.changeVolume(2)),
+    ('volumeUp', lambda m: m.volumeUp()),
+    ('volumeDown', lambda m: m.volumeDown()),
+    ('isMuted', lambda m: m.isMuted()),
+    ('setMute', lambda m: m.setMute(False)),
+    ('muteToggle', lambda m: m.muteToggle()),
+]
+
+ADDON_COMMANDS = [
+    ['up'],
+    ['down'],
+    ['change', '5'],
+    ['set', '40'],
+    ['mute', 'false'],
+    ['mutetoggle'],
+]
+
+
+class EventLog(object):
+    ''' Counts the events which the stubs write into the log file '''
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    def mark(self):
+        self.offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def counts(self):
+        counts = {'spawns': 0, 'mixer_writes': 0, 'settings_writes': 0, 'settings_reads': 0, 'dialogs': 0,
+                  'pulse_requests': 0, 'alsa_calls': 0, 'max_open_dialogs': 0, 'dialog_owners': 0}
+        if not os.path.exists(self.path):
+            return counts
+        # Processes which created a dialog, and the dialogs open at the same time
+        owners = set()
+        open_dialogs = 0
+        with open(self.path) as f:
+            f.seek(self.offset)
+            for line in f:
+                kind, _, text = line.strip().partition(' ')
+                if kind == 'spawn':
+                    counts['spawns'] += 1
+                elif kind == 'cmd' and (text.split(' ')[0] in ('set', 'sset') or text.startswith('set volume')):
+                    counts['mixer_writes'] += 1
+                elif kind == 'setSetting':
+                    counts['settings_writes'] += 1
+                elif kind == 'getSetting':
+                    counts['settings_reads'] += 1
+                elif kind == 'dialog' and text.startswith('create'):
+                    counts['dialogs'] += 1
+                    owners.add(text.partition(' ')[2])
+                    open_dialogs += 1
+                    counts['max_open_dialogs'] = max(counts['max_open_dialogs'], open_dialogs)
+                elif kind == 'dialog' and text.startswith('close'):
+                    open_dialogs = max(0, open_dialogs - 1)
+                elif kind == 'pulse':
+                    counts['pulse_requests'] += 1
+                    if text.startswith('set-'):
+                        counts['mixer_writes'] += 1
+                elif kind == 'alsa':
+                    counts['alsa_calls'] += 1
+                    if text.startswith('set-'):
+                        counts['mixer_writes'] += 1
+        counts['dialog_owners'] = len(owners)
+        return counts
+
+
+def ms(seconds):
+    return round(seconds * 1000.0, 3)
+
+def median(values):
+    values = sorted(values)
+    if not values:
+        return 0
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2.0
+
+def write_cards(workdir, cards, controls):
+    ''' Creates the amixer and libasound stub states and a /proc/asound/cards file '''
+    state = {}
+    lines = []
+    for card in range(cards):
+        card_id = 'Card%d' % card if card else '0'
+        state[card_id] = {'Master': stub_control(), 'PCM': stub_control(max=255, value=255, switch=None)}
+        for i in range(max(0, controls - 2)):
+            state[card_id]['Control %d' % i] = stub_control(channels=['Mono'], value=i % 88)
+        lines.append('%2d [%-15s]: Stub - Stub Card %d' % (card, card_id, card))
+        lines.append('                      Stub Card %d at stub' % card)
+    with open(os.path.join(workdir, 'amixer.json'), 'w') as f:
+        json.dump(state, f)
+    write_alsa_state(os.path.join(workdir, 'alsa.state'), state)
+    with open(os.path.join(workdir, 'cards'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def write_alsa_state(path, state):
+    ''' The playback controls in the text format of the libasound stub '''
+    lines = []
+    for card_id in sorted(state):
+        for name, c in sorted(state[card_id].items()):
+            if c['kind'] != 'playback':
+                continue
+            fields = [c['min'], c['max'], int(round(c['dbmin'] * 100)), int(round(c['dbmax'] * 100)),
+                      len(c['channels']), 1 if c['switch'] is not None else 0] + c['values']
+            if c['switch'] is not None:
+                fields += [1 if on else 0 for on in c['switch']]
+            lines.append('%s\t%s\t%s' % (card_id, name, ' '.join('%s' % field for field in fields)))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def build_libasound(workdir):
+    ''' Builds the libasound stub, returns its path or None without a C compiler '''
+    path = os.path.join(workdir, 'libasound-stub.so')
+    if not os.path.exists(path):
+        try:
+            subprocess.check_call([os.environ.get('CC', 'cc'), '-shared', '-fPIC', '-O2', '-o', path,
+                                   os.path.join(STUB_DIR, 'libasound.c')])
+        except (OSError, subprocess.CalledProcessError) as e:
+            sys.stderr.write('libasound stub not built: %s\n' % e)
+            return None
+    return path
+
+def stub_control(kind='playback', min=0, max=87, channels=('Front Left', 'Front Right'), value=50, switch=True):
+    return {'kind': kind, 'min': min, 'max': max, 'dbmin': -65.25, 'dbmax': 0.0, 'channels': list(channels),
+            'values': [value] * len(channels), 'switch': [switch] * len(channels) if switch is not None else None}
+
+
+class Bench(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix='sysvolume-bench-')
+        self.log = EventLog(os.path.join(self.workdir, 'events.log'))
+        self.settings = {'device_name': '0', 'mixer_name': 'Master',
+                         'show_progress': 'true' if args.progress else 'false', 'progress_time': '100'}
+        self.env = dict(os.environ)
+        self.env.update({
+            'PATH': os.path.join(STUB_DIR, 'bin') + os.pathsep + os.environ.get('PATH', ''),
+            'PYTHONPATH': os.pathsep.join([STUB_DIR, ADDON_DIR]),
+            'SYSVOLUME_STUB_LOG': self.log.path,
+            'SYSVOLUME_STUB_DELAY': '%s' % args.delay,
+            'SYSVOLUME_STUB_PROFILE': os.path.join(self.workdir, 'profile'),
+            'SYSVOLUME_STUB_AMIXER_STATE': os.path.join(self.workdir, 'amixer.json'),
+            'SYSVOLUME_STUB_ALSA_STATE': os.path.join(self.workdir, 'alsa.state'),
+            'SYSVOLUME_STUB_OSASCRIPT_STATE': os.path.join(self.workdir, 'osascript.json'),
+            'SYSVOLUME_STUB_SETTINGS': json.dumps(self.settings),
+            'SYSVOLUME_STUB_WINDOW': os.path.join(self.workdir, 'window.json'),
+            'PULSE_SERVER': 'unix:' + os.path.join(self.workdir, 'pulse', 'native'),
+        })
+        if args.backend == 'amixer':
+            self.env['SYSVOLUME_LIBASOUND'] = os.path.join(self.workdir, 'no-libasound.so')
+        elif args.backend == 'native':
+            self.env['SYSVOLUME_LIBASOUND'] = build_libasound(self.workdir) or os.path.join(self.workdir, 'no-libasound.so')
+        write_cards(self.workdir, 1, 3)
+        # The addon modules of this process use the same stubs
+        os.environ.update(self.env)
+        sys.path[:0] = [STUB_DIR, ADDON_DIR]
+
+    def close(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def python(self, argv, settings={}, env={}):
+        ''' Runs python in a new process with the stubs and returns the time and output '''
+        env = dict(self.env, **env)
+        env['SYSVOLUME_STUB_SETTINGS'] = json.dumps(dict(self.settings, **settings))
+        start = time.time()
+        output = subprocess.check_output([sys.executable] + list(argv), env=env, cwd=ADDON_DIR)
+        return time.time() - start, output.decode('utf-8')
+
+    def measure(self, func, runs):
+        ''' Returns the time and the event counts of the first call and the median of the next calls '''
+        times = []
+        counts = []
+        for i in range(runs):
+            self.log.mark()
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+            counts.append(self.log.counts())
+        result = {'cold_ms': ms(times[0]), 'warm_ms': ms(median(times[1:]) if runs > 1 else times[0])}
+        result.update(counts[0])
+        if runs > 1:
+            for key in counts[0]:
+                result['warm_' + key] = median([c[key] for c in counts[1:]])
+        return result
+
+    def bench_imports(self):
+        code = ('import time; start = time.time(); '
+                'import resources.lib.sysvolume.mixer; '
+                'print(time.time() - start)')
+        times = [float(self.python(['-c', code])[1]) for i in range(self.args.runs)]
+        startup = [self.python(['-c', 'pass'])[0] for i in range(self.args.runs)]
+        # The imports of addon.py itself, its main block doesn't run on import
+        code = ('import sys, time; start = time.time(); import addon; '
+                'print(time.time() - start, len([m for m in sys.modules if m.startswith("resources.lib.sysvolume.")]))')
+        addon = [self.python(['-c', code])[1].split() for i in range(self.args.runs)]
+        return {'mixer_import_cold_ms': ms(times[0]), 'mixer_import_warm_ms': ms(median(times[1:] or times)),
+                'addon_import_cold_ms': ms(float(addon[0][0])),
+                'addon_import_warm_ms': ms(median([float(a[0]) for a in addon[1:] or addon])),
+                'addon_modules': int(addon[0][1]), 'interpreter_ms': ms(median(startup))}
+
+    def bench_startup(self):
+        ''' Whole addon.py process for a state command. The first run after a settings change is cold. '''
+        from resources.lib.sysvolume.service import MixerService
+        results = {'interpreter': self.measure(lambda: self.python(['-c', 'pass']), self.args.runs)}
+        run = lambda: self.python(['addon.py', 'state'], settings={'enable_service': 'false'})
+        results['direct'] = self.measure(run, self.args.runs)
+        service = MixerService()
+        service.start()
+        try:
+            run = lambda: self.python(['addon.py', 'state'], settings={'enable_service': 'true'})
+            results['service'] = self.measure(run, self.args.runs)
+        finally:
+            service.stop()
+        return results
+
+    def bench_mixer(self):
+        from resources.lib.sysvolume.mixer import Mixer, MacOsMixer
+        results = {}
+        variants = [('linux', lambda: Mixer.create('0', 'Master', 4, 4, 100), False),
+                    ('linux_session', lambda: Mixer.create('0', 'Master', 4, 4, 100), True),
+                    ('macos', lambda: MacOsMixer('output', '', 4, 4, 100), False)]
+        for variant, create, session in variants:
+            for name, op in MIXER_OPS:
+                mixers = []
+                def call():
+                    if not mixers:
+                        mixers.append(create())
+                        if session:
+                            mixers[0].openSession()
+                    op(mixers[0])
+                results['%s.%s' % (variant, name)] = self.measure(call, self.args.runs)
+                for mixer in mixers:
+                    mixer.closeSession()
+        return results
+
+    def bench_addon(self):
+        from resources.lib.sysvolume.service import MixerService
+        results = {}
+        for cmd in ADDON_COMMANDS:
+            run = lambda: self.python(['addon.py'] + cmd, settings={'enable_service': 'false'})
+            results['direct.' + '_'.join(cmd)] = self.measure(run, self.args.runs)
+        service = MixerService()
+        service.start()
+        try:
+            for cmd in ADDON_COMMANDS:
+                run = lambda: self.python(['addon.py'] + cmd, settings={'enable_service': 'true'})
+                results['service.' + '_'.join(cmd)] = self.measure(run, self.args.runs)
+        finally:
+            service.stop()
+        return results
+
+    def bench_burst(self):
+        ''' Key repeat: presses volume up with a fixed rate '''
+        from resources.lib.sysvolume.mixer import Mixer
+        from resources.lib.sysvolume.service import MixerService
+        from resources.lib.sysvolume import client
+        presses = self.args.presses
+        interval = 1.0 / self.args.rate
+        results = {}
+
+        def burst(press):
+            self.log.mark()
+            threads = []
+            start = time.time()
+            for i in range(presses):
+                thread = threading.Thread(target=press)
+                thread.start()
+                threads.append(thread)
+                time.sleep(max(0, start + (i + 1) * interval - time.time()))
+            last_press = time.time()
+            for thread in threads:
+                thread.join()
+            result = {'total_ms': ms(time.time() - start), 'lag_ms': ms(time.time() - last_press), 'presses': presses}
+            result.update(self.log.counts())
+            return result
+
+        mixer = Mixer.create('0', 'Master', 4, 4, 100)
+        mixer.setVolume(0)
+        lock = threading.Lock()
+        def direct():
+            with lock:
+                mixer.volumeUp(1)
+        results['direct'] = burst(direct)
+
+        service = MixerService()
+        service.start()
+        try:
+            results['service'] = burst(lambda: client.send_command('up', ['1']))
+        finally:
+            service.stop()
+        return results
+
+    def bench_osd(self):
+        ''' Key repeat with one script process per press which shows the progress dialog.
+            dialog_owners counts the processes which created a dialog, the service is one of them. '''
+        from resources.lib.sysvolume.service import MixerService
+        from resources.lib.sysvolume.config import settings as addon_settings
+        presses = min(self.args.presses, 10)
+        interval = 1.0 / self.args.rate
+        results = {}
+
+        def burst(settings):
+            env = dict(self.env)
+            env['SYSVOLUME_STUB_SETTINGS'] = json.dumps(dict(self.settings, show_progress='true',
+                                                             progress_time='1000', **settings))
+            self.log.mark()
+            processes = []
+            alive = 0
+            start = time.time()
+            while len(processes) < presses or any(p.poll() is None for p in processes):
+                if len(processes) < presses and time.time() >= start + len(processes) * interval:
+                    processes.append(subprocess.Popen([sys.executable, 'addon.py', 'up', '1'], env=env, cwd=ADDON_DIR))
+                alive = max(alive, len([p for p in processes if p.poll() is None]))
+                time.sleep(0.005)
+            result = {'total_ms': ms(time.time() - start), 'max_processes': alive, 'presses': presses}
+            result.update(self.log.counts())
+            return result
+
+        results['direct'] = burst({'enable_service': 'false'})
+        # The service in this process shows the dialog, whatever --progress says
+        options = addon_settings.show_progress, addon_settings.progress_time
+        addon_settings.show_progress, addon_settings.progress_time = True, 1000
+        service = MixerService()
+        service.start()
+        try:
+            results['service'] = burst({'enable_service': 'true'})
+        finally:
+            service.stop()
+            addon_settings.show_progress, addon_settings.progress_time = options
+        return results
+
+    def bench_devices(self):
+        from resources.lib.sysvolume.mixer import LinuxAlsaMixer
+        write_cards(self.workdir, self.args.cards, self.args.controls)
+        LinuxAlsaMixer.DEVICES = os.path.join(self.workdir, 'cards')
+        results = {}
+        results['uncached'] = self.measure(lambda: LinuxAlsaMixer.getDevices(useCache=False), self.args.runs)
+        results['cached'] = self.measure(lambda: LinuxAlsaMixer.getDevices(), self.args.runs)
+        results['cards'] = self.args.cards
+        results['controls'] = self.args.controls
+        write_cards(self.workdir, 1, 3)
+        return results
+
+    def bench_group(self):
+        ''' Four controls on two cards: one mixer per control against a mixer group '''
+        from resources.lib.sysvolume.mixer import Mixer
+        write_cards(self.workdir, 2, 2)
+        controls = [('0', 'Master'), ('0', 'PCM'), ('Card1', 'Master'), ('Card1', 'PCM')]
+        group = '; '.join('%s:%s' % control for control in controls[1:])
+        results = {}
+        for variant, session in [('', False), ('session_', True)]:
+            mixers = [Mixer.create(device, control, 4, 4, 100) for device, control in controls]
+            members = Mixer.create('0', 'Master', 4, 4, 100, group=group)
+            if session:
+                for mixer in mixers + [members]:
+                    mixer.openSession()
+            def separate():
+                for mixer in mixers:
+                    mixer.changeVolume(1)
+            results[variant + 'separate'] = self.measure(separate, self.args.runs)
+            results[variant + 'group'] = self.measure(lambda: members.changeVolume(1), self.args.runs)
+            for mixer in mixers + [members]:
+                mixer.closeSession()
+        write_cards(self.workdir, 1, 3)
+        return results
+
+    def bench_state(self):
+        ''' Reading the volume of another process: the state segment against the settings and a mixer read '''
+        from resources.lib.sysvolume import config, shmstate
+        from resources.lib.sysvolume.mixer import Mixer
+        mixer = Mixer.create('0', 'Master', 4, 4, 100)
+        mixer.setVolume(45)
+        return {'segment': self.measure(shmstate.read, self.args.runs),
+                'setting': self.measure(lambda: config.getSetting('last_volume'), self.args.runs),
+                'mixer': self.measure(lambda: Mixer.create('0', 'Master', 4, 4, 100).getVolume(), self.args.runs)}
+
+    def pulse_server(self):
+        ''' Starts the stand-in sound server and waits for its socket '''
+        path = self.env['PULSE_SERVER'][len('unix:'):]
+        server = subprocess.Popen(['pulse-server', path], env=self.env)
+        for i in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.05)
+        return server
+
+    def knob(self, sock, address, rate, events, get_state):
+        ''' Turns a knob: sends 'up 1' and 'down 1' datagrams with a fixed rate and waits until the replies stop.
+            The last received state must be the state of the mixer. '''
+        replies = []
+        def receive():
+            while True:
+                try:
+                    data = sock.recv(512)
+                except (socket.timeout, OSError):
+                    return
+                replies.append((time.time(), json.loads(data.decode('utf-8'))))
+        sock.settimeout(5.0)
+        sock.sendto(b'subscribe', address)
+        thread = threading.Thread(target=receive)
+        thread.start()
+        time.sleep(0.1)
+        del replies[:]
+        self.log.mark()
+        interval = 1.0 / rate
+        start = time.time()
+        for i in range(events):
+            # Five steps up, four down: the knob goes up slowly, with direction changes
+            sock.sendto(('#%s %s 1' % (i, 'up' if i % 9 < 5 else 'down')).encode('utf-8'), address)
+            time.sleep(max(0, start + (i + 1) * interval - time.time()))
+        last_send = time.time()
+        while time.time() - last_send < 5.0 and (not replies or time.time() - replies[-1][0] < 0.3):
+            time.sleep(0.01)
+        counts = self.log.counts()
+        received = list(replies)
+        sock.sendto(b'unsubscribe', address)
+        time.sleep(0.05)
+        sock.close()
+        thread.join()
+        done = received[-1][0] if received else time.time()
+        result = {'events': events, 'rate': rate, 'total_ms': ms(done - start), 'lag_ms': ms(max(0, done - last_send)),
+                  'replies': len([r for r in received if not r[1].get('push')]),
+                  'pushes': len([r for r in received if r[1].get('push')]),
+                  'final_ok': bool(received) and received[-1][1].get('volume') == get_state()['volume']}
+        result.update(counts)
+        return result
+
+    def bench_knob(self):
+        ''' Load test of the remote control endpoint: knob traffic over the Unix socket and UDP '''
+        from resources.lib.sysvolume import config, endpoint
+        from resources.lib.sysvolume.service import MixerService
+        settings = config.settings
+        saved = dict((key, getattr(settings, key)) for key in ['remote_control', 'remote_port', 'audio_backend',
+                                                                'device_name', 'mixer_name'])
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        server = self.pulse_server()
+        results = {}
+        try:
+            settings.remote_control = True
+            settings.remote_port = port
+            for backend, device, control in [('amixer', '0', 'Master'), ('pulse', 'output', 'Volume')]:
+                settings.audio_backend = 'pulse' if backend == 'pulse' else 'alsa'
+                settings.device_name, settings.mixer_name = device, control
+                service = MixerService()
+                service.start()
+                try:
+                    service.execute('set', ['20'])
+                    for rate in sorted(set([20, self.args.knob_rate])):
+                        events = int(rate * self.args.knob_seconds)
+                        for transport in ['unix', 'udp']:
+                            if transport == 'unix':
+                                sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                                sock.bind(os.path.join(self.workdir, 'knob.sock'))
+                                address = endpoint.socket_path()
+                            else:
+                                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                                sock.bind(('127.0.0.1', 0))
+                                address = ('127.0.0.1', port)
+                            key = '%s.%s_%s' % (backend, transport, int(rate))
+                            sys.stderr.write('  %s: %s events\n' % (key, events))
+                            results[key] = self.knob(sock, address, rate, events, lambda: service.getState(refresh=True))
+                            if transport == 'unix':
+                                os.remove(os.path.join(self.workdir, 'knob.sock'))
+                            service.execute('set', ['20'])
+                finally:
+                    service.stop()
+        finally:
+            for key, value in saved.items():
+                setattr(settings, key, value)
+            server.terminate()
+            server.wait()
+        return results
+
+    def bench_pulse(self):
+        ''' The sink of the stand-in sound server: mixer calls over one connection and addon.py without spawns '''
+        from resources.lib.sysvolume.mixer import PulseMixer
+        server = self.pulse_server()
+        try:
+            results = {}
+            for variant, session in [('pulse', False), ('pulse_session', True)]:
+                mixer = PulseMixer('output', '', 4, 4, 100)
+                if session:
+                    mixer.openSession()
+                for name, op in MIXER_OPS:
+                    results['%s.%s' % (variant, name)] = self.measure(lambda: op(mixer), self.args.runs)
+                mixer.closeSession()
+            results['connect'] = self.measure(lambda: PulseMixer('output', '', 4, 4, 100).closeSession(), self.args.runs)
+            for cmd in ADDON_COMMANDS:
+                run = lambda: self.python(['addon.py'] + cmd, settings={'enable_service': 'false', 'audio_backend': 'pulse',
+                                                                      'device_name': 'output', 'mixer_name': 'Volume'})
+                results['direct.' + '_'.join(cmd)] = self.measure(run, self.args.runs)
+        finally:
+            server.terminate()
+            server.wait()
+        return results
+
+    def bench_native(self):
+        ''' The native backend with the libasound stub, in new processes because the library is loaded once '''
+        library = build_libasound(self.workdir)
+        if library is None:
+            return {}
+        env = {'SYSVOLUME_LIBASOUND': library}
+        results = {}
+        for cmd in ADDON_COMMANDS:
+            run = lambda: self.python(['addon.py'] + cmd, settings={'enable_service': 'false'}, env=env)
+            results['direct.' + '_'.join(cmd)] = self.measure(run, self.args.runs)
+        # update() without pending events must not wait for one, a change of another process is read
+        code = '\n'.join([
+            'import json, time',
+            'from resources.lib.sysvolume import libasound',
+            'control = libasound.SimpleControl("hw:0", "Master")',
+            'control.update()',
+            'start = time.time()',
+            'idle = [control.update() for i in range(1000)]',
+            'idle_us = (time.time() - start) * 1000.0',
+            'path = "%s"' % self.env['SYSVOLUME_STUB_ALSA_STATE'],
+            'with open(path) as f: lines = f.read().split("\\n")',
+            'lines = [l.replace("50 50", "87 87") if l.startswith("0\\tMaster\\t") else l for l in lines]',
+            'with open(path, "w") as f: f.write("\\n".join(lines))',
+            'time.sleep(0.05)',
+            'print(json.dumps({"idle_update_us": round(idle_us, 3), "idle_events": any(idle),',
+            '                  "external_seen": control.update() and control.getPercent() == 100}))'])
+        write_cards(self.workdir, 1, 3)
+        self.log.mark()
+        output = json.loads(self.python(['-c', code], env=env)[1])
+        output.update(self.log.counts())
+        results['update'] = output
+        write_cards(self.workdir, 1, 3)
+        return results
+
+    def bench_scene(self):
+        ''' A scene of the default stub card, which has a control with playback and capture channels '''
+        from resources.lib.sysvolume import scenes
+        # Without a state file the amixer stub starts with its default card
+        os.remove(self.env['SYSVOLUME_STUB_AMIXER_STATE'])
+        saved = scenes.read_card('0')
+        results = {'save': self.measure(lambda: scenes.save_scene('bench', ['0']), self.args.runs)}
+        with open(os.devnull, 'w') as null:
+            for args in [['Master', '10%', 'off'], ['Line', 'playback', '20', 'on'], ['Line', 'capture', '5,9', 'cap']]:
+                subprocess.check_call(['amixer', '-c', '0', 'set'] + args, env=self.env, stdout=null)
+        changed = scenes.read_card('0')
+        self.log.mark()
+        start = time.time()
+        written = scenes.restore_scene('bench')
+        result = {'ms': ms(time.time() - start), 'written': written}
+        result.update(self.log.counts())
+        result.update({'changed': changed != saved, 'restored': scenes.read_card('0') == saved})
+        results['restore'] = result
+        scenes.delete_scene('bench')
+        write_cards(self.workdir, 1, 3)
+        return results
+
+    def bench_monitor(self):
+        ''' Changes from outside reach the skin properties: amixer set in another process while the service runs '''
+        code = '\n'.join([
+            'import os, json, subprocess, time',
+            'from kodi_six import xbmcgui',
+            'from resources.lib.sysvolume.service import MixerService',
+            'window = xbmcgui.Window(10000)',
+            'def wait(key, value):',
+            '    start = time.time()',
+            '    while time.time() - start < 2:',
+            '        if window.getProperty("SysVolume." + key) == value:',
+            '            return round((time.time() - start) * 1000.0, 3)',
+            '        time.sleep(0.01)',
+            'def amixer(value):',
+            '    with open(os.devnull, "w") as null:',
+            '        subprocess.check_call(["amixer", "-c", "0", "set", "Master", value], stdout=null)',
+            'service = MixerService()',
+            'service.start()',
+            'published = window.getProperty("SysVolume.Volume")',
+            '# The event watcher starts with the service',
+            'time.sleep(0.3)',
+            'amixer("30%")',
+            'volume_ms = wait("Volume", "30")',
+            'amixer("mute")',
+            'muted_ms = wait("Muted", "true")',
+            'service.stop()',
+            'print(json.dumps({"published": published, "volume_ms": volume_ms, "muted_ms": muted_ms,',
+            '                  "seen": volume_ms is not None and muted_ms is not None}))'])
+        variants = [('amixer', os.path.join(self.workdir, 'no-libasound.so'))]
+        library = build_libasound(self.workdir)
+        if library is not None:
+            variants.append(('native', library))
+        results = {}
+        for variant, path in variants:
+            write_cards(self.workdir, 1, 3)
+            self.log.mark()
+            output = json.loads(self.python(['-c', code], settings={'enable_service': 'true', 'publish_state': 'true'},
+                                            env={'SYSVOLUME_LIBASOUND': path})[1])
+            output.update(self.log.counts())
+            results[variant] = output
+        write_cards(self.workdir, 1, 3)
+        return results
+
+    def run(self):
+        results = {'meta': {'python': sys.version.split()[0], 'platform': sys.platform, 'runs': self.args.runs,
+                            'delay_ms': self.args.delay, 'backend': self.args.backend,
+                            'time': time.strftime('%Y-%m-%d %H:%M:%S')}}
+        try:
+            import xml.etree.ElementTree as ET
+            results['meta']['version'] = ET.parse(os.path.join(ADDON_DIR, 'addon.xml')).getroot().get('version')
+        except Exception:
+            pass
+        for name in self.args.only or ['imports', 'startup', 'mixer', 'addon', 'burst', 'osd', 'devices', 'group', 'pulse', 'state',
+                                       'knob', 'native', 'monitor', 'scene']:
+            sys.stderr.write('Running %s benchmarks\n' % name)
+            results[name] = getattr(self, 'bench_' + name)()
+        return results
+
+
+def flatten(data, prefix=''):
+    values = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, prefix + key + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[prefix + key] = value
+    return values
+
+def compare(old, new):
+    old_values = flatten(dict((k, v) for k, v in old.items() if k != 'meta'))
+    new_values = flatten(dict((k, v) for k, v in new.items() if k != 'meta'))
+    print('%-50s %12s %12s %8s' % ('benchmark', 'old', 'new', 'ratio'))
+    for key in sorted(set(old_values) & set(new_values)):
+        a, b = old_values[key], new_values[key]
+        ratio = '%.2f' % (b / float(a)) if a else '-'
+        print('%-50s %12s %12s %8s' % (key, a, b, ratio))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for script.module.sysvolume')
+    parser.add_argument('--runs', type=int, default=5, help='runs per benchmark, the first one is the cold run')
+    parser.add_argument('--delay', type=float, default=0, help='delay of the stub programs in ms')
+    parser.add_argument('--backend', choices=['amixer', 'native', 'auto'], default='amixer',
+                        help='amixer disables the native libasound backend, native uses the libasound stub')
+    parser.add_argument('--progress', action='store_true', help='show the progress dialog in addon.py')
+    parser.add_argument('--presses', type=int, default=30, help='key presses of the key repeat benchmark')
+    parser.add_argument('--rate', type=float, default=30, help='key presses per second')
+    parser.add_argument('--knob-rate', type=float, default=200, help='events per second of the remote control load test')
+    parser.add_argument('--knob-seconds', type=float, default=2, help='duration of each remote control load test')
+    parser.add_argument('--cards', type=int, default=4, help='sound cards for the device benchmark')
+    parser.add_argument('--controls', type=int, default=20, help='controls per card for the device benchmark')
+    parser.add_argument('--only', action='append',
+                        choices=['imports', 'startup', 'mixer', 'addon', 'burst', 'osd', 'devices', 'group', 'pulse',
+                                 'state', 'knob', 'native', 'monitor', 'scene'],
+                        help='run only these benchmarks')
+    parser.add_argument('--output', help='write the results as JSON into this file')
+    parser.add_argument('--compare', help='compare the results with an older JSON result file')
+    args = parser.parse_args()
+
+    bench = Bench(args)
+    try:
+        results = bench.run()
+    finally:
+        bench.close()
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    elif not args.output:
+        print(text)
+
+if __name__ == '__main__':
+    main()
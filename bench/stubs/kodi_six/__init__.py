@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+''' Stand-in for the kodi_six module and the Kodi python API, used by the benchmarks '''
+
+from __future__ import absolute_import, unicode_literals
+
+from . import xbmc, xbmcaddon, xbmcgui, xbmcvfs
+
+
+def py2_encode(s, encoding='utf-8'):
+    return s
+
+def py2_decode(s, encoding='utf-8'):
+    return s
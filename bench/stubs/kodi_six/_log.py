@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+''' Event log shared by the stubs and the benchmark harness '''
+
+import os
+
+LOG_ENV = 'SYSVOLUME_STUB_LOG'
+
+
+def record(kind, text=''):
+    path = os.environ.get(LOG_ENV)
+    if path:
+        with open(path, 'a') as f:
+            f.write('%s %s\n' % (kind, text))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import threading
+
+LOGDEBUG, LOGINFO, LOGNOTICE, LOGWARNING, LOGERROR = 0, 1, 2, 3, 4
+
+_abort = threading.Event()
+
+
+def log(msg, level=LOGDEBUG):
+    if os.environ.get('SYSVOLUME_STUB_VERBOSE'):
+        print('[xbmc.log] %s' % msg)
+
+def sleep(ms):
+    time.sleep(ms / 1000.0)
+
+def translatePath(path):
+    return path
+
+def executebuiltin(function, wait=False):
+    pass
+
+def requestAbort():
+    _abort.set()
+
+
+class Monitor(object):
+
+    def abortRequested(self):
+        return _abort.is_set()
+
+    def waitForAbort(self, timeout=0):
+        return _abort.wait(timeout)
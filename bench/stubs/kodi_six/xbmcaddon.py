@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import tempfile
+import xml.etree.ElementTree as ET
+from ._log import record
+
+ADDON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir))
+SETTINGS_ENV = 'SYSVOLUME_STUB_SETTINGS'
+PROFILE_ENV = 'SYSVOLUME_STUB_PROFILE'
+
+
+def _profile():
+    return os.environ.get(PROFILE_ENV, os.path.join(tempfile.gettempdir(), 'sysvolume-bench'))
+
+def _save(settings):
+    ''' Writes the settings into settings.xml of the profile like Kodi, if they have changed '''
+    path = os.path.join(_profile(), 'settings.xml')
+    text = '<settings version="2">\n%s</settings>\n' % ''.join(
+        '    <setting id="%s">%s</setting>\n' % (key, settings[key]) for key in sorted(settings))
+    try:
+        with open(path) as f:
+            if f.read() == text:
+                return
+    except IOError:
+        pass
+    if not os.path.isdir(_profile()):
+        os.makedirs(_profile())
+    with open(path, 'w') as f:
+        f.write(text)
+
+def _defaults():
+    settings = {}
+    root = ET.parse(os.path.join(ADDON_PATH, 'resources', 'settings.xml')).getroot()
+    for setting in root.iter('setting'):
+        if setting.get('id'):
+            settings[setting.get('id')] = setting.get('default', '')
+    return settings
+
+
+class Addon(object):
+
+    settings = None
+
+    def __init__(self, id=None):
+        if Addon.settings is None:
+            Addon.settings = _defaults()
+            Addon.settings.update(json.loads(os.environ.get(SETTINGS_ENV, '{}')))
+            _save(Addon.settings)
+
+    def getAddonInfo(self, key):
+        return {'id': 'script.module.sysvolume',
+                'name': 'System Volume Changer',
+                'path': ADDON_PATH,
+                'version': 'bench',
+                'profile': _profile()}[key]
+
+    def getSetting(self, key):
+        record('getSetting', key)
+        return '%s' % Addon.settings.get(key, '')
+
+    def setSetting(self, key, value):
+        record('setSetting', key)
+        Addon.settings[key] = value
+        _save(Addon.settings)
+
+    def getLocalizedString(self, id):
+        return '#%s' % id
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+from ._log import record
+
+
+class DialogProgressBG(object):
+
+    def create(self, heading='', message=''):
+        record('dialog', 'create %s' % os.getpid())
+
+    def update(self, percent=0, heading=None, message=None):
+        record('dialog', 'update %s' % percent)
+
+    def close(self):
+        record('dialog', 'close %s' % os.getpid())
+
+    def isFinished(self):
+        return False
+
+
+class Dialog(object):
+
+    def ok(self, heading, message):
+        return True
+
+    def select(self, heading, items):
+        return 0 if items else -1
+
+    def notification(self, heading, message, icon='', time=5000, sound=True):
+        record('dialog', 'notification')
+
+
+class Window(object):
+    ''' The properties are shared between processes with the JSON file SYSVOLUME_STUB_WINDOW,
+        like the properties of the Kodi home window are shared between script instances. '''
+
+    properties = {}
+
+    def __init__(self, windowId=10000):
+        self.windowId = windowId
+
+    def _load(self):
+        path = os.environ.get('SYSVOLUME_STUB_WINDOW')
+        if path:
+            try:
+                with open(path) as f:
+                    Window.properties = json.load(f)
+            except (IOError, ValueError):
+                Window.properties = {}
+        return path
+
+    def _save(self, path):
+        if path:
+            tmp = '%s.%s.tmp' % (path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(Window.properties, f)
+            os.rename(tmp, path)
+
+    def setProperty(self, key, value):
+        path = self._load()
+        Window.properties[key.lower()] = value
+        self._save(path)
+
+    def getProperty(self, key):
+        self._load()
+        return Window.properties.get(key.lower(), '')
+
+    def clearProperty(self, key):
+        path = self._load()
+        Window.properties.pop(key.lower(), None)
+        self._save(path)
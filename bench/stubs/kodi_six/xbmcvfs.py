@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+def translatePath(path):
+    return path
@@ -0,0 +1,361 @@
+/*
+ * Stand-in for the simple mixer API of libasound, used by the benchmarks.
+ *
+ * Build:  cc -shared -fPIC -o libasound-stub.so libasound.c
+ * Use:    SYSVOLUME_LIBASOUND=/path/to/libasound-stub.so
+ *
+ * The playback controls are kept in the text file SYSVOLUME_STUB_ALSA_STATE,
+ * one control per line:
+ *
+ *     <card>\t<control>\t<min> <max> <dB min> <dB max> <channels> <switch> <values...> <switches...>
+ *
+ * with the dB range in 1/100 dB. Like the library, the values are read by
+ * snd_mixer_load and kept in memory until snd_mixer_handle_events reads the
+ * change events. The poll descriptor is an inotify watch of the state file, so
+ * it is readable when any process wrote the file. handle_events blocks if no
+ * event is pending, like a mixer opened in blocking mode. Each write and each
+ * handle_events is written to SYSVOLUME_STUB_LOG as "alsa <call>".
+ */
+
+#include <errno.h>
+#include <poll.h>
+#include <stdarg.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/inotify.h>
+
+#define MAX_CONTROLS 256
+#define MAX_CHANNELS 8
+#define NAME_SIZE 64
+
+typedef struct mixer mixer_t;
+
+typedef struct {
+    mixer_t *mixer;
+    char card[NAME_SIZE];
+    char name[NAME_SIZE];
+    long min, max, dbmin, dbmax;
+    int channels;
+    int has_switch;
+    long values[MAX_CHANNELS];
+    int switches[MAX_CHANNELS];
+} control_t;
+
+struct mixer {
+    char card[NAME_SIZE];
+    control_t controls[MAX_CONTROLS];
+    int count;
+    int fd;
+};
+
+typedef struct {
+    char name[NAME_SIZE];
+    unsigned int index;
+} selem_id_t;
+
+static const char *state_path(void)
+{
+    const char *path = getenv("SYSVOLUME_STUB_ALSA_STATE");
+    return path ? path : "/tmp/sysvolume-stub-alsa.state";
+}
+
+static void record(const char *format, ...)
+{
+    const char *path = getenv("SYSVOLUME_STUB_LOG");
+    FILE *f;
+    va_list args;
+    if (!path || !(f = fopen(path, "a")))
+        return;
+    fputs("alsa ", f);
+    va_start(args, format);
+    vfprintf(f, format, args);
+    va_end(args);
+    fputc('\n', f);
+    fclose(f);
+}
+
+static int parse_line(char *line, control_t *c)
+{
+    char *card = strtok(line, "\t");
+    char *name = strtok(NULL, "\t");
+    char *rest = strtok(NULL, "\n");
+    char *end;
+    int i;
+    if (!card || !name || !rest)
+        return -1;
+    memset(c, 0, sizeof(*c));
+    snprintf(c->card, sizeof(c->card), "%s", card);
+    snprintf(c->name, sizeof(c->name), "%s", name);
+    c->min = strtol(rest, &end, 10);
+    c->max = strtol(end, &end, 10);
+    c->dbmin = strtol(end, &end, 10);
+    c->dbmax = strtol(end, &end, 10);
+    c->channels = (int)strtol(end, &end, 10);
+    c->has_switch = (int)strtol(end, &end, 10);
+    if (c->channels < 1 || c->channels > MAX_CHANNELS)
+        return -1;
+    for (i = 0; i < c->channels; i++)
+        c->values[i] = strtol(end, &end, 10);
+    for (i = 0; i < c->channels; i++)
+        c->switches[i] = c->has_switch ? (int)strtol(end, &end, 10) : 1;
+    return 0;
+}
+
+/* Reads the state file, known controls keep their place */
+static int read_state(mixer_t *m)
+{
+    char line[1024];
+    control_t c;
+    FILE *f = fopen(state_path(), "r");
+    int i;
+    if (!f)
+        return -ENOENT;
+    while (fgets(line, sizeof(line), f)) {
+        if (parse_line(line, &c) < 0)
+            continue;
+        for (i = 0; i < m->count; i++)
+            if (!strcmp(m->controls[i].card, c.card) && !strcmp(m->controls[i].name, c.name))
+                break;
+        if (i == m->count) {
+            if (m->count == MAX_CONTROLS)
+                continue;
+            m->count++;
+        }
+        c.mixer = m;
+        m->controls[i] = c;
+    }
+    fclose(f);
+    return 0;
+}
+
+static int write_state(mixer_t *m)
+{
+    FILE *f = fopen(state_path(), "w");
+    int i, ch;
+    if (!f)
+        return -EIO;
+    for (i = 0; i < m->count; i++) {
+        control_t *c = &m->controls[i];
+        fprintf(f, "%s\t%s\t%ld %ld %ld %ld %d %d", c->card, c->name, c->min, c->max,
+                c->dbmin, c->dbmax, c->channels, c->has_switch);
+        for (ch = 0; ch < c->channels; ch++)
+            fprintf(f, " %ld", c->values[ch]);
+        if (c->has_switch)
+            for (ch = 0; ch < c->channels; ch++)
+                fprintf(f, " %d", c->switches[ch]);
+        fputc('\n', f);
+    }
+    fclose(f);
+    return 0;
+}
+
+static long clamp(control_t *c, long value)
+{
+    return value < c->min ? c->min : value > c->max ? c->max : value;
+}
+
+/* Errors */
+
+const char *snd_strerror(int err)
+{
+    return strerror(err < 0 ? -err : err);
+}
+
+/* Mixer handle */
+
+int snd_mixer_open(mixer_t **mixer, int mode)
+{
+    mixer_t *m = calloc(1, sizeof(mixer_t));
+    (void)mode;
+    if (!m)
+        return -ENOMEM;
+    m->fd = -1;
+    *mixer = m;
+    return 0;
+}
+
+int snd_mixer_close(mixer_t *m)
+{
+    if (m->fd >= 0)
+        close(m->fd);
+    free(m);
+    return 0;
+}
+
+int snd_mixer_attach(mixer_t *m, const char *name)
+{
+    if (!strncmp(name, "hw:", 3))
+        name += 3;
+    snprintf(m->card, sizeof(m->card), "%s", name);
+    return 0;
+}
+
+int snd_mixer_selem_register(mixer_t *m, void *options, void **classp)
+{
+    (void)m; (void)options; (void)classp;
+    return 0;
+}
+
+int snd_mixer_load(mixer_t *m)
+{
+    int err, i;
+    if ((err = read_state(m)) < 0)
+        return err;
+    for (i = 0; i < m->count; i++)
+        if (!strcmp(m->controls[i].card, m->card))
+            break;
+    if (i == m->count)
+        return -ENODEV;
+    m->fd = inotify_init();
+    if (m->fd < 0 || inotify_add_watch(m->fd, state_path(), IN_CLOSE_WRITE) < 0)
+        return -errno;
+    return 0;
+}
+
+int snd_mixer_poll_descriptors_count(mixer_t *m)
+{
+    return m->fd >= 0 ? 1 : 0;
+}
+
+int snd_mixer_poll_descriptors(mixer_t *m, struct pollfd *pfds, unsigned int space)
+{
+    if (m->fd < 0 || space < 1)
+        return 0;
+    pfds[0].fd = m->fd;
+    pfds[0].events = POLLIN;
+    pfds[0].revents = 0;
+    return 1;
+}
+
+int snd_mixer_handle_events(mixer_t *m)
+{
+    char buf[4096];
+    ssize_t size;
+    record("handle-events");
+    /* Blocks until a process writes the state file */
+    size = read(m->fd, buf, sizeof(buf));
+    if (size < 0)
+        return -errno;
+    read_state(m);
+    return (int)(size / sizeof(struct inotify_event));
+}
+
+/* Simple element id */
+
+int snd_mixer_selem_id_malloc(selem_id_t **ptr)
+{
+    *ptr = calloc(1, sizeof(selem_id_t));
+    return *ptr ? 0 : -ENOMEM;
+}
+
+void snd_mixer_selem_id_free(selem_id_t *id)
+{
+    free(id);
+}
+
+void snd_mixer_selem_id_set_index(selem_id_t *id, unsigned int index)
+{
+    id->index = index;
+}
+
+void snd_mixer_selem_id_set_name(selem_id_t *id, const char *name)
+{
+    snprintf(id->name, sizeof(id->name), "%s", name);
+}
+
+control_t *snd_mixer_find_selem(mixer_t *m, const selem_id_t *id)
+{
+    int i;
+    if (id->index != 0)
+        return NULL;
+    for (i = 0; i < m->count; i++)
+        if (!strcmp(m->controls[i].card, m->card) && !strcmp(m->controls[i].name, id->name))
+            return &m->controls[i];
+    return NULL;
+}
+
+/* Playback volume and switch */
+
+int snd_mixer_selem_has_playback_volume(control_t *c)
+{
+    (void)c;
+    return 1;
+}
+
+int snd_mixer_selem_has_playback_switch(control_t *c)
+{
+    return c->has_switch;
+}
+
+int snd_mixer_selem_has_playback_channel(control_t *c, int channel)
+{
+    return channel >= 0 && channel < c->channels;
+}
+
+int snd_mixer_selem_get_playback_volume_range(control_t *c, long *min, long *max)
+{
+    *min = c->min;
+    *max = c->max;
+    return 0;
+}
+
+int snd_mixer_selem_get_playback_volume(control_t *c, int channel, long *value)
+{
+    *value = c->values[channel >= 0 && channel < c->channels ? channel : 0];
+    return 0;
+}
+
+int snd_mixer_selem_set_playback_volume(control_t *c, int channel, long value)
+{
+    if (channel < 0 || channel >= c->channels)
+        return -EINVAL;
+    c->values[channel] = clamp(c, value);
+    record("set-volume %s %d %ld", c->name, channel, c->values[channel]);
+    return write_state(c->mixer);
+}
+
+int snd_mixer_selem_set_playback_volume_all(control_t *c, long value)
+{
+    int ch;
+    for (ch = 0; ch < c->channels; ch++)
+        c->values[ch] = clamp(c, value);
+    record("set-volume-all %s %ld", c->name, c->values[0]);
+    return write_state(c->mixer);
+}
+
+int snd_mixer_selem_get_playback_switch(control_t *c, int channel, int *value)
+{
+    *value = c->switches[channel >= 0 && channel < c->channels ? channel : 0];
+    return 0;
+}
+
+int snd_mixer_selem_set_playback_switch_all(control_t *c, int value)
+{
+    int ch;
+    if (!c->has_switch)
+        return -EINVAL;
+    for (ch = 0; ch < c->channels; ch++)
+        c->switches[ch] = value ? 1 : 0;
+    record("set-switch-all %s %d", c->name, value ? 1 : 0);
+    return write_state(c->mixer);
+}
+
+int snd_mixer_selem_get_playback_dB_range(control_t *c, long *min, long *max)
+{
+    if (c->dbmin >= c->dbmax)
+        return -EINVAL;
+    *min = c->dbmin;
+    *max = c->dbmax;
+    return 0;
+}
+
+int snd_mixer_selem_ask_playback_vol_dB(control_t *c, long value, long *db)
+{
+    if (c->max <= c->min)
+        return -EINVAL;
+    value = clamp(c, value);
+    *db = c->dbmin + (c->dbmax - c->dbmin) * (value - c->min) / (c->max - c->min);
+    return 0;
+}
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+from kodi_six.xbmcaddon import *
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+''' asyncio mixer for addons which run an asyncio loop (Python 3 only, Kodi 19 and later).
+
+    from sysvolume.aio import AsyncMixer
+    mixer = AsyncMixer.create('0', 'Master', 4, 4, 100)
+    volume = await mixer.volume_up()
+
+AsyncMixer wraps the mixer of Mixer.create, so it uses the same backend, volume curve
+and mixer group as the scripts. The mixer calls run one after the other in a worker
+thread of the mixer, so the loop is never blocked. A fade stops when another command
+of the mixer is called, when cancel_fade is called or when its task is cancelled.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import sys
+import threading
+
+if sys.version_info[0] < 3:
+    # Kodi 18 addons run Python 2, which has no asyncio
+    raise ImportError('sysvolume.aio needs Python 3 (Kodi 19 or later), use sysvolume.api instead')
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from . import debug
+from .mixer import Mixer
+
+
+class AsyncMixer(object):
+    ''' asyncio counterpart of Mixer. Each function returns an awaitable future of its result. '''
+
+    @staticmethod
+    def create(device_name, mixer_name, step_up, step_down, max_volume, group=''):
+        return AsyncMixer(Mixer.create(device_name, mixer_name, step_up, step_down, max_volume, group=group))
+
+    @staticmethod
+    def get_devices(use_cache=True):
+        return asyncio.get_event_loop().run_in_executor(None, lambda: Mixer.getDevices(useCache=use_cache))
+
+    def __init__(self, mixer):
+        self.mixer = mixer
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        self.fade_cancel = None
+
+    @property
+    def volume(self):
+        return self.mixer.volume
+
+    @property
+    def muted(self):
+        return self.mixer.muted
+
+    def _call(self, func, *args):
+        return asyncio.get_event_loop().run_in_executor(self.worker, func, *args)
+
+    def cancel_fade(self):
+        if self.fade_cancel is not None:
+            self.fade_cancel.set()
+            self.fade_cancel = None
+
+    def close(self):
+        ''' Stops a running fade and closes the session of the mixer '''
+        self.cancel_fade()
+        future = self._call(self.mixer.closeSession)
+        self.worker.shutdown(wait=False)
+        return future
+
+    # Public functions, the commands which change the mixer stop a running fade
+
+    def open_session(self):
+        return self._call(self.mixer.openSession)
+
+    def get_volume(self):
+        return self._call(self.mixer.getVolume)
+
+    def set_volume(self, volume, ignore_limits=False):
+        self.cancel_fade()
+        return self._call(self.mixer.setVolume, volume, ignore_limits)
+
+    def change_volume(self, step, ignore_limits=False):
+        self.cancel_fade()
+        return self._call(self.mixer.changeVolume, step, ignore_limits)
+
+    def volume_up(self, step=0):
+        self.cancel_fade()
+        return self._call(self.mixer.volumeUp, step)
+
+    def volume_down(self, step=0):
+        self.cancel_fade()
+        return self._call(self.mixer.volumeDown, step)
+
+    def is_muted(self):
+        return self._call(self.mixer.isMuted)
+
+    def set_mute(self, mute):
+        self.cancel_fade()
+        return self._call(self.mixer.setMute, mute)
+
+    def mute_toggle(self):
+        self.cancel_fade()
+        return self._call(self.mixer.muteToggle)
+
+    def fade_to(self, target, duration_ms, curve='linear'):
+        ''' Changes the volume to the target in steps over the given time '''
+        self.cancel_fade()
+        cancel = self.fade_cancel = threading.Event()
+        future = self._call(lambda: self.mixer.fadeTo(target, duration_ms, curve=curve, cancel=cancel))
+
+        def done(future):
+            # The worker thread can't be cancelled, the fade stops at its next step
+            if future.cancelled():
+                debug.logInfo('Fade task cancelled')
+                cancel.set()
+            if self.fade_cancel is cancel:
+                self.fade_cancel = None
+        future.add_done_callback(done)
+        return future
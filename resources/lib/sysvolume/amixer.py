@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import re
+import time
+import select
+import threading
+import subprocess
+from kodi_six import py2_encode
+from . import debug, stats
+
+#------------------------------------------------------------------------------
+# Parser for the control status which amixer prints for get, set and scontents
+#------------------------------------------------------------------------------
+
+HEADER = r"^Simple mixer control '(?P<name>.*)',(?P<index>\d+)$"
+TOKENS = (r'\[(?P<percent>\d+)%\]|\[(?P<db>-?(?:[\d\.]+|inf))dB\]|\[(?P<switch>on|off)\]'
+          r'|(?P<direction>Playback|Capture)|(?P<raw>-?\d+)')
+# Lines of a control which are no channel status
+INFO_KEYS = ('Capabilities', 'Limits', 'Playback channels', 'Capture channels', 'Capture exclusive group', 'Items')
+
+
+_patterns = {}
+
+def pattern(regex):
+    ''' Compiles a regular expression at its first use, the native backend never parses amixer output '''
+    compiled = _patterns.get(regex)
+    if compiled is None:
+        compiled = _patterns[regex] = re.compile(regex)
+    return compiled
+
+
+class ChannelStatus(object):
+    ''' Level of one channel of a control '''
+
+    __slots__ = ('name', 'raw', 'percent', 'db', 'switch')
+
+    def __init__(self, name):
+        self.name = name
+        self.raw = None
+        self.percent = None
+        self.db = None
+        self.switch = None
+
+    def asDict(self):
+        return {'name': self.name, 'raw': self.raw, 'percent': self.percent, 'db': self.db, 'switch': self.switch}
+
+
+class ControlStatus(object):
+    ''' State of a simple control with all its playback and capture channels '''
+
+    def __init__(self, name, index=0):
+        self.name = name
+        self.index = index
+        self.capabilities = []
+        self.min = None
+        self.max = None
+        self.capture_min = None
+        self.capture_max = None
+        self.playback = []
+        self.capture = []
+
+    def channels(self):
+        ''' The playback channels, or the capture channels of a capture control '''
+        return self.playback or self.capture
+
+    @property
+    def volume(self):
+        ''' Percent of the loudest audible channel, so an unbalanced control isn't reported lower than it sounds '''
+        channels = [ch for ch in self.channels() if ch.percent is not None]
+        audible = [ch for ch in channels if ch.switch is not False]
+        values = [ch.percent for ch in audible or channels]
+        return max(values) if values else None
+
+    @property
+    def raw(self):
+        ''' Raw value of the loudest audible channel '''
+        channels = [ch for ch in self.channels() if ch.raw is not None]
+        audible = [ch for ch in channels if ch.switch is not False]
+        values = [ch.raw for ch in audible or channels]
+        return max(values) if values else None
+
+    @property
+    def muted(self):
+        ''' Muted if all channels are switched off, None if the control has no switch '''
+        switches = [ch.switch for ch in self.channels() if ch.switch is not None]
+        return not any(switches) if switches else None
+
+    def isBalanced(self):
+        return len(set(ch.raw for ch in self.channels())) <= 1
+
+    def balancedValue(self, volume):
+        ''' Returns the amixer value which gives the loudest channel the volume and scales the others '''
+        if self.isBalanced() or not self.volume:
+            return '%s%%' % volume
+        return ','.join('%s%%' % int(round((ch.percent or 0) * volume / float(self.volume))) for ch in self.channels())
+
+    def isPartlyMuted(self):
+        return len(set(ch.switch for ch in self.channels() if ch.switch is not None)) > 1
+
+    def asDict(self):
+        return {'name': self.name, 'index': self.index, 'capabilities': self.capabilities,
+                'min': self.min, 'max': self.max, 'volume': self.volume, 'muted': self.muted,
+                'playback': [ch.asDict() for ch in self.playback], 'capture': [ch.asDict() for ch in self.capture]}
+
+    def _parseLimits(self, value):
+        direction, limits = 'Playback', []
+        for m in pattern(TOKENS).finditer(value):
+            if m.group('direction'):
+                direction, limits = m.group('direction'), []
+            elif m.group('raw'):
+                limits.append(int(m.group('raw')))
+                if len(limits) == 2:
+                    if direction == 'Playback':
+                        self.min, self.max = limits
+                    else:
+                        self.capture_min, self.capture_max = limits
+
+    def _parseChannel(self, name, value):
+        channel = None
+        for m in pattern(TOKENS).finditer(value):
+            if m.group('direction') or channel is None:
+                # A control with a common volume has no direction
+                channel = ChannelStatus(name)
+                (self.capture if m.group('direction') == 'Capture' else self.playback).append(channel)
+                if m.group('direction'):
+                    continue
+            if m.group('raw'):
+                channel.raw = int(m.group('raw'))
+            elif m.group('percent'):
+                channel.percent = int(m.group('percent'))
+            elif m.group('db'):
+                channel.db = float(m.group('db'))
+            elif m.group('switch'):
+                channel.switch = m.group('switch') == 'on'
+
+
+def parse_status(output):
+    ''' Parses the output of amixer get, set or scontents in one pass.
+        Returns a list of ControlStatus. '''
+    controls = []
+    control = None
+    header = pattern(HEADER)
+    for line in output.split('\n'):
+        m = header.match(line)
+        if m:
+            control = ControlStatus(m.group('name'), int(m.group('index')))
+            controls.append(control)
+            continue
+        if control is None:
+            continue
+        key, sep, value = line.strip().partition(':')
+        if not sep or not value:
+            continue
+        if key == 'Capabilities':
+            control.capabilities = value.split()
+        elif key == 'Limits':
+            control._parseLimits(value)
+        elif key not in INFO_KEYS and not key.startswith('Item'):
+            control._parseChannel(key, value)
+    return controls
+
+#------------------------------------------------------------------------------
+# amixer processes
+#------------------------------------------------------------------------------
+
+def spawn(args):
+    ''' Starts amixer with its output connected to a pseudo terminal, so it is line buffered.
+        Returns the process and the file descriptor to read its output. '''
+    import pty, termios
+    master, slave = pty.openpty()
+    try:
+        # No CR/LF translation on the terminal output
+        attrs = termios.tcgetattr(slave)
+        attrs[1] = attrs[1] & ~termios.OPOST
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+        process = subprocess.Popen([py2_encode(arg) for arg in args],
+                                   stdin=subprocess.PIPE, stdout=slave, stderr=slave, close_fds=True)
+    except:
+        os.close(master)
+        raise
+    finally:
+        os.close(slave)
+    return process, master
+
+
+class AmixerSession(object):
+    ''' A long running "amixer -s" process which reads its commands from stdin.
+
+    amixer doesn't mark the end of a command output, so a reply is complete
+    when a status line for each listed channel was read. After MAX_FAILURES
+    failed commands in a row the session is not used for RETRY_TIME seconds,
+    like the circuit breaker of the executor, then it is tried again.
+    '''
+
+    MAX_FAILURES = 3
+    RETRY_TIME = 10.0
+
+    def __init__(self, device_name, timeout=1.0):
+        self.device_name = device_name
+        self.timeout = timeout
+        self.process = None
+        self.fd = None
+        self.buffer = ''
+        self.failures = 0
+        self.retry_time = 0
+        self.lock = threading.Lock()
+
+    def isAlive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def isUsable(self):
+        return self.failures < self.MAX_FAILURES or time.time() >= self.retry_time
+
+    def start(self):
+        self.close()
+        self.process, self.fd = spawn(['amixer', '-c', self.device_name, '-s'])
+        self.buffer = ''
+        debug.logInfo('Started amixer session for device %s', self.device_name)
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except:
+                pass
+            try:
+                if self.process.poll() is None:
+                    self.process.kill()
+                self.process.wait()
+            except:
+                pass
+            self.process = None
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except:
+                pass
+            self.fd = None
+
+    def execute(self, command):
+        ''' Sends one command line to amixer and returns its output '''
+        with self.lock:
+            start = time.time()
+            try:
+                if not self.isAlive():
+                    self.start()
+                    stats.count('subprocess')
+                self.process.stdin.write((command + '\n').encode('utf-8'))
+                self.process.stdin.flush()
+                result = self._readReply()
+                self.failures = 0
+                stats.record('session.command', time.time() - start, command)
+                return result
+            except Exception:
+                self.failures += 1
+                if self.failures >= self.MAX_FAILURES:
+                    self.retry_time = time.time() + self.RETRY_TIME
+                    debug.logError('amixer session for device %s failed %s times, retrying in %s seconds',
+                                   self.device_name, self.failures, self.RETRY_TIME)
+                self.close()
+                raise
+
+    def _readLine(self, deadline):
+        while '\n' not in self.buffer:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise IOError('Timeout in amixer session')
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError:
+                data = b''
+            if not data:
+                raise IOError('amixer session terminated')
+            self.buffer += data.decode('utf-8', 'replace')
+        line, self.buffer = self.buffer.split('\n', 1)
+        return line.rstrip('\r')
+
+    def _readReply(self):
+        deadline = time.time() + self.timeout
+        lines = []
+        channels = None
+        found = set()
+        while channels is None or not channels.issubset(found):
+            line = self._readLine(deadline)
+            if line.startswith('amixer:'):
+                raise IOError(line)
+            lines.append(line)
+            name, sep, value = line.strip().partition(':')
+            if not sep:
+                continue
+            if name in ('Playback channels', 'Capture channels'):
+                channels = (channels or set()) | set(ch.strip() for ch in value.split(' - '))
+            elif channels is not None and name in channels and value.strip():
+                found.add(name)
+        return '\n'.join(lines)
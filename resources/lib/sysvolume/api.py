@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+''' Volume functions for other addons.
+
+Import script.module.sysvolume in the addon.xml of your addon and call:
+
+    from sysvolume import api
+    state = api.volume_up()     # {'volume': 44, 'muted': False}
+
+The commands are sent to the mixer service if it is running. Otherwise they are
+executed with a mixer which is created once per process and reused.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+from . import config, commands, client, lock, shmstate
+from .config import settings
+from .mixer import Mixer
+
+_mixer = None
+_lock = threading.RLock()
+
+
+def get_mixer():
+    ''' Returns the mixer of this process, created with the addon settings at the first call '''
+    global _mixer
+    with _lock:
+        if _mixer is None:
+            _mixer = Mixer.create(settings.device_name, settings.mixer_name,
+                                  settings.step_up, settings.step_down,
+                                  settings.max_volume, group=settings.mixer_group)
+        return _mixer
+
+def reload():
+    ''' Reads the addon settings again, the mixer is created again at the next call '''
+    global _mixer
+    with _lock:
+        config.reloadConfig()
+        if _mixer is not None:
+            _mixer.closeSession()
+            _mixer = None
+
+def _run(cmd, *args, **kwargs):
+    args = ['%s' % arg for arg in args if arg is not None]
+    if settings.enable_service:
+        result = client.send_command(cmd, args, osd=kwargs.get('osd', True))
+        if result is not None:
+            return {'volume': result['volume'], 'muted': result['muted']}
+    with _lock:
+        return lock.execute(get_mixer(), cmd, args)
+
+#------------------------------------------------------------------------------
+# Public Functions, all of them return the new state as {'volume': int, 'muted': bool}
+#------------------------------------------------------------------------------
+
+def get_state():
+    ''' Reads the state from the mixer, without the progress dialog of the service '''
+    return _run('state', osd=False)
+
+def read_state():
+    ''' The state which a mixer of any process has written last, without a mixer or service call:
+        {'volume', 'muted', 'channels', 'time', 'sequence'}. Falls back to get_state. '''
+    snapshot = shmstate.read()
+    if snapshot is None:
+        return get_state()
+    return snapshot
+
+def volume_up(step=0):
+    return _run('up', step or None)
+
+def volume_down(step=0):
+    return _run('down', step or None)
+
+def change_volume(step):
+    return _run('change', step)
+
+def set_volume(volume):
+    return _run('set', volume)
+
+def set_mute(mute):
+    return _run('mute', 'true' if mute else 'false')
+
+def mute_toggle():
+    return _run('mutetoggle')
+
+def fade_to(target, duration_ms=commands.FADE_TIME, curve='linear'):
+    ''' With the service the fade runs in the background and the state at its start is returned '''
+    return _run('fade', target, duration_ms, curve)
+
+def batch(steps):
+    ''' Executes several commands like 'mute:false;set:30;change:-5' in one mixer call '''
+    return _run('batch', steps)
+
+def save_scene(name):
+    ''' Saves the levels and switches of all controls of the sound card (Linux only) '''
+    return _run('scene', name, 'save')
+
+def restore_scene(name, full=False):
+    ''' Writes the controls which differ from the saved scene, with full all of them '''
+    return _run('scene', name, 'full' if full else None)
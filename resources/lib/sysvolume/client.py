@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import json
+import socket
+from . import debug
+from .config import settings
+
+#------------------------------------------------------------------------------
+# Client for the mixer service
+#------------------------------------------------------------------------------
+
+SOCKET_NAME = 'service.sock'
+TIMEOUT = 3.0
+# Commands which can be sent again to a mixer if the service doesn't reply
+READ_COMMANDS = ['state', 'stats']
+
+
+def socket_path():
+    return os.path.join(settings.addon_profile, SOCKET_NAME)
+
+def send_command(cmd, args=[], timeout=TIMEOUT, osd=True):
+    ''' Sends a command to the mixer service and returns the mixer state as dict.
+        Returns None if the service is not running. With osd=False the service
+        doesn't show the progress dialog. '''
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path())
+            line = json.dumps({'cmd': cmd, 'args': ['%s' % arg for arg in args], 'osd': osd}) + '\n'
+            sock.sendall(line.encode('utf-8'))
+        except (socket.error, socket.timeout):
+            return None
+        reply = b''
+        try:
+            while not reply.endswith(b'\n'):
+                data = sock.recv(4096)
+                if not data:
+                    break
+                reply += data
+        except (socket.error, socket.timeout) as e:
+            debug.logError('No reply of the mixer service for %s: %s', cmd, e)
+            reply = b''
+    finally:
+        sock.close()
+    if not reply.endswith(b'\n'):
+        if cmd in READ_COMMANDS:
+            return None
+        # The service may have changed the volume already, so it isn't done again
+        raise Exception('Service error: no reply for %s' % cmd)
+    result = json.loads(reply.decode('utf-8'))
+    if 'error' in result:
+        raise Exception('Service error: %s' % result['error'])
+    return result
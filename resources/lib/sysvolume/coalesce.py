@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+from . import debug
+
+
+class _Batch(object):
+
+    def __init__(self):
+        self.step = 0
+        self.count = 0
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class StepCoalescer(object):
+    ''' Sums up the volume steps which arrive within a time window.
+
+    The first step of a batch starts the window. When it is over, the sum of all
+    steps is applied with one call of the apply function, and all callers
+    of the batch get its result.
+    '''
+
+    def __init__(self, apply, window_ms):
+        self.apply = apply
+        self.window = window_ms / 1000.0
+        self.cond = threading.Condition()
+        self.batch = _Batch()
+        self.timer = None
+
+    def change(self, step):
+        ''' Adds a step to the current batch and waits for the result '''
+        with self.cond:
+            batch = self.batch
+            batch.step += step
+            batch.count += 1
+            if self.timer is None:
+                self.timer = threading.Timer(self.window, self._flush, args=(batch,))
+                self.timer.daemon = True
+                self.timer.start()
+            while not batch.done:
+                self.cond.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.result
+
+    def flush(self):
+        ''' Applies the pending steps immediately '''
+        with self.cond:
+            batch = self.batch
+            if self.timer is None:
+                return
+            self.timer.cancel()
+        self._flush(batch)
+
+    def _flush(self, batch):
+        with self.cond:
+            if batch is not self.batch:
+                # Already flushed
+                return
+            self.batch = _Batch()
+            self.timer = None
+        debug.logInfo('Applying %s coalesced steps: %s', batch.count, batch.step)
+        try:
+            batch.result = self.apply(batch.step)
+        except Exception as e:
+            batch.error = e
+        with self.cond:
+            batch.done = True
+            self.cond.notify_all()
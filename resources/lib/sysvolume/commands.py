@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from . import debug
+
+#------------------------------------------------------------------------------
+# Volume commands which can be called with RunScript or sent to the service
+#------------------------------------------------------------------------------
+
+COMMANDS = ['up', 'down', 'change', 'set', 'mute', 'mutetoggle', 'fade', 'batch', 'state', 'scene']
+STEP_COMMANDS = ['up', 'down', 'change']
+# Commands which can be combined with batch,mute:false;set:30;change:-5
+BATCH_COMMANDS = ['up', 'down', 'change', 'set', 'mute', 'mutetoggle']
+# Commands which change the volume or mute and show the progress dialog
+OSD_COMMANDS = ['up', 'down', 'change', 'set', 'mute', 'mutetoggle', 'batch', 'scene']
+FADE_TIME = 2000
+
+
+def get_arg(args, idx, default=''):
+    retval = default
+    try:
+        retval = args[idx]
+    except:
+        pass
+    return retval
+
+def get_arg_int(args, idx, default=0):
+    retval = default
+    try:
+        retval = int(args[idx])
+    except:
+        pass
+    return retval
+
+def execute(mixer, cmd, args):
+    ''' Executes a volume command with the mixer. Returns False for unknown commands. '''
+    if cmd == 'up':
+        mixer.volumeUp(step=get_arg_int(args, 0, default=mixer.step_up))
+    elif cmd == 'down':
+        mixer.volumeDown(step=get_arg_int(args, 0, default=mixer.step_down))
+    elif cmd == 'change':
+        mixer.changeVolume(step=get_arg_int(args, 0, default=0))
+    elif cmd == 'set':
+        mixer.setVolume(volume=get_arg_int(args, 0, default=mixer.volume))
+    elif cmd == 'mute':
+        newMute = get_arg(args, 0, default='true' if mixer.muted else 'false').lower()
+        mixer.setMute(mute=True if newMute == 'true' else False)
+    elif cmd == 'mutetoggle':
+        mixer.muteToggle()
+    elif cmd == 'fade':
+        fade(mixer, args)
+    elif cmd == 'batch':
+        mixer.runBatch(parse_batch(args))
+    elif cmd == 'state':
+        mixer.getVolume()
+        mixer.isMuted()
+    elif cmd == 'scene':
+        scene(mixer, args)
+    else:
+        return False
+    return True
+
+def shows_osd(cmd, args):
+    ''' True for the commands which change the volume, a fade is visible enough itself '''
+    if cmd == 'scene':
+        return get_arg(args, 1).lower() not in ('save', 'delete')
+    return cmd in OSD_COMMANDS
+
+def changes_mixer(cmd, args):
+    ''' True for the commands which set the mixer, they stop a running fade '''
+    return cmd == 'fade' or shows_osd(cmd, args)
+
+def fade(mixer, args, cancel=None):
+    ''' fade,<target>[,<ms>[,<curve>]] '''
+    return mixer.fadeTo(get_arg_int(args, 0, default=mixer.volume), get_arg_int(args, 1, default=FADE_TIME),
+                        curve=get_arg(args, 2, default='linear').lower(), cancel=cancel)
+
+def scene(mixer, args):
+    ''' scene,<name>[,save|full|delete] restores a scene, with full also the unchanged controls '''
+    from . import scenes
+    name = get_arg(args, 0)
+    action = get_arg(args, 1).lower()
+    if not scenes.available() or not name:
+        debug.logError('Scenes are not available for %s', name or 'no name')
+    elif action == 'save':
+        scenes.save_scene(name, mixer.getDeviceNames())
+    elif action == 'delete':
+        scenes.delete_scene(name)
+    else:
+        scenes.restore_scene(name, full=action == 'full')
+        mixer.invalidate()
+        mixer.getVolume()
+        mixer.isMuted()
+
+def parse_batch(args):
+    ''' Parses the steps of a batch like mute:false;set:30;change:-5 into (command, args) pairs.
+        Kodi splits the RunScript arguments at commas, so these are accepted as separator too. '''
+    steps = []
+    for part in ';'.join(args).replace(',', ';').split(';'):
+        items = [item.strip() for item in part.split(':')]
+        cmd = items[0].lower()
+        if not cmd:
+            continue
+        if cmd not in BATCH_COMMANDS:
+            raise ValueError('Command not allowed in a batch: %s' % cmd)
+        steps.append((cmd, items[1:]))
+    return steps
+
+def get_step(mixer, cmd, args):
+    ''' Returns the signed volume step of an up/down/change command '''
+    if cmd == 'up':
+        step = get_arg_int(args, 0, default=mixer.step_up)
+        return abs(step if step != 0 else mixer.step_up)
+    elif cmd == 'down':
+        step = get_arg_int(args, 0, default=mixer.step_down)
+        return 0 - abs(step if step != 0 else mixer.step_down)
+    return get_arg_int(args, 0, default=0)
+
+def state(mixer):
+    return {'volume': mixer.volume, 'muted': mixer.muted}
@@ -18,13 +18,61 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import os
-from kodi_six import xbmcaddon
+from kodi_six import xbmc, xbmcaddon, xbmcvfs
+from . import storage
+
+try:
+    # translatePath was moved to xbmcvfs in Kodi 19
+    translatePath = xbmcvfs.translatePath
+except AttributeError:
+    translatePath = xbmc.translatePath
 
 
 class CONST(object):
     addon_id = 'script.module.sysvolume'
 
 
+class SettingsSnapshot(object):
+    ''' The addon settings of the last run, kept in the profile folder.
+
+    The snapshot is valid as long as the settings file of Kodi and the addon version
+    are unchanged, so a script run reads one small file instead of calling getSetting
+    for each setting. Settings which are missing in the snapshot are read from Kodi.
+    '''
+
+    SNAPSHOT_FILE = 'settings.snapshot.json'
+    SETTINGS_FILE = 'settings.xml'
+
+    def __init__(self, addon, profile):
+        self.addon = addon
+        self.path = os.path.join(profile, self.SNAPSHOT_FILE)
+        try:
+            st = os.stat(os.path.join(profile, self.SETTINGS_FILE))
+            self.key = '%s:%s:%s' % (addon.getAddonInfo('version'), st.st_mtime, st.st_size)
+        except OSError:
+            self.key = '%s:default' % addon.getAddonInfo('version')
+        self.values = {}
+        self.changed = False
+        data = storage.load_json(self.path, default={})
+        if isinstance(data, dict) and data.get('key') == self.key and isinstance(data.get('settings'), dict):
+            self.values = data['settings']
+
+    def getSetting(self, setting):
+        if setting not in self.values:
+            self.values[setting] = self.addon.getSetting(setting)
+            self.changed = True
+        return self.values[setting]
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            storage.save_json(self.path, {'key': self.key, 'settings': self.values})
+            self.changed = False
+        except (IOError, OSError):
+            pass
+
+
 class Config(object):
 
     def __init__(self, addon):
@@ -37,15 +85,32 @@ class Config(object):
         self.addon_path = addon.getAddonInfo('path')
         self.addon_base_url = 'plugin://' + self.addon_id
         self.addon_icon = os.path.join(self.addon_path, 'icon.png')
+        self.addon_profile = translatePath(addon.getAddonInfo('profile'))
         # Settings
-        self.device_name = addon.getSetting('device_name')
-        self.mixer_name = addon.getSetting('mixer_name')
-        self.step_up = int('0%s' % addon.getSetting('step_up'))
-        self.step_down = int('0%s' % addon.getSetting('step_down'))
-        self.max_volume = int('0%s' % addon.getSetting('max_volume'))
-        self.show_progress = True if addon.getSetting('show_progress') == 'true' else False
-        self.progress_time = int('0%s' % addon.getSetting('progress_time'))
-        self.debug = True if addon.getSetting('debug') == 'true' else False
+        snapshot = SettingsSnapshot(addon, self.addon_profile)
+        getSetting = snapshot.getSetting
+        self.audio_backend = getSetting('audio_backend').lower() or 'alsa'
+        self.device_name = getSetting('device_name')
+        self.mixer_name = getSetting('mixer_name')
+        self.mixer_group = getSetting('mixer_group')
+        self.step_up = int('0%s' % getSetting('step_up'))
+        self.step_down = int('0%s' % getSetting('step_down'))
+        self.max_volume = int('0%s' % getSetting('max_volume'))
+        self.volume_curve = getSetting('volume_curve').lower() or 'amixer'
+        self.show_progress = True if getSetting('show_progress') == 'true' else False
+        self.progress_time = int('0%s' % getSetting('progress_time'))
+        self.enable_service = True if getSetting('enable_service') == 'true' else False
+        self.coalesce_time = int('0%s' % getSetting('coalesce_time'))
+        self.cache_time = int('0%s' % getSetting('cache_time'))
+        self.command_timeout = int('0%s' % getSetting('command_timeout'))
+        self.collect_stats = True if getSetting('collect_stats') == 'true' else False
+        self.publish_state = True if getSetting('publish_state') == 'true' else False
+        self.remote_control = True if getSetting('remote_control') == 'true' else False
+        self.remote_address = getSetting('remote_address') or '127.0.0.1'
+        self.remote_port = int('0%s' % getSetting('remote_port'))
+        self.remote_token = getSetting('remote_token')
+        self.debug = True if getSetting('debug') == 'true' else False
+        snapshot.save()
 
 #------------------------------------------------------------------------------
 # Configuration
@@ -69,5 +134,7 @@ def getSetting(setting):
     return addon.getSetting(setting)
 
 def setSetting(setting, value):
+    from . import stats
+    stats.count('settings_write')
     addon.setSetting(setting, value)
 
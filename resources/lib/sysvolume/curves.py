@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import math
+import bisect
+import threading
+from . import debug, storage
+from .executor import executor, ExecuteError, ExecuteTimeout, CircuitOpenError
+from .amixer import pattern
+
+#------------------------------------------------------------------------------
+# Volume curves: lookup tables from percent to the raw values of a control
+#------------------------------------------------------------------------------
+
+# 'amixer' keeps the percent conversion of amixer, the others use a lookup table
+CURVES = ['amixer', 'linear', 'db', 'cubic']
+CURVES_FILE = 'curves.json'
+CONTROL_GET = ['amixer', '-c', '{device}', 'cget', "name='{name}'"]
+CONTROL_NAMES = ['{mixer} Playback Volume', '{mixer} Volume', '{mixer} Capture Volume']
+LIMITS = r'min=(?P<min>-?\d+),max=(?P<max>-?\d+)'
+DB_TLV = (r'\|\s*(?P<kind>dBscale|dBlinear|dBminmax|dBminmaxmute)-min=(?P<min>-?[\d\.]+)dB,'
+          r'(?:step|max)=(?P<value>-?[\d\.]+)dB(?:,mute=(?P<mute>\d))?')
+# The dB level of a muted minimum
+MUTE_DB = -9999999 / 100.0
+
+
+def db_function(tlv, vmin, vmax):
+    ''' Returns a function raw -> dB for a TLV dB scale [kind, min, step or max, mute], or None '''
+    if not tlv or vmax <= vmin:
+        return None
+    kind, db_min, value, mute = tlv
+    if kind == 'dBscale':
+        def db(raw):
+            if mute and raw <= vmin:
+                return float('-inf')
+            return db_min + (raw - vmin) * value
+    elif kind in ('dBminmax', 'dBminmaxmute'):
+        def db(raw):
+            if (mute or kind == 'dBminmaxmute') and raw <= vmin:
+                return float('-inf')
+            return db_min + (value - db_min) * (raw - vmin) / float(vmax - vmin)
+    elif kind == 'dBlinear':
+        # The raw value is linear to the gain
+        lmin = 0.0 if db_min <= MUTE_DB else math.pow(10, db_min / 20.0)
+        lmax = math.pow(10, value / 20.0)
+        def db(raw):
+            gain = lmin + (lmax - lmin) * (raw - vmin) / float(vmax - vmin)
+            return 20 * math.log10(gain) if gain > 0 else float('-inf')
+    else:
+        return None
+    return db
+
+
+class VolumeCurve(object):
+    ''' Maps the percent 0-100 to raw values of a control.
+
+    linear divides the raw range evenly, db the dB range, and cubic follows the
+    perceived loudness like the mapped volume of alsamixer (gain = percent^3).
+    Without a dB scale the db and cubic curves fall back to linear.
+    '''
+
+    def __init__(self, kind, vmin, vmax, db=None):
+        self.kind = kind if db is not None else 'linear'
+        self.min = vmin
+        self.max = vmax
+        self.db = db
+        self.table = self._build()
+
+    def _raw_for_db(self, target):
+        ''' Nearest raw value of a dB level, the dB levels grow with the raw value '''
+        lo, hi = self.min, self.max
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.db(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo > self.min and target - self.db(lo - 1) < self.db(lo) - target:
+            return lo - 1
+        return lo
+
+    def _build(self):
+        span = self.max - self.min
+        if self.kind == 'linear' or span <= 0:
+            return [self.min + int(round(percent * span / 100.0)) for percent in range(101)]
+        db_max = self.db(self.max)
+        db_min = self.db(self.min)
+        if db_min == float('-inf'):
+            db_min = self.db(self.min + 1)
+        table = [self.min]
+        for percent in range(1, 101):
+            if self.kind == 'cubic':
+                target = max(db_min, db_max + 60 * math.log10(percent / 100.0))
+            else:
+                target = db_min + (db_max - db_min) * percent / 100.0
+            table.append(max(table[-1], self._raw_for_db(target)))
+        table[100] = self.max
+        return table
+
+    def raw(self, percent):
+        return self.table[max(0, min(100, int(percent)))]
+
+    def percent(self, raw, hint=None):
+        ''' The percent of a raw value: the hint if it has this value, else the lowest or nearest one '''
+        if hint is not None and 0 <= hint <= 100 and self.table[hint] == raw:
+            return hint
+        percent = bisect.bisect_left(self.table, raw)
+        if percent > 100:
+            return 100
+        if percent > 0 and self.table[percent] != raw and raw - self.table[percent - 1] < self.table[percent] - raw:
+            return percent - 1
+        return percent
+
+    def step(self, volume, step, max_volume=100):
+        ''' Returns the volume after a step. A step always changes the raw value if the limits allow it. '''
+        target = max(0, min(max_volume, volume + step))
+        if step == 0 or target == 0 or target >= max_volume:
+            return target
+        sign = 1 if step > 0 else -1
+        while 0 < target < max_volume and self.raw(target) == self.raw(volume):
+            target += sign
+        return target
+
+#------------------------------------------------------------------------------
+# Raw and dB range of the controls, read with amixer once and kept in the profile
+#------------------------------------------------------------------------------
+
+_ranges = None
+_ranges_lock = threading.Lock()
+
+
+def parse_control(output):
+    ''' Returns the raw range and dB scale of the amixer cget output as {'min', 'max', 'tlv'} or None '''
+    m = pattern(LIMITS).search(output)
+    if m is None:
+        return None
+    info = {'min': int(m.group('min')), 'max': int(m.group('max')), 'tlv': None}
+    if 'dBrange-' in output:
+        debug.logInfo('dB ranges are not supported, the curve is linear')
+        return info
+    m = pattern(DB_TLV).search(output)
+    if m:
+        info['tlv'] = [m.group('kind'), float(m.group('min')), float(m.group('value')), int(m.group('mute') or 0)]
+    return info
+
+def read_control(device, mixer):
+    ''' Returns the range of a control or None if it has none.
+        Raises an ExecuteError if amixer couldn't be asked. '''
+    for name in CONTROL_NAMES:
+        try:
+            # The names which a control doesn't have fail, they don't pause the other controls
+            output = executor.execute([arg.format(device=device, name=name.format(mixer=mixer)) for arg in CONTROL_GET],
+                                      key='amixer-cget:%s:%s' % (device, mixer))
+        except (ExecuteTimeout, CircuitOpenError):
+            raise
+        except Exception as e:
+            debug.logInfo('No control %s: %s', name.format(mixer=mixer), e)
+            continue
+        info = parse_control(output)
+        if info is not None:
+            return info
+    return None
+
+def cards_signature():
+    ''' Changes if a sound card is added or removed '''
+    from .mixer import LinuxAlsaMixer
+    try:
+        with open(LinuxAlsaMixer.DEVICES) as f:
+            return LinuxAlsaMixer._devices_signature(f.read())
+    except (IOError, OSError):
+        return ''
+
+def get_range(device, mixer, reload=False):
+    ''' Returns the cached range of a control, it is read if it is unknown or reload is set.
+        A control without range is kept as {'missing': <cards signature>} until the cards change. '''
+    global _ranges
+    key = '%s:%s' % (device, mixer)
+    with _ranges_lock:
+        path = storage.profile_path(CURVES_FILE)
+        if _ranges is None:
+            _ranges = storage.load_json(path, default={})
+        info = _ranges.get(key)
+        if info is not None and 'missing' in info:
+            signature = cards_signature()
+            if not reload and info['missing'] == signature:
+                return None
+            info = None
+        if reload or info is None:
+            try:
+                info = read_control(device, mixer)
+            except ExecuteError as e:
+                debug.logError('Range of %s:%s not read: %s', device, mixer, e)
+                return None
+            _ranges[key] = info if info is not None else {'missing': cards_signature()}
+            storage.save_json(path, _ranges)
+        return info
+
+def get_curve(device, mixer, kind, reload=False):
+    ''' Returns the VolumeCurve of an ALSA control, or None for the amixer percent conversion '''
+    if kind not in CURVES or kind == 'amixer':
+        return None
+    info = get_range(device, mixer, reload=reload)
+    if info is None:
+        debug.logError('Range of %s:%s unknown, using the amixer percent', device, mixer)
+        return None
+    return VolumeCurve(kind, info['min'], info['max'], db_function(info['tlv'], info['min'], info['max']))
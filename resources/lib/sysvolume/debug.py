@@ -17,7 +17,7 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-import sys, os, logging
+import sys, os
 from kodi_six import xbmc
 
 #------------------------------------------------------------------------------
@@ -45,19 +45,20 @@ except:
 # Functions
 #------------------------------------------------------------------------------
 
-def logInfo(txt=''):
+def logInfo(txt='', *args):
+    ''' The text is formatted with the args only if the message is logged '''
     if DEBUG_ENABLED:
-        xbmcLog(txt, level=LOGNOTICE)
+        xbmcLog(txt % args if args else txt, level=LOGNOTICE)
 
-def logDebug(txt=''):
+def logDebug(txt='', *args):
     if DEBUG_ENABLED:
-        xbmcLog(txt, level=xbmc.LOGDEBUG)
+        xbmcLog(txt % args if args else txt, level=xbmc.LOGDEBUG)
 
-def logWarning(txt=''):
-    xbmcLog(txt, level=xbmc.LOGWARNING)
+def logWarning(txt='', *args):
+    xbmcLog(txt % args if args else txt, level=xbmc.LOGWARNING)
 
-def logError(txt=''):
-    xbmcLog(txt, level=xbmc.LOGERROR)
+def logError(txt='', *args):
+    xbmcLog(txt % args if args else txt, level=xbmc.LOGERROR)
 
 def xbmcLog(txt = '', level=xbmc.LOGINFO):
     ''' Log a text into the Kodi-Logfile '''
@@ -67,6 +68,8 @@ def xbmcLog(txt = '', level=xbmc.LOGINFO):
         xbmc.log("[%s] Logging Error" % ADDON_NAME, xbmc.LOGERROR)
 
 def logException(e, txt='', level=xbmc.LOGERROR):
+    # logging takes a while to import, it is only needed for errors
+    import logging
     if txt:
         xbmcLog(txt + '\n' + str(e), level)
     logging.exception(str(e))
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+''' Datagram endpoint of the mixer service for remotes and home automation.
+
+Each datagram is one command like the arguments of the script, e.g. 'up', 'down 2',
+'change -3', 'set 40', 'mute true', 'mutetoggle' or 'state'. A leading '#<id>' is
+returned in the reply. The commands which arrive while the mixer is busy are applied
+together and every '#<id>' of the batch gets a reply with the resulting state; the
+requests of a sender without an id get one reply together. 'subscribe' registers the
+sender for the state changes, which are pushed until 'unsubscribe' or until the
+subscription is not renewed.
+
+UDP datagrams are accepted only from the loopback addresses. Other hosts are accepted
+if the shared token is set and their datagrams start with '@<token>', e.g. '@secret #17 up'.
+Other datagrams are dropped without a reply, so a spoofed sender gets nothing sent.
+
+The reply is the mixer state as JSON: {"volume": 44, "muted": false}
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import hmac
+import json
+import time
+import select
+import socket
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import debug, commands, stats
+from .config import settings
+
+#------------------------------------------------------------------------------
+# Datagram endpoint
+#------------------------------------------------------------------------------
+
+SOCKET_NAME = 'remote.sock'
+ENDPOINT_COMMANDS = ['up', 'down', 'change', 'set', 'mute', 'mutetoggle', 'state']
+MAX_DATAGRAM = 512
+# Subscribers renew their subscription within this time
+SUBSCRIPTION_TIME = 600
+MAX_SUBSCRIBERS = 16
+POLL_TIME = 0.5
+
+
+def socket_path():
+    return os.path.join(settings.addon_profile, SOCKET_NAME)
+
+def parse_datagram(data):
+    ''' Returns the token, the request id, the command and its arguments of a datagram '''
+    args = data.decode('utf-8', 'replace').split()
+    token = None
+    if args and args[0].startswith('@'):
+        token = args.pop(0)[1:]
+    request_id = None
+    if args and args[0].startswith('#'):
+        request_id = args.pop(0)[1:]
+    cmd = args[0].lower() if args else ''
+    return token, request_id, cmd, args[1:]
+
+def is_loopback(sock, address):
+    ''' The Unix socket is protected by the folder permissions, UDP is local from 127.0.0.0/8 only '''
+    if sock.family != socket.AF_INET:
+        return True
+    return address[0].startswith('127.')
+
+
+class ControlEndpoint(object):
+    ''' Receives the commands of remotes on a Unix datagram socket and optionally on UDP.
+
+    The commands are applied by one worker thread. The volume steps which arrive
+    while the mixer is busy are added up and applied with one mixer call, so a
+    quickly turned knob doesn't queue up mixer calls. Each request id gets a reply
+    with the resulting state of the batch.
+    '''
+
+    def __init__(self, service, address=None, port=0, token=''):
+        self.service = service
+        self.address = address
+        self.port = port
+        self.token = token
+        self.sockets = []
+        self.queue = queue.Queue()
+        self.stopping = threading.Event()
+        self.threads = []
+        # (socket, address) -> time of the subscription
+        self.subscribers = {}
+        self.pushed = None
+
+    def start(self):
+        path = socket_path()
+        if hasattr(socket, 'AF_UNIX'):
+            if os.path.exists(path):
+                os.remove(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            self.sockets.append(sock)
+        if self.port > 0:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind((self.address or '127.0.0.1', self.port))
+            except socket.error:
+                sock.close()
+                raise
+            self.sockets.append(sock)
+        for target, name in [(self._receive, 'SysVolumeRemote'), (self._work, 'SysVolumeRemoteWorker')]:
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        debug.logInfo('Remote control endpoint on %s%s', path,
+                      ' and udp %s:%s' % (self.address or '127.0.0.1', self.port) if self.port > 0 else '')
+
+    def stop(self):
+        self.stopping.set()
+        self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        for sock in self.sockets:
+            if sock.family == getattr(socket, 'AF_UNIX', None):
+                try:
+                    os.remove(sock.getsockname())
+                except OSError:
+                    pass
+            sock.close()
+        self.sockets = []
+        self.subscribers.clear()
+
+    def onMixerEvent(self):
+        ''' A change from outside is pushed to the subscribers '''
+        self.queue.put(('refresh', None, None))
+
+    def push(self, reply, exclude=()):
+        ''' Sends a changed state to the subscribers, except to the senders which got it as reply '''
+        state = (reply.get('volume'), reply.get('muted'))
+        if state == self.pushed or not self.subscribers:
+            return
+        self.pushed = state
+        data = json.dumps({'volume': state[0], 'muted': state[1], 'push': True}).encode('utf-8')
+        now = time.time()
+        for sender, since in list(self.subscribers.items()):
+            if sender in exclude:
+                continue
+            if now - since > SUBSCRIPTION_TIME or not self._send(sender, data):
+                self.subscribers.pop(sender, None)
+
+    def _send(self, sender, data):
+        sock, address = sender
+        if not address:
+            # An unbound Unix socket can't get replies
+            return False
+        try:
+            sock.sendto(data, address)
+            return True
+        except socket.error as e:
+            debug.logInfo('Remote %s not reachable: %s', address, e)
+            return False
+
+    def _receive(self):
+        while not self.stopping.is_set():
+            try:
+                readable = select.select(self.sockets, [], [], POLL_TIME)[0]
+            except (select.error, ValueError):
+                break
+            for sock in readable:
+                try:
+                    data, address = sock.recvfrom(MAX_DATAGRAM)
+                except socket.error:
+                    continue
+                stats.count('remote_datagram')
+                token, request_id, cmd, args = parse_datagram(data)
+                if not self._accepted(sock, address, token):
+                    stats.count('remote_rejected')
+                    continue
+                self.queue.put(('command', (request_id, cmd, args), (sock, address)))
+
+    def _accepted(self, sock, address, token):
+        ''' Local senders are trusted, other hosts need the shared token '''
+        if is_loopback(sock, address):
+            return True
+        if not self.token or token is None:
+            return False
+        return hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8'))
+
+    def _work(self):
+        while True:
+            items = [self.queue.get()]
+            # Everything which arrived meanwhile is handled together
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in items:
+                return
+            try:
+                self._process(items)
+            except Exception as e:
+                debug.logException(e, 'Remote commands failed')
+
+    def _apply(self, cmd, args):
+        start = time.time()
+        reply = self.service.execute(cmd, args, remote=True)
+        stats.record('remote.%s' % cmd, time.time() - start, ' '.join([cmd] + args))
+        return reply
+
+    def _process(self, items):
+        ''' Applies the commands of a batch, the steps in a row are added up '''
+        step = 0
+        reply = None
+        refresh = False
+        senders = {}
+        for kind, request, sender in items:
+            if kind == 'refresh':
+                refresh = True
+                continue
+            request_id, cmd, args = request
+            if cmd == 'subscribe':
+                now = time.time()
+                for other, since in list(self.subscribers.items()):
+                    if now - since > SUBSCRIPTION_TIME:
+                        self.subscribers.pop(other, None)
+                if sender not in self.subscribers and len(self.subscribers) >= MAX_SUBSCRIBERS:
+                    self._reply(sender, request_id, {'error': 'Too many subscribers'})
+                    continue
+                self.subscribers[sender] = now
+            elif cmd == 'unsubscribe':
+                self.subscribers.pop(sender, None)
+            elif cmd not in ENDPOINT_COMMANDS:
+                self._reply(sender, request_id, {'error': 'Unknown command: %s' % cmd})
+                continue
+            elif cmd in commands.STEP_COMMANDS:
+                mixer = self.service.mixer
+                if mixer is not None:
+                    step += commands.get_step(mixer, cmd, args)
+            elif cmd != 'state':
+                if step != 0:
+                    self._apply('change', ['%s' % step])
+                    step = 0
+                reply = self._apply(cmd, args)
+            request_ids = senders.setdefault(sender, [])
+            if request_id is not None or None not in request_ids:
+                request_ids.append(request_id)
+        if step != 0:
+            reply = self._apply('change', ['%s' % step])
+        if reply is None:
+            reply = self.service.getState(refresh=refresh)
+        if len(items) > 1:
+            stats.count('remote_coalesced', len(items) - 1)
+        for sender, request_ids in senders.items():
+            for request_id in request_ids:
+                self._reply(sender, request_id, reply)
+        if 'error' not in reply:
+            self.push(reply, exclude=senders)
+
+    def _reply(self, sender, request_id, reply):
+        reply = dict((key, value) for key, value in reply.items() if key in ('volume', 'muted', 'error'))
+        if request_id is not None:
+            reply['id'] = request_id
+        self._send(sender, json.dumps(reply).encode('utf-8'))
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import time
+import threading
+import subprocess
+from kodi_six import py2_encode
+from . import debug, stats
+from .config import settings
+
+
+class ExecuteError(Exception):
+    pass
+
+
+class ExecuteTimeout(ExecuteError):
+    pass
+
+
+class CircuitOpenError(ExecuteError):
+    pass
+
+
+class ExecuteCancelled(ExecuteError):
+    pass
+
+
+class CommandStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_error = ''
+        # Circuit breaker state
+        self.consecutive_failures = 0
+        self.open_until = 0
+
+    def asDict(self):
+        return {'calls': self.calls, 'failures': self.failures, 'timeouts': self.timeouts,
+                'rejected': self.rejected, 'total_ms': int(self.total_time * 1000),
+                'avg_ms': int(self.total_time * 1000 / self.calls) if self.calls else 0,
+                'max_ms': int(self.max_time * 1000), 'last_error': self.last_error}
+
+
+class CommandExecutor(object):
+    ''' Runs external commands without a shell and with a time limit.
+
+    Commands are grouped by a key (e.g. the program and the sound card).
+    After MAX_FAILURES failed calls in a row the circuit of the key is opened
+    and calls are rejected for RETRY_TIME seconds, so the caller can use its
+    last known state instead of starting more processes which hang as well.
+    '''
+
+    MAX_FAILURES = 3
+    RETRY_TIME = 10.0
+    DEFAULT_TIMEOUT = 2.0
+    # Time to wait for a killed process before it is left behind
+    KILL_WAIT = 0.2
+    # Interval to check the cancel event of a command
+    CANCEL_POLL = 0.05
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.commands = {}
+
+    def getTimeout(self):
+        if self.timeout:
+            return self.timeout
+        return settings.command_timeout / 1000.0 if settings.command_timeout > 0 else self.DEFAULT_TIMEOUT
+
+    def _stats(self, key):
+        with self.lock:
+            if key not in self.commands:
+                self.commands[key] = CommandStats()
+            return self.commands[key]
+
+    def stats(self):
+        with self.lock:
+            return dict((key, st.asDict()) for key, st in self.commands.items())
+
+    def reset(self, key=None):
+        ''' Closes the circuit of a key or of all keys '''
+        with self.lock:
+            for k, st in self.commands.items():
+                if key is None or k == key:
+                    st.consecutive_failures = 0
+                    st.open_until = 0
+
+    def execute(self, args, input=None, timeout=None, key=None, cancel=None):
+        ''' Runs the command and returns its output. Raises an ExecuteError if it fails.
+            The command is killed when the optional cancel event is set. '''
+        key = key or args[0]
+        st = self.begin(key)
+        start = time.time()
+        try:
+            stdout_value, stderr_value, retCode = self._run(args, input, timeout or self.getTimeout(), cancel)
+            return self.check(st, args, stdout_value, stderr_value, retCode)
+        except ExecuteCancelled:
+            raise
+        except ExecuteError as e:
+            self.failed(key, st, e)
+            raise
+        finally:
+            self.finished(key, st, args, time.time() - start)
+
+    # The steps of a call, also used by the asyncio mixer
+
+    def begin(self, key):
+        ''' Returns the statistics of the key or raises a CircuitOpenError if its circuit is open '''
+        st = self._stats(key)
+        if st.open_until > time.time():
+            st.rejected += 1
+            raise CircuitOpenError('Too many failures of %s, retrying in %.1f seconds' % (key, st.open_until - time.time()))
+        return st
+
+    def check(self, st, args, stdout_value, stderr_value, retCode):
+        ''' Returns the output of a finished command or raises an ExecuteError '''
+        if retCode != 0:
+            raise ExecuteError('%s failed with exit code %s: %s' % (args[0], retCode, stderr_value.strip()))
+        if len(stderr_value) > 2:
+            debug.logError(stderr_value)
+        with self.lock:
+            st.consecutive_failures = 0
+        return stdout_value
+
+    def failed(self, key, st, e):
+        with self.lock:
+            st.failures += 1
+            st.consecutive_failures += 1
+            st.last_error = '%s' % e
+            if isinstance(e, ExecuteTimeout):
+                st.timeouts += 1
+            if st.consecutive_failures >= self.MAX_FAILURES:
+                st.open_until = time.time() + self.RETRY_TIME
+                debug.logError('Circuit for %s opened after %s failures', key, st.consecutive_failures)
+
+    def finished(self, key, st, args, elapsed):
+        with self.lock:
+            st.calls += 1
+            st.total_time += elapsed
+            st.max_time = max(st.max_time, elapsed)
+        stats.count('subprocess')
+        stats.record('exec.%s' % key, elapsed, ' '.join(args[:4]))
+
+    def _run(self, args, input, timeout, cancel=None):
+        try:
+            process = subprocess.Popen([py2_encode(arg) for arg in args], stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, stdin=subprocess.PIPE, close_fds=True)
+        except OSError as e:
+            raise ExecuteError('Failed to start %s: %s' % (args[0], e))
+        result = {}
+        def communicate():
+            result['output'] = process.communicate(input.encode('utf-8') if input is not None else None)
+        # The process is watched by another thread, because a process which hangs in the
+        # kernel (e.g. an unplugged USB device) can't even be killed in time.
+        thread = threading.Thread(target=communicate, name='SysVolumeExec')
+        thread.daemon = True
+        thread.start()
+        deadline = time.time() + timeout
+        while thread.is_alive() and time.time() < deadline:
+            if cancel is not None and cancel.is_set():
+                break
+            thread.join(deadline - time.time() if cancel is None else min(self.CANCEL_POLL, deadline - time.time()))
+        if thread.is_alive():
+            try:
+                process.kill()
+            except OSError:
+                pass
+            thread.join(self.KILL_WAIT)
+            if cancel is not None and cancel.is_set():
+                raise ExecuteCancelled('%s was cancelled' % args[0])
+            raise ExecuteTimeout('%s timed out after %s ms' % (args[0], int(timeout * 1000)))
+        if 'output' not in result:
+            raise ExecuteError('Failed to read the output of %s' % args[0])
+        stdout_value, stderr_value = result['output']
+        return stdout_value.decode('utf-8', 'replace'), stderr_value.decode('utf-8', 'replace'), process.returncode
+
+#------------------------------------------------------------------------------
+# Executor for all mixer commands of this process
+#------------------------------------------------------------------------------
+
+executor = CommandExecutor()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import select
+import ctypes
+import ctypes.util
+
+#------------------------------------------------------------------------------
+# ctypes binding for the simple mixer element API of libasound
+#------------------------------------------------------------------------------
+
+# The library can be replaced by a stub library for testing
+LIBRARY_ENV = 'SYSVOLUME_LIBASOUND'
+LIBRARY_NAMES = ['libasound.so.2', 'libasound.so']
+
+SND_MIXER_SCHN_MONO = 0
+SND_MIXER_SCHN_LAST = 31
+
+_lib = None
+_error = None
+
+
+class PollFd(ctypes.Structure):
+    _fields_ = [('fd', ctypes.c_int), ('events', ctypes.c_short), ('revents', ctypes.c_short)]
+
+
+class AlsaError(Exception):
+    pass
+
+
+def _prototype(lib, name, restype, *argtypes):
+    func = getattr(lib, name)
+    func.restype = restype
+    func.argtypes = list(argtypes)
+
+def load():
+    ''' Loads libasound once and returns it or None if it is not available '''
+    global _lib, _error
+    if _lib is not None or _error is not None:
+        return _lib
+    try:
+        if os.environ.get(LIBRARY_ENV):
+            names = [os.environ[LIBRARY_ENV]]
+        else:
+            names = list(LIBRARY_NAMES)
+            found = ctypes.util.find_library('asound')
+            if found and found not in names:
+                names.append(found)
+        lib = None
+        for name in names:
+            try:
+                lib = ctypes.CDLL(name)
+                break
+            except OSError as e:
+                _error = e
+        if lib is None:
+            return None
+        p = ctypes.c_void_p
+        _prototype(lib, 'snd_strerror', ctypes.c_char_p, ctypes.c_int)
+        _prototype(lib, 'snd_mixer_open', ctypes.c_int, ctypes.POINTER(p), ctypes.c_int)
+        _prototype(lib, 'snd_mixer_close', ctypes.c_int, p)
+        _prototype(lib, 'snd_mixer_attach', ctypes.c_int, p, ctypes.c_char_p)
+        _prototype(lib, 'snd_mixer_selem_register', ctypes.c_int, p, p, p)
+        _prototype(lib, 'snd_mixer_load', ctypes.c_int, p)
+        _prototype(lib, 'snd_mixer_handle_events', ctypes.c_int, p)
+        _prototype(lib, 'snd_mixer_poll_descriptors_count', ctypes.c_int, p)
+        _prototype(lib, 'snd_mixer_poll_descriptors', ctypes.c_int, p, ctypes.POINTER(PollFd), ctypes.c_uint)
+        _prototype(lib, 'snd_mixer_selem_id_malloc', ctypes.c_int, ctypes.POINTER(p))
+        _prototype(lib, 'snd_mixer_selem_id_free', None, p)
+        _prototype(lib, 'snd_mixer_selem_id_set_index', None, p, ctypes.c_uint)
+        _prototype(lib, 'snd_mixer_selem_id_set_name', None, p, ctypes.c_char_p)
+        _prototype(lib, 'snd_mixer_find_selem', p, p, p)
+        _prototype(lib, 'snd_mixer_selem_has_playback_volume', ctypes.c_int, p)
+        _prototype(lib, 'snd_mixer_selem_has_playback_switch', ctypes.c_int, p)
+        _prototype(lib, 'snd_mixer_selem_has_playback_channel', ctypes.c_int, p, ctypes.c_int)
+        _prototype(lib, 'snd_mixer_selem_get_playback_volume_range', ctypes.c_int, p,
+                   ctypes.POINTER(ctypes.c_long), ctypes.POINTER(ctypes.c_long))
+        _prototype(lib, 'snd_mixer_selem_get_playback_volume', ctypes.c_int, p, ctypes.c_int, ctypes.POINTER(ctypes.c_long))
+        _prototype(lib, 'snd_mixer_selem_set_playback_volume', ctypes.c_int, p, ctypes.c_int, ctypes.c_long)
+        _prototype(lib, 'snd_mixer_selem_set_playback_volume_all', ctypes.c_int, p, ctypes.c_long)
+        _prototype(lib, 'snd_mixer_selem_get_playback_switch', ctypes.c_int, p, ctypes.c_int, ctypes.POINTER(ctypes.c_int))
+        _prototype(lib, 'snd_mixer_selem_get_playback_dB_range', ctypes.c_int, p,
+                   ctypes.POINTER(ctypes.c_long), ctypes.POINTER(ctypes.c_long))
+        _prototype(lib, 'snd_mixer_selem_ask_playback_vol_dB', ctypes.c_int, p, ctypes.c_long, ctypes.POINTER(ctypes.c_long))
+        _prototype(lib, 'snd_mixer_selem_set_playback_switch_all', ctypes.c_int, p, ctypes.c_int)
+        _lib = lib
+        _error = None
+    except Exception as e:
+        _error = e
+    return _lib
+
+def available():
+    return load() is not None
+
+def ctl_name(device_name):
+    ''' Returns the ALSA control name of a card like amixer -c does '''
+    if ':' in device_name or device_name == 'default':
+        return device_name
+    return 'hw:%s' % device_name
+
+
+class SimpleControl(object):
+    ''' One playback control of a card, opened with the ALSA simple mixer API '''
+
+    def __init__(self, device, name, index=0):
+        self.lib = load()
+        if self.lib is None:
+            raise AlsaError('libasound not available: %s' % _error)
+        self.device = device
+        self.name = name
+        self.handle = ctypes.c_void_p()
+        self.elem = None
+        self.channels = []
+        self.poller = None
+        self._check(self.lib.snd_mixer_open(ctypes.byref(self.handle), 0), 'snd_mixer_open')
+        try:
+            self._check(self.lib.snd_mixer_attach(self.handle, device.encode('utf-8')), 'snd_mixer_attach')
+            self._check(self.lib.snd_mixer_selem_register(self.handle, None, None), 'snd_mixer_selem_register')
+            self._check(self.lib.snd_mixer_load(self.handle), 'snd_mixer_load')
+            self.poller = self._poller()
+            sid = ctypes.c_void_p()
+            self._check(self.lib.snd_mixer_selem_id_malloc(ctypes.byref(sid)), 'snd_mixer_selem_id_malloc')
+            try:
+                self.lib.snd_mixer_selem_id_set_index(sid, index)
+                self.lib.snd_mixer_selem_id_set_name(sid, name.encode('utf-8'))
+                self.elem = self.lib.snd_mixer_find_selem(self.handle, sid)
+            finally:
+                self.lib.snd_mixer_selem_id_free(sid)
+            if not self.elem:
+                raise AlsaError("Unable to find simple control '%s',%s on %s" % (name, index, device))
+            if not self.lib.snd_mixer_selem_has_playback_volume(self.elem):
+                raise AlsaError("Control '%s' has no playback volume" % name)
+            self.has_switch = self.lib.snd_mixer_selem_has_playback_switch(self.elem) != 0
+            self.channels = [ch for ch in range(SND_MIXER_SCHN_LAST + 1)
+                             if self.lib.snd_mixer_selem_has_playback_channel(self.elem, ch)]
+            vmin, vmax = ctypes.c_long(), ctypes.c_long()
+            self._check(self.lib.snd_mixer_selem_get_playback_volume_range(self.elem, ctypes.byref(vmin), ctypes.byref(vmax)),
+                        'snd_mixer_selem_get_playback_volume_range')
+            self.min = vmin.value
+            self.max = vmax.value
+        except:
+            self.close()
+            raise
+
+    def _poller(self):
+        ''' Polls the descriptors of the mixer, which are readable when a change event is pending '''
+        count = self.lib.snd_mixer_poll_descriptors_count(self.handle)
+        if count <= 0:
+            return None
+        fds = (PollFd * count)()
+        count = self._check(self.lib.snd_mixer_poll_descriptors(self.handle, fds, count), 'snd_mixer_poll_descriptors')
+        poller = select.poll()
+        for fd in fds[:count]:
+            poller.register(fd.fd, fd.events)
+        return poller
+
+    def _check(self, err, func):
+        if err < 0:
+            msg = self.lib.snd_strerror(err)
+            raise AlsaError('%s failed: %s' % (func, msg.decode('utf-8') if msg else err))
+        return err
+
+    def close(self):
+        if self.handle:
+            self.lib.snd_mixer_close(self.handle)
+            self.handle = ctypes.c_void_p()
+            self.elem = None
+            self.poller = None
+
+    def update(self):
+        ''' Reads pending change events, so values changed by other clients are up to date.
+            The mixer is opened in blocking mode, so the events are only read if the
+            descriptors are readable. Returns True if there were events. '''
+        if self.poller is None or not self.poller.poll(0):
+            return False
+        self._check(self.lib.snd_mixer_handle_events(self.handle), 'snd_mixer_handle_events')
+        return True
+
+    def getRaw(self):
+        values = []
+        value = ctypes.c_long()
+        for ch in self.channels or [SND_MIXER_SCHN_MONO]:
+            self._check(self.lib.snd_mixer_selem_get_playback_volume(self.elem, ch, ctypes.byref(value)),
+                        'snd_mixer_selem_get_playback_volume')
+            values.append(value.value)
+        return values
+
+    def setRaw(self, values):
+        ''' Sets all channels to one value or each channel to its own value '''
+        if isinstance(values, (list, tuple)):
+            for ch, value in zip(self.channels, values):
+                self._check(self.lib.snd_mixer_selem_set_playback_volume(self.elem, ch, self._clamp(value)),
+                            'snd_mixer_selem_set_playback_volume')
+        else:
+            self._check(self.lib.snd_mixer_selem_set_playback_volume_all(self.elem, self._clamp(values)),
+                        'snd_mixer_selem_set_playback_volume_all')
+
+    def getDbFunction(self):
+        ''' Returns a function raw value -> dB, or None if the control has no dB scale '''
+        dbmin, dbmax = ctypes.c_long(), ctypes.c_long()
+        if self.lib.snd_mixer_selem_get_playback_dB_range(self.elem, ctypes.byref(dbmin), ctypes.byref(dbmax)) < 0:
+            return None
+        def db(raw):
+            value = ctypes.c_long()
+            self._check(self.lib.snd_mixer_selem_ask_playback_vol_dB(self.elem, int(raw), ctypes.byref(value)),
+                        'snd_mixer_selem_ask_playback_vol_dB')
+            # The library reports 1/100 dB, a muted minimum as -99999.99 dB
+            return float('-inf') if value.value <= -9999999 else value.value / 100.0
+        return db
+
+    def getSwitch(self):
+        ''' Returns True if any channel is switched on '''
+        if not self.has_switch:
+            return True
+        value = ctypes.c_int()
+        for ch in self.channels or [SND_MIXER_SCHN_MONO]:
+            self._check(self.lib.snd_mixer_selem_get_playback_switch(self.elem, ch, ctypes.byref(value)),
+                        'snd_mixer_selem_get_playback_switch')
+            if value.value:
+                return True
+        return False
+
+    def setSwitch(self, on):
+        if self.has_switch:
+            self._check(self.lib.snd_mixer_selem_set_playback_switch_all(self.elem, 1 if on else 0),
+                        'snd_mixer_selem_set_playback_switch_all')
+
+    def _clamp(self, value):
+        return max(self.min, min(self.max, int(value)))
+
+    # Percent conversion like amixer does it
+
+    def toPercent(self, value):
+        if self.max <= self.min:
+            return 0
+        return int(round((value - self.min) * 100.0 / (self.max - self.min)))
+
+    def fromPercent(self, percent):
+        return int(round(percent * (self.max - self.min) * 0.01)) + self.min
+
+    def getPercent(self):
+        ''' Percent of the loudest channel like the amixer backend reports it '''
+        return self.toPercent(max(self.getRaw()))
+
+    def setPercent(self, percent):
+        self.setRaw(self.fromPercent(percent))
+
+    def changePercent(self, step):
+        delta = int(round(abs(step) * (self.max - self.min) * 0.01))
+        self.setRaw([value + delta if step >= 0 else value - delta for value in self.getRaw()])
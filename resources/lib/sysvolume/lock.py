@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import time
+import uuid
+from . import debug, commands, state, storage
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#------------------------------------------------------------------------------
+# Coordination of script instances which use the mixer at the same time
+#------------------------------------------------------------------------------
+
+LOCK_FILE = 'mixer.lock'
+QUEUE_LOCK_FILE = 'queue.lock'
+QUEUE_FILE = 'queue.json'
+# Time to wait for the mixer lock or the result of another script
+LOCK_TIMEOUT = 5.0
+POLL_TIME = 0.01
+# Results which were not picked up within this time are removed
+RESULT_TIME = 30.0
+
+
+class FileLock(object):
+    ''' Exclusive lock on a file in the profile folder. It is released by the system if the process dies. '''
+
+    def __init__(self, name):
+        self.path = storage.profile_path(name)
+        self.fd = None
+
+    def acquire(self, timeout=LOCK_TIMEOUT):
+        ''' Returns False if the lock wasn't free within the timeout (0 = don't wait) '''
+        if self.fd is None:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except (IOError, OSError):
+                if time.time() >= deadline:
+                    return False
+                time.sleep(POLL_TIME)
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        if not self.acquire():
+            debug.logWarning('Lock %s not free within %s seconds, continuing without it', self.path, LOCK_TIMEOUT)
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def _update_queue(func):
+    ''' Calls func with the queue data under the queue lock and saves the changes '''
+    with FileLock(QUEUE_LOCK_FILE):
+        path = storage.profile_path(QUEUE_FILE)
+        queue = storage.load_json(path, default={})
+        queue.setdefault('pending', [])
+        queue.setdefault('results', {})
+        retval = func(queue)
+        now = time.time()
+        queue['results'] = dict((key, value) for key, value in queue['results'].items()
+                                if now - value.get('time', 0) < RESULT_TIME)
+        storage.save_json(path, queue)
+        return retval
+
+def _take_result(request_id):
+    # Check without the lock first, the waiting scripts poll often
+    queue = storage.load_json(storage.profile_path(QUEUE_FILE), default={})
+    if request_id not in queue.get('results', {}):
+        return None
+    def take(queue):
+        return queue['results'].pop(request_id, None)
+    result = _update_queue(take)
+    if result is not None:
+        result.pop('time', None)
+    return result
+
+def _refresh(mixer):
+    ''' Takes the state which the previous lock owner has saved '''
+    state.get_store().load()
+    mixer._restore_state()
+
+def _lead(mixer, request_id):
+    ''' Applies the sum of all queued steps and passes the result to the waiting scripts '''
+    def take_all(queue):
+        pending, queue['pending'] = queue['pending'], []
+        return pending
+    pending = _update_queue(take_all)
+    total = sum(request['step'] for request in pending)
+    _refresh(mixer)
+    if total != 0:
+        mixer.changeVolume(total)
+    state.flush()
+    result = commands.state(mixer)
+    debug.logInfo('Applied %s queued steps: %s', len(pending), total)
+    others = [request['id'] for request in pending if request['id'] != request_id]
+    if others:
+        def publish(queue):
+            for other in others:
+                queue['results'][other] = dict(result, time=time.time())
+        _update_queue(publish)
+    return result
+
+def _single_flight(mixer, step):
+    ''' Queues a volume step. The script which gets the mixer lock applies all queued steps
+        at once, the other scripts get its result instead of starting their own amixer. '''
+    request_id = uuid.uuid4().hex
+    _update_queue(lambda queue: queue['pending'].append({'id': request_id, 'step': step}))
+    mixer_lock = FileLock(LOCK_FILE)
+    deadline = time.time() + LOCK_TIMEOUT
+    while time.time() < deadline:
+        if mixer_lock.acquire(timeout=0):
+            try:
+                # A previous lock owner may have applied the step already
+                return _take_result(request_id) or _lead(mixer, request_id)
+            finally:
+                mixer_lock.release()
+        result = _take_result(request_id)
+        if result is not None:
+            return result
+        time.sleep(POLL_TIME)
+    def withdraw(queue):
+        ids = [request['id'] for request in queue['pending']]
+        if request_id in ids:
+            queue['pending'].pop(ids.index(request_id))
+            return True
+        return False
+    if not _update_queue(withdraw):
+        # The step is applied right now by another script
+        return _take_result(request_id) or commands.state(mixer)
+    debug.logWarning('Mixer lock not free within %s seconds, changing the volume without it', LOCK_TIMEOUT)
+    mixer.changeVolume(step)
+    return commands.state(mixer)
+
+def execute(mixer, cmd, args):
+    ''' Executes a command while no other script uses the mixer and returns the mixer state.
+        Volume steps of scripts which wait for the lock are merged into one change. '''
+    if fcntl is None:
+        commands.execute(mixer, cmd, args)
+        return commands.state(mixer)
+    if cmd in commands.STEP_COMMANDS:
+        return _single_flight(mixer, commands.get_step(mixer, cmd, args))
+    with FileLock(LOCK_FILE):
+        _refresh(mixer)
+        commands.execute(mixer, cmd, args)
+        state.flush()
+        return commands.state(mixer)
@@ -17,46 +17,145 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import os
 import sys
 import re
+import math
+import time
+import threading
 import traceback
-import subprocess
-from kodi_six import py2_encode
 from . import debug
 from . import config
+from . import storage
+from . import state
+from . import shmstate
+from . import stats
+from . import commands
+from .amixer import AmixerSession, parse_status
+from .executor import executor, ExecuteCancelled
+from .watcher import MixerEventWatcher
+from . import libasound
+from . import curves
+from . import pulse
 
+MIXER_METHODS = ['getVolume', 'setVolume', 'changeVolume', 'volumeUp', 'volumeDown', 'isMuted', 'setMute', 'muteToggle',
+                 'fadeTo', 'runBatch']
 
+# Shapes of a fade, mapping the elapsed part of the time to the reached part of the change
+FADE_CURVES = {
+    'linear': lambda x: x,
+    'in': lambda x: x * x,
+    'out': lambda x: 1 - (1 - x) * (1 - x),
+    'smooth': lambda x: x * x * (3 - 2 * x),
+}
+
+
+def parse_group(text):
+    ''' Parses the members of a mixer group: 'device:control[:offset[:scale]]' separated by ';'.
+        Returns a list of (device, control, offset, scale), invalid entries are skipped. '''
+    members = []
+    for entry in (text or '').split(';'):
+        parts = [part.strip() for part in entry.split(':')]
+        if len(parts) < 2 or not parts[0] or not parts[1]:
+            if entry.strip():
+                debug.logError('Invalid mixer group member: %s', entry)
+            continue
+        try:
+            offset = int(parts[2]) if len(parts) > 2 and parts[2] else 0
+            scale = float(parts[3]) if len(parts) > 3 and parts[3] else 1.0
+        except ValueError:
+            debug.logError('Invalid mixer group member: %s', entry)
+            continue
+        members.append((parts[0], parts[1], offset, scale))
+    return members
+
+def fade_steps(start, target, duration_ms, curve, tick):
+    ''' Returns the time offset and volume of each step of a fade, without repeated volumes.
+        The last step, which reaches the target, is at the end of the duration. '''
+    shape = FADE_CURVES.get(curve, FADE_CURVES['linear'])
+    duration = max(0, duration_ms) / 1000.0
+    # The ticks are stretched a little to fill the duration
+    ticks = max(1, int(math.ceil(duration / tick)))
+    # The volume is rounded towards the start, so the target isn't reached before the last tick
+    epsilon = 1e-9 if target >= start else -1e-9
+    steps = []
+    last = start
+    for i in range(1, ticks + 1):
+        volume = start + int((target - start) * shape(i / float(ticks)) + epsilon)
+        if volume != last:
+            steps.append((i * duration / ticks, volume))
+            last = volume
+    return steps
+
+
+@stats.instrument(*MIXER_METHODS)
 class Mixer(object):
 
     @staticmethod
-    def create(device_name, mixer_name, step_up, step_down, max_volume):
+    def create(device_name, mixer_name, step_up, step_down, max_volume, group=''):
+        ''' Creates the mixer of the platform. With group members the control is the first member of a MixerGroup. '''
+        members = parse_group(group)
+        if members:
+            return MixerGroup([(device_name, mixer_name, 0, 1.0)] + members, step_up, step_down, max_volume)
+        return Mixer._create(device_name, mixer_name, step_up, step_down, max_volume)
+
+    @staticmethod
+    def _create(device_name, mixer_name, step_up, step_down, max_volume):
         if sys.platform.lower().startswith('darwin'):
             return MacOsMixer(device_name, mixer_name, step_up, step_down, max_volume)
         elif sys.platform.lower().startswith('linux'):
+            if Mixer._use_pulse():
+                try:
+                    return PulseMixer(device_name, mixer_name, step_up, step_down, max_volume)
+                except Exception as e:
+                    debug.logError('Sound server not available, using ALSA: %s', e)
+            if libasound.available():
+                try:
+                    return LinuxAlsaNativeMixer(device_name, mixer_name, step_up, step_down, max_volume)
+                except Exception as e:
+                    debug.logError('Native ALSA mixer not available, using amixer: %s', e)
             return LinuxAlsaMixer(device_name, mixer_name, step_up, step_down, max_volume)
         else:
             return Mixer(device_name, mixer_name, step_up, step_down, max_volume)
 
     @staticmethod
-    def _execute(execPath):
-        process = subprocess.Popen(py2_encode(execPath), shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-        stdout_value, stderr_value = process.communicate()
-        stdout_value = stdout_value.decode()
-        stderr_value = stderr_value.decode()
-        retCode = process.returncode
-        if len(stderr_value) > 2:
-            debug.logError(stderr_value)
-        return stdout_value
+    def _use_pulse():
+        backend = config.settings.audio_backend
+        return backend == 'pulse' or (backend == 'auto' and pulse.available())
+
+    # Interval of the volume steps of a fade in seconds
+    FADE_TICK = 0.05
+    # Events within this time after an own change are caused by the change itself
+    OWN_EVENT_TIME = 0.2
 
     @staticmethod
-    def getDevices():
+    def _execute(args, input=None, key=None, timeout=None, cancel=None):
+        ''' Runs a command line given as list and returns its output '''
+        return executor.execute(args, input=input, key=key, timeout=timeout, cancel=cancel)
+
+    @staticmethod
+    def _command(template, **kwargs):
+        return [arg.format(**kwargs) for arg in template]
+
+    @staticmethod
+    def getDevices(useCache=True):
         if sys.platform.lower().startswith('darwin'):
             return MacOsMixer.getDevices()
         elif sys.platform.lower().startswith('linux'):
-            return LinuxAlsaMixer.getDevices()
+            if Mixer._use_pulse():
+                return PulseMixer.getDevices()
+            return LinuxAlsaMixer.getDevices(useCache=useCache)
         else:
             return {}
 
+    @staticmethod
+    def getLevels(device):
+        ''' The current level of the controls of a device: {control: {'volume', 'muted'}}.
+            Empty if getDevices reads them already. '''
+        if sys.platform.lower().startswith('linux') and not Mixer._use_pulse():
+            return LinuxAlsaMixer.getLevels(device)
+        return {}
+
     def __init__(self, device_name, mixer_name, step_up, step_down, max_volume):
         self.device_name = device_name
         self.mixer_name = mixer_name
@@ -65,54 +164,160 @@ class Mixer(object):
         self.max_volume = max_volume
         self.volume = int(max_volume / 2)
         self.muted = False
+        # The state is saved at the end of a fade only
+        self.persist = True
+        self.fade_cancel = threading.Event()
+        # Called when the mixer was changed from outside
+        self.listeners = []
+
+    def addListener(self, callback):
+        ''' The callback is called without arguments when the backend detects a change from outside
+            (after openSession). Not all backends can do this. '''
+        self.listeners.append(callback)
+
+    def _notify(self):
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as e:
+                debug.logException(e)
+
+    def openSession(self):
+        ''' Keeps a backend process open for following mixer calls '''
+        pass
+
+    def closeSession(self):
+        pass
+
+    def getDeviceNames(self):
+        ''' The devices which the mixer changes '''
+        return [self.device_name]
+
+    def invalidate(self):
+        ''' Forces the next getVolume to read the mixer state '''
+        pass
+
+    def _channel_levels(self):
+        ''' The last known level of each channel in percent, empty if the backend doesn't know them '''
+        return []
 
     def _save_state(self):
-        config.setSetting('last_volume', '%s' % self.volume)
-        config.setSetting('last_muted', 'true' if self.muted else 'false')
+        # The members of a mixer group don't save their state
+        if self.persist:
+            state.get_store().update(self.volume, self.muted)
+            shmstate.write(self.volume, self.muted, self._channel_levels())
 
     def _restore_state(self):
-        self.volume = int('0%s' % config.getSetting('last_volume'))
-        self.muted = True if config.getSetting('last_muted') == 'true' else False
+        ''' Takes the state which a mixer of any process has written last '''
+        snapshot = shmstate.read()
+        if snapshot is not None:
+            volume, muted = snapshot['volume'], snapshot['muted']
+        else:
+            volume, muted = state.get_store().get()
+        if volume is not None:
+            self.volume = volume
+        self.muted = muted
 
     def getVolume(self):
-        debug.logInfo('getVolume: %s' % self.volume)
+        debug.logInfo('getVolume: %s', self.volume)
         return self.volume
 
     def setVolume(self, volume, ignoreLimits=False):
         self.volume = volume if ignoreLimits else min(self.max_volume, volume)
-        debug.logInfo('setVolume: %s' % self.volume)
+        debug.logInfo('setVolume: %s', self.volume)
         return self.volume
 
     def changeVolume(self, step, ignoreLimits=False):
-        debug.logInfo('changeVolume: %s' % step)
+        debug.logInfo('changeVolume: %s', step)
         return self.setVolume(self.getVolume() + step, ignoreLimits)
 
     def volumeUp(self, step=0):
         stepVal = abs(step if step != 0 else self.step_up)
-        debug.logInfo('volumeUp: %s' % stepVal)
+        debug.logInfo('volumeUp: %s', stepVal)
         return self.changeVolume(stepVal)
 
     def volumeDown(self, step=0):
         stepVal = 0 - abs(step if step != 0 else self.step_down)
-        debug.logInfo('volumeDown: %s' % stepVal)
+        debug.logInfo('volumeDown: %s', stepVal)
         return self.changeVolume(stepVal)
 
     def isMuted(self):
-        debug.logInfo('isMuted: %s' % self.muted)
+        debug.logInfo('isMuted: %s', self.muted)
         return self.muted
 
     def setMute(self, mute):
-        debug.logInfo('setMute: %s' % mute)
+        debug.logInfo('setMute: %s', mute)
         self.muted = mute
         return self.muted
 
     def muteToggle(self):
         return self.setMute(mute=not self.isMuted())
 
+    def runBatch(self, steps):
+        ''' Applies a list of (command, args) steps with as few backend calls as possible.
+            The state is saved once at the end. '''
+        persist, self.persist = self.persist, False
+        try:
+            self._batch(steps)
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        finally:
+            self.persist = persist
+            self._save_state()
+        debug.logInfo('runBatch: %s steps, %s', len(steps), self.volume)
+        return self.volume
+
+    def _batch(self, steps):
+        for cmd, args in steps:
+            commands.execute(self, cmd, args)
+
+    @staticmethod
+    def _batch_card(members):
+        ''' Applies a list of (mixer, steps) of controls of the same device '''
+        for mixer, steps in members:
+            mixer.runBatch(steps)
+
+    def cancelFade(self):
+        ''' Stops a running fade at its current volume '''
+        self.fade_cancel.set()
+
+    def fadeTo(self, target, duration_ms, curve='linear', cancel=None):
+        ''' Changes the volume to the target in steps over the given time.
+            The fade stops when cancelFade is called or the optional cancel event is set. '''
+        target = max(0, min(self.max_volume, int(target)))
+        if cancel is None:
+            self.fade_cancel = cancel = threading.Event()
+        steps = self._fade_steps(self.getVolume(), target, duration_ms, curve)
+        debug.logInfo('fadeTo: %s -> %s in %s ms (%s)', self.volume, target, duration_ms, curve)
+        persist, self.persist = self.persist, False
+        try:
+            self._fade(steps, cancel)
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        finally:
+            self.persist = persist
+            self._save_state()
+        return self.volume
+
+    def _fade_steps(self, start, target, duration_ms, curve):
+        return fade_steps(start, target, duration_ms, curve, self.FADE_TICK)
+
+    def _fade(self, steps, cancel):
+        begin = time.time()
+        for offset, volume in steps:
+            # Waiting for the planned time of each step keeps the rate fixed if a step is slow
+            if cancel.wait(max(0, begin + offset - time.time())):
+                debug.logInfo('Fade cancelled at %s', self.volume)
+                break
+            self.setVolume(volume)
+
 
+@stats.instrument(*MIXER_METHODS)
 class MacOsMixer(Mixer):
 
-    OSASCRIPT = "osascript -e '%s'"
+    OSASCRIPT = ['osascript', '-e', '{script}']
     MIN_FUNCTION = 'on min(x,y)\n if x <= y\n return x\n else\n return y\n end if\n end min'
     VOLUME_GET = '{device} volume of (get volume settings)'
     VOLUME_SET = 'set volume {device} volume {volume}'
@@ -133,7 +338,7 @@ class MacOsMixer(Mixer):
 
     def getVolume(self):
         try:
-            retval = self._execute(self.OSASCRIPT % self.VOLUME_GET.format(device=self.device_name))
+            retval = self._execute(self._command(self.OSASCRIPT, script=self.VOLUME_GET.format(device=self.device_name)))
             self.volume = int('0%s' % retval)
             self._save_state()
         except Exception as e:
@@ -147,9 +352,9 @@ class MacOsMixer(Mixer):
             cmds = [self.VOLUME_SET.format(device=self.device_name, volume=newVolume),
                     self.VOLUME_GET.format(device=self.device_name)
                     ]
-            retval = self._execute(self.OSASCRIPT % '\n'.join(cmds))
+            retval = self._execute(self._command(self.OSASCRIPT, script='\n'.join(cmds)))
             self.volume = int('0%s' % retval)
-            debug.logInfo('setVolume: %s' % self.volume)
+            debug.logInfo('setVolume: %s', self.volume)
             self._save_state()
         except Exception as e:
             debug.logException(e)
@@ -164,9 +369,9 @@ class MacOsMixer(Mixer):
                     self.VOLUME_CHANGE.format(device=self.device_name, max_volume=self.max_volume, sign=sign, step=uStep),
                     self.VOLUME_GET.format(device=self.device_name)
                     ]
-            retval = self._execute(self.OSASCRIPT % '\n'.join(cmds))
+            retval = self._execute(self._command(self.OSASCRIPT, script='\n'.join(cmds)))
             self.volume = int('0%s' % retval)
-            debug.logInfo('changeVolume: %s (%s)' % (self.volume, step))
+            debug.logInfo('changeVolume: %s (%s)', self.volume, step)
             self.muted = False
             self._save_state()
         except Exception as e:
@@ -176,13 +381,13 @@ class MacOsMixer(Mixer):
 
     def isMuted(self):
         try:
-            retval = self._execute(self.OSASCRIPT % self.MUTE_GET.format(device=self.device_name))
+            retval = self._execute(self._command(self.OSASCRIPT, script=self.MUTE_GET.format(device=self.device_name)))
             self.muted = retval.lower().find('true') >= 0
             self._save_state()
         except Exception as e:
             debug.logException(e)
             traceback.print_exc()
-        debug.logInfo('isMuted: %s' % self.muted)
+        debug.logInfo('isMuted: %s', self.muted)
         return self.muted
 
     def setMute(self, mute):
@@ -190,93 +395,378 @@ class MacOsMixer(Mixer):
             cmds = [self.MUTE_SET.format(device=self.device_name, mute='True' if mute else 'False'),
                     self.MUTE_GET.format(device=self.device_name)
                     ]
-            retval = self._execute(self.OSASCRIPT % '\n'.join(cmds))
+            retval = self._execute(self._command(self.OSASCRIPT, script='\n'.join(cmds)))
             self.muted = True if retval.lower().find('true') >= 0 else False
             self._save_state()
         except Exception as e:
             debug.logException(e)
             traceback.print_exc()
-        debug.logInfo('setMute: %s' % self.muted)
+        debug.logInfo('setMute: %s', self.muted)
         return self.muted
 
+    RESULT_GET = '{{{device} volume of (get volume settings), {device} muted of (get volume settings)}}'
+
+    @staticmethod
+    def _fade_script(device, steps):
+        ''' Returns the osascript lines which set the volume of each step after a delay '''
+        cmds = []
+        last = 0
+        for offset, volume in steps:
+            if offset > last:
+                cmds.append('delay %s' % round(offset - last, 3))
+                last = offset
+            cmds.append(MacOsMixer.VOLUME_SET.format(device=device, volume=volume))
+        return cmds
+
+    def _batch(self, steps):
+        ''' Joins the steps into one osascript program '''
+        cmds = [self.MIN_FUNCTION]
+        for cmd, args in steps:
+            if cmd in commands.STEP_COMMANDS:
+                step = commands.get_step(self, cmd, args)
+                cmds.append(self.VOLUME_CHANGE.format(device=self.device_name, max_volume=self.max_volume,
+                                                      sign='+' if step >= 0 else '-', step=abs(step)))
+            elif cmd == 'set':
+                volume = commands.get_arg_int(args, 0, default=self.volume)
+                cmds.append(self.VOLUME_SET.format(device=self.device_name, volume=min(self.max_volume, abs(volume))))
+            elif cmd == 'mute':
+                mute = commands.get_arg(args, 0, default='true' if self.muted else 'false').lower() == 'true'
+                cmds.append(self.MUTE_SET.format(device=self.device_name, mute='True' if mute else 'False'))
+            elif cmd == 'mutetoggle':
+                cmds.append(self.MUTE_TOGGLE.format(device=self.device_name))
+        cmds.append(self.RESULT_GET.format(device=self.device_name))
+        retval = self._execute(self._command(self.OSASCRIPT, script='\n'.join(cmds)))
+        volume, _, muted = retval.partition(',')
+        self.volume = int('0%s' % volume.strip())
+        self.muted = muted.lower().find('true') >= 0
+
+    def _fade(self, steps, cancel):
+        ''' Runs the whole fade in one osascript which waits between the steps '''
+        if not steps:
+            return
+        cmds = self._fade_script(self.device_name, steps)
+        cmds.append(self.VOLUME_GET.format(device=self.device_name))
+        try:
+            retval = self._execute(self._command(self.OSASCRIPT, script='\n'.join(cmds)),
+                                   timeout=steps[-1][0] + executor.getTimeout(), cancel=cancel)
+            self.volume = int('0%s' % retval)
+        except ExecuteCancelled:
+            debug.logInfo('Fade cancelled')
+            self.getVolume()
+
     def muteToggle(self):
         try:
             cmds = [self.MUTE_TOGGLE.format(device=self.device_name),
                     self.MUTE_GET.format(device=self.device_name)
                     ]
-            retval = self._execute(self.OSASCRIPT % '\n'.join(cmds))
+            retval = self._execute(self._command(self.OSASCRIPT, script='\n'.join(cmds)))
             self.muted = retval.lower().find('true') >= 0
             self._save_state()
         except Exception as e:
             debug.logException(e)
             traceback.print_exc()
-        debug.logInfo('muteToggle: %s' % self.muted)
+        debug.logInfo('muteToggle: %s', self.muted)
         return self.muted
 
 
+@stats.instrument(*MIXER_METHODS)
 class LinuxAlsaMixer(Mixer):
 
-    DEVICES = "cat /proc/asound/cards"
-    SIMPLE_CONTROLS = "amixer -c '{device}' scontrols"
-    MIXER_GET = "amixer -c '{device}' get '{mixer}'"
-    MIXER_SET = "amixer -c '{device}' set '{mixer}' {value}"
+    DEVICES = "/proc/asound/cards"
+    DEVICE_NODES = "/dev/snd"
+    DEVICE_CACHE = "devices.json"
+    SIMPLE_CONTENTS = ['amixer', '-c', '{device}', 'scontents']
+    MIXER_GET = ['amixer', '-c', '{device}', 'get', '{mixer}']
+    MIXER_SET = ['amixer', '-c', '{device}', 'set', '{mixer}', '{value}']
+    MIXER_SCRIPT = ['amixer', '-c', '{device}', '-s']
 
     @staticmethod
-    def getDevices():
+    def _devices_signature(cards):
+        ''' Changes if a card is added or removed '''
+        import hashlib
+        nodes = []
         try:
-            devices = {}
-            r = re.compile(r'^.+\[(?P<device>.+)\]\:\s(?P<name>.+)$')
-            retval = Mixer._execute(LinuxAlsaMixer.DEVICES)
-            lines = retval.split('\n')
-            for line in lines:
-                try:
-                    g = r.match(line).groupdict()
-                    devices[g['device'].strip()] = {'name': g['name'], 'mixer': []}
-                except:
-                    pass
-            device_keys = devices.keys()
-            r = re.compile(r"^.+\s'(?P<name>.+)',\d+$")
-            for key in device_keys:
-                retval = Mixer._execute(LinuxAlsaMixer.SIMPLE_CONTROLS.format(device=key))
-                lines = retval.split('\n')
-                for line in lines:
-                    try:
-                        g = r.match(line).groupdict()
-                        devices[key]['mixer'].append(g['name'])
-                    except:
-                        pass
+            for name in sorted(os.listdir(LinuxAlsaMixer.DEVICE_NODES)):
+                st = os.stat(os.path.join(LinuxAlsaMixer.DEVICE_NODES, name))
+                nodes.append('%s:%s:%s' % (name, st.st_ino, int(st.st_ctime)))
+        except OSError:
+            pass
+        return hashlib.md5('\n'.join([cards] + nodes).encode('utf-8')).hexdigest()
+
+    # Only these values of a control are kept in the device cache, the levels change
+    CACHED_VALUES = ['capabilities', 'channels']
+
+    @staticmethod
+    def _read_controls(device, info):
+        ''' Reads all simple controls of a card with their current level in one amixer call '''
+        try:
+            retval = Mixer._execute(Mixer._command(LinuxAlsaMixer.SIMPLE_CONTENTS, device=device), key='amixer:%s' % device)
+        except Exception as e:
+            debug.logError('Failed to read the controls of %s: %s', device, e)
+            return
+        LinuxAlsaMixer._add_controls(info, retval)
+
+    @staticmethod
+    def _add_controls(info, output):
+        for control in parse_status(output):
+            info['mixer'].append(control.name)
+            info['controls'][control.name] = {'capabilities': control.capabilities,
+                                              'volume': control.volume, 'muted': control.muted,
+                                              'channels': len(control.channels())}
+
+    @staticmethod
+    def _parse_cards(cards):
+        ''' Returns the devices of the /proc/asound/cards text without their controls '''
+        devices = {}
+        r = re.compile(r'^.+\[(?P<device>.+)\]\:\s(?P<name>.+)$')
+        for line in cards.split('\n'):
+            m = r.match(line)
+            if m:
+                devices[m.group('device').strip()] = {'name': m.group('name'), 'mixer': [], 'controls': {}}
+        return devices
+
+    @staticmethod
+    def _without_levels(devices):
+        result = {}
+        for key, info in devices.items():
+            controls = dict((name, dict((k, v) for k, v in control.items() if k in LinuxAlsaMixer.CACHED_VALUES))
+                            for name, control in info.get('controls', {}).items())
+            result[key] = dict(info, controls=controls)
+        return result
+
+    @staticmethod
+    def getDevices(useCache=True):
+        devices = {}
+        try:
+            with open(LinuxAlsaMixer.DEVICES) as f:
+                cards = f.read()
+            signature = LinuxAlsaMixer._devices_signature(cards)
+            cache_file = storage.profile_path(LinuxAlsaMixer.DEVICE_CACHE)
+            if useCache:
+                cache = storage.load_json(cache_file, default={})
+                if cache.get('signature') == signature:
+                    debug.logInfo('Using cached device list')
+                    # Caches of older versions have levels too
+                    return LinuxAlsaMixer._without_levels(cache['devices'])
+            devices = LinuxAlsaMixer._parse_cards(cards)
+            # Query all cards at the same time
+            threads = [threading.Thread(target=LinuxAlsaMixer._read_controls, args=(key, devices[key])) for key in devices]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            storage.save_json(cache_file, {'signature': signature, 'devices': LinuxAlsaMixer._without_levels(devices)})
         except Exception as e:
             debug.logException(e)
             traceback.print_exc()
         return devices
 
+    @staticmethod
+    def getLevels(device):
+        info = {'mixer': [], 'controls': {}}
+        LinuxAlsaMixer._read_controls(device, info)
+        return dict((name, {'volume': control['volume'], 'muted': control['muted']})
+                    for name, control in info['controls'].items())
+
     def __init__(self, device_name, mixer_name, step_up, step_down, max_volume):
         Mixer.__init__(self, device_name, mixer_name, step_up, step_down, max_volume)
         self._restore_state()
-        self.pattern = re.compile(r'^.+Playback\s\d+\s\[(?P<volume>[\d\.\+\-]+)%\]\s\[.+\].*$')
+        # Full state of the control from the last amixer output
+        self.status = None
+        self.key = 'amixer:%s' % device_name
+        self.session = None
+        self.watcher = None
+        # Time of the last state which was read from or written to amixer
+        self.state_time = 0
+        self.own_change_time = 0
+        self.cache_time = config.settings.cache_time / 1000.0
+        # Lookup table of the volume curve, None for the percent of amixer
+        self.curve = self._load_curve(config.settings.volume_curve)
+
+    def _load_curve(self, kind):
+        return curves.get_curve(self.device_name, self.mixer_name, kind)
+
+    def openSession(self):
+        if self.session is None:
+            self.session = AmixerSession(self.device_name, timeout=executor.getTimeout())
+        if self.cache_time > 0 or self.listeners:
+            self._start_watcher()
+
+    def _start_watcher(self):
+        if self.watcher is None:
+            self.watcher = MixerEventWatcher(self.device_name, self._on_mixer_event)
+            self.watcher.start()
+
+    def _stop_watcher(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def closeSession(self):
+        self._stop_watcher()
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def _batch_values(self, steps):
+        ''' Converts the steps to amixer values. The expected volume is followed to keep the limit. '''
+        values = []
+        volume = self.volume
+        for cmd, args in steps:
+            if cmd in commands.STEP_COMMANDS and self.curve is not None:
+                step = commands.get_step(self, cmd, args)
+                volume, value = self._curve_step(volume, step)
+                values.append(value)
+            elif cmd in commands.STEP_COMMANDS:
+                step = commands.get_step(self, cmd, args)
+                if volume + step > self.max_volume:
+                    volume = self.max_volume
+                    values.append('%s%%' % volume)
+                else:
+                    volume = max(0, volume + step)
+                    values.append('%s%%%s' % (abs(step), '+' if step >= 0 else '-'))
+            elif cmd == 'set':
+                volume = min(self.max_volume, abs(commands.get_arg_int(args, 0, default=volume)))
+                values.append(self._balanced_value(volume))
+            elif cmd == 'mute':
+                mute = commands.get_arg(args, 0, default='true' if self.muted else 'false').lower() == 'true'
+                values.append('off' if mute else 'on')
+            elif cmd == 'mutetoggle':
+                values.append('toggle')
+        return values
+
+    def _script(self, lines):
+        ''' Sends amixer commands through the session if it is open, or as one stdin script.
+            Returns the output of all commands. '''
+        self.own_change_time = time.time()
+        output = []
+        if self.session is not None and self.session.isUsable():
+            try:
+                while lines:
+                    output.append(self.session.execute(lines[0]))
+                    lines.pop(0)
+                return '\n'.join(output)
+            except Exception as e:
+                debug.logError('amixer session failed: %s', e)
+        output.append(self._execute(self._command(self.MIXER_SCRIPT, device=self.device_name),
+                                    input=''.join(line + '\n' for line in lines), key=self.key))
+        return '\n'.join(output)
+
+    def _batch(self, steps):
+        ''' Sends all steps as one amixer stdin script, or through the session if it is open '''
+        lines = ["sset '%s' %s" % (self.mixer_name, value) for value in self._batch_values(steps)]
+        if lines:
+            self._parse_result(self._script(lines))
+
+    @staticmethod
+    def _batch_card(members):
+        ''' Sends the steps of all controls of the card in one amixer call '''
+        lines = []
+        for mixer, steps in members:
+            lines.extend("sset '%s' %s" % (mixer.mixer_name, value) for value in mixer._batch_values(steps))
+            mixer.own_change_time = time.time()
+        if not lines:
+            return
+        output = members[0][0]._script(lines)
+        for mixer, steps in members:
+            mixer._parse_result(output)
+
+    def _fade(self, steps, cancel):
+        ''' Streams the steps of the fade through one amixer session '''
+        opened = self.session is None
+        if opened:
+            self.session = AmixerSession(self.device_name, timeout=executor.getTimeout())
+        try:
+            Mixer._fade(self, steps, cancel)
+        finally:
+            if opened:
+                self.session.close()
+                self.session = None
+
+    def _on_mixer_event(self, name):
+        if name is None or name == self.mixer_name:
+            if name is None or time.time() - self.own_change_time > self.OWN_EVENT_TIME:
+                debug.logInfo('Mixer %s was changed outside', self.mixer_name)
+                self.invalidate()
+                self._notify()
+
+    def invalidate(self):
+        ''' Forces the next getVolume to read the mixer state '''
+        self.state_time = 0
+        self.status = None
+
+    def _is_cached(self):
+        return self.cache_time > 0 and time.time() - self.state_time <= self.cache_time
+
+    def _set(self, value):
+        ''' Sets a mixer value with the amixer session if available '''
+        if self.session is not None and self.session.isUsable():
+            try:
+                self.own_change_time = time.time()
+                return self.session.execute("sset '%s' %s" % (self.mixer_name, value))
+            except Exception as e:
+                debug.logError('amixer session failed: %s', e)
+        self.own_change_time = time.time()
+        return self._execute(self._command(self.MIXER_SET, device=self.device_name, mixer=self.mixer_name, value=value),
+                             key=self.key)
 
     def _parse_result(self, result):
         try:
-            ok = False
-            lines = result.split('\n')
-            for line in lines:
-                m = self.pattern.match(line)
-                if m:
-                    g = m.groupdict()
-                    if g:
-                        self.volume = int(g['volume'])
-                        self.muted = True if '[off]' in line else False if '[on]' in line else self.muted
-                        self._save_state()
-                        ok = True
-                        break
+            # The output of a script has a status for each command, the last one is current
+            for control in reversed(parse_status(result)):
+                if control.name != self.mixer_name or control.volume is None:
+                    continue
+                self.status = control
+                self.volume = self._curve_percent(control) if self.curve is not None else control.volume
+                if control.muted is not None:
+                    self.muted = control.muted
+                self._save_state()
+                self.state_time = time.time()
+                return True
         except Exception as e:
             debug.logException(e)
             traceback.print_exc()
-        return ok
+        return False
+
+    def _channel_levels(self):
+        if self.status is None:
+            return []
+        if self.curve is not None:
+            return [self.curve.percent(ch.raw) for ch in self.status.channels() if ch.raw is not None]
+        return [ch.percent for ch in self.status.channels() if ch.percent is not None]
+
+    def _curve_percent(self, control):
+        if control.max is not None and control.max != self.curve.max:
+            # Another card got the device name, its range is read again
+            self.curve = curves.get_curve(self.device_name, self.mixer_name, self.curve.kind, reload=True) or self.curve
+        return self.curve.percent(control.raw, hint=self.volume)
+
+    def _curve_step(self, volume, step, ignoreLimits=False):
+        ''' Returns the volume after a step on the curve and its amixer value.
+            The value is absolute if the channels are known, otherwise a raw difference. '''
+        target = self.curve.step(volume, step, 100 if ignoreLimits else self.max_volume)
+        if self.status is not None:
+            return target, self._balanced_value(target)
+        delta = self.curve.raw(target) - self.curve.raw(volume)
+        return target, '%s%s' % (abs(delta), '+' if delta >= 0 else '-')
+
+    def _balanced_value(self, volume):
+        ''' Keeps the balance of the channels: the loudest channel gets the volume, the others are scaled '''
+        if self.curve is not None:
+            raw = self.curve.raw(volume)
+            if self.status is None or self.status.isBalanced() or not self.status.raw:
+                return '%s' % raw
+            return ','.join('%s' % int(round((ch.raw or 0) * raw / float(self.status.raw))) for ch in self.status.channels())
+        if self.status is None:
+            return '%s%%' % volume
+        return self.status.balancedValue(volume)
 
     def getVolume(self):
+        if self._is_cached():
+            return Mixer.getVolume(self)
         try:
-            retval = self._execute(self.MIXER_GET.format(device=self.device_name, mixer=self.mixer_name))
+            retval = self._execute(self._command(self.MIXER_GET, device=self.device_name, mixer=self.mixer_name),
+                                   key=self.key)
             self._parse_result(retval)
         except Exception as e:
             debug.logException(e)
@@ -286,49 +776,504 @@ class LinuxAlsaMixer(Mixer):
     def setVolume(self, volume, ignoreLimits=False):
         self.volume = abs(int(volume if ignoreLimits else min(self.max_volume, volume)))
         try:
-            retval = self._execute(self.MIXER_SET.format(device=self.device_name, mixer=self.mixer_name, value='%s%%' % self.volume))
+            retval = self._set(self._balanced_value(self.volume))
             self._parse_result(retval)
         except Exception as e:
             debug.logException(e)
             traceback.print_exc()
-        debug.logInfo('setVolume: %s' % self.volume)
+        debug.logInfo('setVolume: %s', self.volume)
         return self.volume
 
     def changeVolume(self, step, ignoreLimits=False):
-        if not ignoreLimits and self.volume + step > self.max_volume:
+        if self.curve is None and not ignoreLimits and self.volume + step > self.max_volume:
             return self.setVolume(self.max_volume, ignoreLimits=ignoreLimits)
         try:
-            sign = '+' if step >= 0 else '-'
-            uStep = abs(int(step))
-            retval = self._execute(self.MIXER_SET.format(device=self.device_name, mixer=self.mixer_name, value='%s%%%s' % (uStep, sign)))
+            if self.curve is not None:
+                self.volume, value = self._curve_step(self.volume, int(step), ignoreLimits)
+            else:
+                value = '%s%%%s' % (abs(int(step)), '+' if step >= 0 else '-')
+            retval = self._set(value)
             self._parse_result(retval)
         except Exception as e:
             debug.logException(e)
             traceback.print_exc()
-        debug.logInfo('changeVolume: %s (%s)' % (self.volume, step))
+        debug.logInfo('changeVolume: %s (%s)', self.volume, step)
         return self.volume
 
     def isMuted(self):
         self.getVolume()
-        debug.logInfo('isMuted: %s' % self.muted)
+        debug.logInfo('isMuted: %s', self.muted)
         return self.muted
 
     def setMute(self, mute):
         try:
-            retval = self._execute(self.MIXER_SET.format(device=self.device_name, mixer=self.mixer_name, value='off' if mute else 'on'))
+            retval = self._set('off' if mute else 'on')
             self._parse_result(retval)
         except Exception as e:
             debug.logException(e)
             traceback.print_exc()
-        debug.logInfo('muteToggle: %s' % self.muted)
+        debug.logInfo('muteToggle: %s', self.muted)
         return self.muted
 
     def muteToggle(self):
         try:
-            retval = self._execute(self.MIXER_SET.format(device=self.device_name, mixer=self.mixer_name, value='toggle'))
+            # amixer toggles each channel, so a partly muted control is muted completely
+            partly = self.status is not None and self.status.isPartlyMuted()
+            retval = self._set('off' if partly else 'toggle')
             self._parse_result(retval)
         except Exception as e:
             debug.logException(e)
             traceback.print_exc()
-        debug.logInfo('muteToggle: %s' % self.muted)
+        debug.logInfo('muteToggle: %s', self.muted)
+        return self.muted
+
+
+@stats.instrument(*MIXER_METHODS)
+class LinuxAlsaNativeMixer(LinuxAlsaMixer):
+    ''' ALSA mixer which calls the simple mixer API of libasound instead of amixer '''
+
+    def __init__(self, device_name, mixer_name, step_up, step_down, max_volume):
+        self.control = libasound.SimpleControl(libasound.ctl_name(device_name), mixer_name)
+        LinuxAlsaMixer.__init__(self, device_name, mixer_name, step_up, step_down, max_volume)
+
+    def _load_curve(self, kind):
+        # The library knows the range and the dB level of each raw value
+        if kind not in curves.CURVES or kind == 'amixer':
+            return None
+        return curves.VolumeCurve(kind, self.control.min, self.control.max, self.control.getDbFunction())
+
+    def openSession(self):
+        # The control stays open anyway, events are only watched for the listeners
+        if self.listeners:
+            self._start_watcher()
+
+    def closeSession(self):
+        self._stop_watcher()
+
+    def _batch(self, steps):
+        # Library calls are cheap, the steps are applied one by one
+        Mixer._batch(self, steps)
+
+    @staticmethod
+    def _batch_card(members):
+        Mixer._batch_card(members)
+
+    def _fade(self, steps, cancel):
+        # Each step is a library call, no session needed
+        Mixer._fade(self, steps, cancel)
+
+    def _channel_levels(self):
+        if self.curve is not None:
+            return [self.curve.percent(raw) for raw in self.control.getRaw()]
+        return [self.control.toPercent(raw) for raw in self.control.getRaw()]
+
+    def _read_state(self):
+        if self.curve is not None:
+            self.volume = self.curve.percent(max(self.control.getRaw()), hint=self.volume)
+        else:
+            self.volume = self.control.getPercent()
+        self.muted = not self.control.getSwitch()
+        self._save_state()
+
+    def getVolume(self):
+        try:
+            self.control.update()
+            self._read_state()
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        return Mixer.getVolume(self)
+
+    def setVolume(self, volume, ignoreLimits=False):
+        self.volume = abs(int(volume if ignoreLimits else min(self.max_volume, volume)))
+        try:
+            if self.curve is not None:
+                self.control.setRaw(self.curve.raw(self.volume))
+            else:
+                self.control.setPercent(self.volume)
+            self._read_state()
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        debug.logInfo('setVolume: %s', self.volume)
+        return self.volume
+
+    def changeVolume(self, step, ignoreLimits=False):
+        try:
+            self.control.update()
+            if self.curve is not None:
+                self._read_state()
+                target = self.curve.step(self.volume, int(step), 100 if ignoreLimits else self.max_volume)
+                return self.setVolume(target, ignoreLimits=True)
+            self.volume = self.control.getPercent()
+            if not ignoreLimits and self.volume + step > self.max_volume:
+                return self.setVolume(self.max_volume, ignoreLimits=ignoreLimits)
+            self.control.changePercent(int(step))
+            self._read_state()
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        debug.logInfo('changeVolume: %s (%s)', self.volume, step)
+        return self.volume
+
+    def setMute(self, mute):
+        try:
+            self.control.setSwitch(not mute)
+            self._read_state()
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        debug.logInfo('setMute: %s', self.muted)
         return self.muted
+
+    def muteToggle(self):
+        try:
+            self.control.update()
+            self.control.setSwitch(not self.control.getSwitch())
+            self._read_state()
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        debug.logInfo('muteToggle: %s', self.muted)
+        return self.muted
+
+#------------------------------------------------------------------------------
+# Sinks of PulseAudio or PipeWire
+#------------------------------------------------------------------------------
+
+@stats.instrument(*MIXER_METHODS)
+class PulseMixer(Mixer):
+    ''' Volume of a PulseAudio or PipeWire sink, changed over one connection to the sound server.
+
+    No process is started for a call. In a session the mixer subscribes to the sink
+    events, so the sink is only read again after it was changed from outside.
+    '''
+
+    CONTROL = 'Volume'
+    # Device names of the default sink
+    DEFAULT_NAMES = ['', 'default', 'output']
+
+    @staticmethod
+    def getDevices():
+        devices = {}
+        connection = pulse.PulseConnection(timeout=executor.getTimeout())
+        try:
+            connection.connect()
+            default = connection.getSink(pulse.DEFAULT_SINK)
+            sinks = [dict(default, name='default', description='Default (%s)' % default['description'])]
+            sinks.extend(connection.getSinks())
+        except Exception as e:
+            debug.logError('Failed to read the sinks: %s', e)
+            return devices
+        finally:
+            connection.close()
+        for sink in sinks:
+            control = {'capabilities': ['volume', 'switch'], 'volume': pulse.to_percent(sink['volume']),
+                       'muted': sink['muted'], 'channels': sink['channels']}
+            devices[sink['name']] = {'name': sink['description'], 'mixer': [PulseMixer.CONTROL],
+                                     'controls': {PulseMixer.CONTROL: control}}
+        return devices
+
+    def __init__(self, device_name, mixer_name, step_up, step_down, max_volume):
+        Mixer.__init__(self, device_name, mixer_name, step_up, step_down, max_volume)
+        self._restore_state()
+        self.sink_name = pulse.DEFAULT_SINK if device_name in self.DEFAULT_NAMES else device_name
+        # Last state of the sink {'index', 'volume', 'muted', ...}, kept current by the events in a session
+        self.sink = None
+        self.sink_time = 0
+        self.own_change_time = 0
+        self.cache_time = config.settings.cache_time / 1000.0
+        self.session_open = False
+        # Set while a batch or fade follows the known state
+        self.hold = False
+        self.connection = None
+        self._connect()
+
+    def _connect(self):
+        ''' Returns the connection, a lost connection is opened again '''
+        if self.connection is None or not self.connection.isConnected():
+            self.sink = None
+            self.connection = pulse.PulseConnection(timeout=executor.getTimeout(), on_event=self._on_event)
+            self.connection.connect()
+            if self.session_open:
+                self._subscribe()
+        return self.connection
+
+    def _subscribe(self):
+        mask = pulse.SUBSCRIPTION_MASK_SINK
+        if self.sink_name == pulse.DEFAULT_SINK:
+            # The server reports a change of the default sink
+            mask |= pulse.SUBSCRIPTION_MASK_SERVER
+        self.connection.subscribe(mask)
+
+    def openSession(self):
+        if not self.session_open:
+            self.session_open = True
+            try:
+                self.sink = None
+                if self.connection.isConnected():
+                    self._subscribe()
+                else:
+                    self._connect()
+            except Exception as e:
+                debug.logError('Failed to subscribe to the sink events: %s', e)
+
+    def closeSession(self):
+        self.session_open = False
+        self.sink = None
+        if self.connection is not None:
+            self.connection.close()
+
+    def _on_event(self, event, index):
+        if event is None:
+            self.invalidate()
+            self._notify()
+            return
+        facility = event & pulse.SUBSCRIPTION_FACILITY_MASK
+        sink = self.sink
+        if facility == pulse.SUBSCRIPTION_FACILITY_SINK and sink is not None and index != sink['index']:
+            return
+        if facility in (pulse.SUBSCRIPTION_FACILITY_SINK, pulse.SUBSCRIPTION_FACILITY_SERVER):
+            if time.time() - self.own_change_time > self.OWN_EVENT_TIME:
+                debug.logInfo('Sink %s was changed outside', self.sink_name)
+                self.invalidate()
+                self._notify()
+
+    def invalidate(self):
+        self.sink = None
+
+    def _is_cached(self):
+        return self.sink is not None and (self.session_open or self.hold or
+                                          time.time() - self.sink_time <= self.cache_time)
+
+    def _channel_levels(self):
+        if self.sink is None:
+            return []
+        return [pulse.to_percent([value]) for value in self.sink['volume']]
+
+    def _take(self, sink):
+        self.sink = sink
+        self.sink_time = time.time()
+        self.volume = pulse.to_percent(sink['volume'])
+        self.muted = sink['muted']
+        self._save_state()
+
+    def _read(self):
+        ''' Returns the state of the sink, it is read from the server if it isn't known '''
+        if self._is_cached():
+            return self.sink
+        sink = self._connect().getSink(self.sink_name)
+        self._take(sink)
+        return sink
+
+    def _write_mute(self, mute):
+        sink = self._read()
+        self.own_change_time = time.time()
+        self._connect().setSinkMute(sink['index'], mute)
+        self._take(dict(sink, muted=mute))
+
+    def _batch(self, steps):
+        # The sink is read once, the steps follow the known state
+        self.hold = True
+        try:
+            Mixer._batch(self, steps)
+        finally:
+            self.hold = False
+
+    def _fade(self, steps, cancel):
+        self.hold = True
+        try:
+            Mixer._fade(self, steps, cancel)
+        finally:
+            self.hold = False
+
+    def getVolume(self):
+        try:
+            self._read()
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        return Mixer.getVolume(self)
+
+    def setVolume(self, volume, ignoreLimits=False):
+        volume = max(0, int(volume if ignoreLimits else min(self.max_volume, volume)))
+        try:
+            sink = self._read()
+            values = pulse.from_percent(volume, sink['volume'])
+            self.own_change_time = time.time()
+            self._connect().setSinkVolume(sink['index'], values)
+            self._take(dict(sink, volume=values))
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        debug.logInfo('setVolume: %s', self.volume)
+        return self.volume
+
+    def isMuted(self):
+        self.getVolume()
+        debug.logInfo('isMuted: %s', self.muted)
+        return self.muted
+
+    def setMute(self, mute):
+        try:
+            self._write_mute(mute)
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        debug.logInfo('setMute: %s', self.muted)
+        return self.muted
+
+    def muteToggle(self):
+        try:
+            self._write_mute(not self._read()['muted'])
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+        debug.logInfo('muteToggle: %s', self.muted)
+        return self.muted
+
+#------------------------------------------------------------------------------
+# Several controls driven as one volume
+#------------------------------------------------------------------------------
+
+class GroupMember(object):
+    ''' A control of a mixer group, its volume is the volume of the group * scale + offset '''
+
+    def __init__(self, mixer, offset, scale):
+        self.mixer = mixer
+        self.offset = offset
+        self.scale = scale
+
+    def value(self, volume):
+        return max(0, min(self.mixer.max_volume, int(round(volume * self.scale + self.offset))))
+
+
+@stats.instrument(*MIXER_METHODS)
+class MixerGroup(Mixer):
+    ''' Controls of one or more devices which are changed together.
+
+    The first member is the main control, its volume is the volume of the group.
+    Each change is converted to an absolute value per member, so the controls don't
+    drift apart. The controls of a device are changed with one backend call, the
+    devices at the same time. Only the group saves its state.
+    '''
+
+    def __init__(self, members, step_up, step_down, max_volume):
+        Mixer.__init__(self, members[0][0], members[0][1], step_up, step_down, max_volume)
+        self._restore_state()
+        self.members = []
+        for device_name, mixer_name, offset, scale in members:
+            mixer = Mixer._create(device_name, mixer_name, step_up, step_down, max_volume)
+            mixer.persist = False
+            self.members.append(GroupMember(mixer, offset, scale))
+        self.main = self.members[0].mixer
+        self.session_open = False
+
+    def addListener(self, callback):
+        if not self.listeners:
+            for member in self.members:
+                member.mixer.addListener(self._notify)
+        Mixer.addListener(self, callback)
+
+    def openSession(self):
+        for member in self.members:
+            member.mixer.openSession()
+        self.session_open = True
+
+    def closeSession(self):
+        for member in self.members:
+            member.mixer.closeSession()
+        self.session_open = False
+
+    def getDeviceNames(self):
+        names = []
+        for member in self.members:
+            if member.mixer.device_name not in names:
+                names.append(member.mixer.device_name)
+        return names
+
+    def invalidate(self):
+        for member in self.members:
+            member.mixer.invalidate()
+
+    def _channel_levels(self):
+        return self.main._channel_levels()
+
+    def _take_main(self):
+        self.volume = self.main.volume
+        self.muted = self.main.muted
+        self._save_state()
+
+    @staticmethod
+    def _apply_card(members):
+        try:
+            members[0][0]._batch_card(members)
+        except Exception as e:
+            debug.logException(e)
+            traceback.print_exc()
+
+    def _apply(self, steps):
+        ''' Applies the (command, args) steps which the function steps returns for each member '''
+        cards = {}
+        order = []
+        for member in self.members:
+            key = (member.mixer.__class__, member.mixer.device_name)
+            if key not in cards:
+                cards[key] = []
+                order.append(key)
+            cards[key].append((member.mixer, steps(member)))
+        threads = [threading.Thread(target=self._apply_card, args=(cards[key],)) for key in order[1:]]
+        for thread in threads:
+            thread.start()
+        self._apply_card(cards[order[0]])
+        for thread in threads:
+            thread.join()
+        self._take_main()
+
+    def getVolume(self):
+        self.main.getVolume()
+        self._take_main()
+        return Mixer.getVolume(self)
+
+    def isMuted(self):
+        self.main.isMuted()
+        self._take_main()
+        return Mixer.isMuted(self)
+
+    def setVolume(self, volume, ignoreLimits=False):
+        volume = max(0, int(volume if ignoreLimits else min(self.max_volume, volume)))
+        self._apply(lambda member: [('set', ['%s' % member.value(volume)])])
+        debug.logInfo('setVolume: %s', self.volume)
+        return self.volume
+
+    def setMute(self, mute):
+        value = 'true' if mute else 'false'
+        self._apply(lambda member: [('mute', [value])])
+        debug.logInfo('setMute: %s', self.muted)
+        return self.muted
+
+    def _batch(self, steps):
+        ''' Follows the steps to the resulting state, which is applied to all members at once '''
+        volume, muted = self.getVolume(), self.muted
+        for cmd, args in steps:
+            if cmd in commands.STEP_COMMANDS:
+                volume = max(0, min(self.max_volume, volume + commands.get_step(self, cmd, args)))
+            elif cmd == 'set':
+                volume = min(self.max_volume, abs(commands.get_arg_int(args, 0, default=volume)))
+            elif cmd == 'mute':
+                muted = commands.get_arg(args, 0, default='true' if muted else 'false').lower() == 'true'
+            elif cmd == 'mutetoggle':
+                muted = not muted
+        value = 'true' if muted else 'false'
+        self._apply(lambda member: [('set', ['%s' % member.value(volume)]), ('mute', [value])])
+
+    def _fade(self, steps, cancel):
+        ''' Keeps the backend sessions open during the fade '''
+        opened = not self.session_open
+        if opened:
+            self.openSession()
+        try:
+            Mixer._fade(self, steps, cancel)
+        finally:
+            if opened:
+                self.closeSession()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+from kodi_six import xbmcgui
+from . import debug, commands, stats
+from .config import settings
+
+#------------------------------------------------------------------------------
+# Mixer state as properties of the home window, for skins:
+# $INFO[Window(Home).Property(SysVolume.Volume)] and Window(Home).Property(SysVolume.Muted)
+#------------------------------------------------------------------------------
+
+HOME_WINDOW = 10000
+PROPERTY_PREFIX = 'SysVolume.'
+PROPERTIES = ['Volume', 'Muted', 'Device', 'Mixer']
+
+# Values set by this process, unchanged values are not set again
+_published = {}
+_published_lock = threading.Lock()
+
+
+def publish(volume, muted):
+    values = {'Volume': '%s' % volume, 'Muted': 'true' if muted else 'false',
+              'Device': settings.device_name, 'Mixer': settings.mixer_name}
+    with _published_lock:
+        window = None
+        for key in PROPERTIES:
+            if _published.get(key) != values[key]:
+                window = window or xbmcgui.Window(HOME_WINDOW)
+                window.setProperty(PROPERTY_PREFIX + key, values[key])
+                _published[key] = values[key]
+
+def clear():
+    with _published_lock:
+        window = xbmcgui.Window(HOME_WINDOW)
+        for key in PROPERTIES:
+            window.clearProperty(PROPERTY_PREFIX + key)
+        _published.clear()
+
+
+class StateMonitor(object):
+    ''' Publishes the state of the service mixer when it was changed from outside Kodi.
+
+    The mixer reports changes of its control from its event watcher (amixer sevents).
+    The events of a storm, e.g. while a volume knob is turned, are combined into one
+    read of the control after a short delay.
+    '''
+
+    DEBOUNCE_TIME = 0.1
+
+    def __init__(self, mixer, lock):
+        self.mixer = mixer
+        self.lock = lock
+        self.timer = None
+        self.timer_lock = threading.Lock()
+        mixer.addListener(self.onMixerEvent)
+
+    def onMixerEvent(self):
+        with self.timer_lock:
+            if self.timer is None:
+                self.timer = threading.Timer(self.DEBOUNCE_TIME, self.refresh)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def refresh(self):
+        ''' Reads the mixer state and publishes it '''
+        with self.timer_lock:
+            self.timer = None
+        try:
+            with self.lock:
+                self.mixer.getVolume()
+                reply = commands.state(self.mixer)
+            publish(reply['volume'], reply['muted'])
+            stats.count('monitor_refresh')
+        except Exception as e:
+            debug.logException(e, 'Failed to publish the mixer state')
+
+    def stop(self):
+        with self.timer_lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        clear()
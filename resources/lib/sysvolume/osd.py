@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import time
+import json
+import uuid
+import threading
+from kodi_six import xbmc, xbmcgui
+from . import debug
+from .config import settings, _T
+
+#------------------------------------------------------------------------------
+# One progress dialog which shows all volume changes
+#------------------------------------------------------------------------------
+
+HOME_WINDOW = 10000
+# Window properties of the handshake between script instances
+PROPERTY_STATE = 'script.module.sysvolume.osd.state'
+PROPERTY_OWNER = 'script.module.sysvolume.osd.owner'
+# Interval to update the dialog and the heartbeat of the owner
+POLL_TIME = 0.1
+# An owner without heartbeat for this time is gone
+OWNER_TIMEOUT = 1.0
+
+
+def message(volume, muted):
+    return '[%s] %s: %s%% %s' % (settings.device_name, settings.mixer_name, volume, _T(30104) if muted else '')
+
+def display_time():
+    return settings.progress_time / 1000.0
+
+
+class ProgressOsd(object):
+    ''' Progress dialog of the service. Each volume change updates the open dialog
+        and extends its display time, a thread closes it when the time is over. '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dialog = None
+        self.deadline = 0
+
+    def show(self, volume, muted):
+        with self.lock:
+            self.deadline = time.time() + display_time()
+            if self.dialog is None:
+                self.dialog = xbmcgui.DialogProgressBG()
+                self.dialog.create(heading=settings.addon_name)
+                thread = threading.Thread(target=self._closer, name='SysVolumeOsd')
+                thread.daemon = True
+                thread.start()
+            self.dialog.update(percent=volume, message=message(volume, muted))
+
+    def close(self):
+        with self.lock:
+            self.deadline = 0
+            if self.dialog is not None:
+                self.dialog.close()
+                self.dialog = None
+
+    def _closer(self):
+        while True:
+            with self.lock:
+                if self.dialog is None:
+                    return
+                remaining = self.deadline - time.time()
+                if remaining <= 0:
+                    self.dialog.close()
+                    self.dialog = None
+                    return
+            time.sleep(min(remaining, POLL_TIME))
+
+#------------------------------------------------------------------------------
+# Window property handshake, used by the scripts if the service isn't running
+#------------------------------------------------------------------------------
+
+def _read_owner(window):
+    token, _, heartbeat = window.getProperty(PROPERTY_OWNER).partition('|')
+    try:
+        return token, float(heartbeat)
+    except ValueError:
+        return None, 0
+
+def _read_state(window):
+    try:
+        return json.loads(window.getProperty(PROPERTY_STATE))
+    except ValueError:
+        return None
+
+def show_shared(volume, muted):
+    ''' Passes the volume to the script instance which owns the dialog and returns,
+        or becomes the owner and shows the dialog until its display time is over. '''
+    window = xbmcgui.Window(HOME_WINDOW)
+    window.setProperty(PROPERTY_STATE, json.dumps({'volume': volume, 'muted': muted,
+                                                   'deadline': time.time() + display_time()}))
+    token = uuid.uuid4().hex
+    while True:
+        owner, heartbeat = _read_owner(window)
+        if owner and time.time() - heartbeat < OWNER_TIMEOUT:
+            return
+        window.setProperty(PROPERTY_OWNER, '%s|%s' % (token, time.time()))
+        # Another script may have claimed it at the same time, the last one wins
+        xbmc.sleep(int(POLL_TIME * 200))
+        if _read_owner(window)[0] != token:
+            return
+        _run_owner(window, token)
+        # A change which arrived while the dialog was closed is shown again
+        state = _read_state(window)
+        if state is None or state['deadline'] <= time.time():
+            return
+
+def _run_owner(window, token):
+    debug.logInfo('Showing the volume dialog')
+    dialog = xbmcgui.DialogProgressBG()
+    dialog.create(heading=settings.addon_name)
+    shown = None
+    try:
+        while True:
+            state = _read_state(window)
+            if state is None or state['deadline'] <= time.time():
+                break
+            if state != shown:
+                dialog.update(percent=state['volume'], message=message(state['volume'], state['muted']))
+                shown = state
+            window.setProperty(PROPERTY_OWNER, '%s|%s' % (token, time.time()))
+            xbmc.sleep(int(POLL_TIME * 1000))
+    finally:
+        if _read_owner(window)[0] == token:
+            window.clearProperty(PROPERTY_OWNER)
+        dialog.close()
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+''' Client for the native protocol of PulseAudio, which PipeWire (pipewire-pulse) speaks too.
+
+Only the commands for the volume and mute of sinks and the sink events are implemented.
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import socket
+import struct
+import threading
+from . import debug, stats
+
+#------------------------------------------------------------------------------
+# Protocol
+#------------------------------------------------------------------------------
+
+# Version 13 has all needed fields, the server formats its replies for the client version
+PROTOCOL_VERSION = 13
+COMMAND_ERROR = 0
+COMMAND_REPLY = 2
+COMMAND_AUTH = 8
+COMMAND_SET_CLIENT_NAME = 9
+COMMAND_GET_SINK_INFO = 21
+COMMAND_GET_SINK_INFO_LIST = 22
+COMMAND_SUBSCRIBE = 35
+COMMAND_SET_SINK_VOLUME = 36
+COMMAND_SET_SINK_MUTE = 39
+COMMAND_SUBSCRIBE_EVENT = 66
+
+SUBSCRIPTION_MASK_SINK = 0x0001
+SUBSCRIPTION_MASK_SERVER = 0x0080
+SUBSCRIPTION_FACILITY_MASK = 0x000F
+SUBSCRIPTION_FACILITY_SINK = 0x0000
+SUBSCRIPTION_FACILITY_SERVER = 0x0007
+
+VOLUME_NORM = 0x10000
+INVALID_INDEX = 0xFFFFFFFF
+CONTROL_CHANNEL = 0xFFFFFFFF
+COOKIE_LENGTH = 256
+DEFAULT_SINK = '@DEFAULT_SINK@'
+# Values of one sink in the reply for protocol version 13
+SINK_FIELDS = 15
+
+HEADER = struct.Struct('>IIIII')
+
+
+class PulseError(Exception):
+    pass
+
+
+class TagWriter(object):
+    ''' Builds the tag struct of a command '''
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def u32(self, value):
+        self.data += b'L' + struct.pack('>I', value)
+        return self
+
+    def string(self, value):
+        if value is None:
+            self.data += b'N'
+        else:
+            self.data += b't' + value.encode('utf-8') + b'\0'
+        return self
+
+    def boolean(self, value):
+        self.data += b'1' if value else b'0'
+        return self
+
+    def arbitrary(self, value):
+        self.data += b'x' + struct.pack('>I', len(value)) + value
+        return self
+
+    def cvolume(self, values):
+        self.data += b'v' + struct.pack('>B', len(values)) + b''.join(struct.pack('>I', value) for value in values)
+        return self
+
+    def proplist(self, props):
+        self.data += b'P'
+        for key in sorted(props):
+            value = props[key].encode('utf-8') + b'\0'
+            self.string(key).u32(len(value)).arbitrary(value)
+        return self.string(None)
+
+
+def _read_tag(data, pos):
+    tag = bytes(data[pos:pos + 1])
+    pos += 1
+    if tag == b'L' or tag == b'V':
+        return struct.unpack_from('>I', data, pos)[0], pos + 4
+    elif tag == b'B':
+        return data[pos], pos + 1
+    elif tag in (b'U', b'R'):
+        return struct.unpack_from('>Q', data, pos)[0], pos + 8
+    elif tag == b'r':
+        return struct.unpack_from('>q', data, pos)[0], pos + 8
+    elif tag == b'T':
+        return struct.unpack_from('>II', data, pos), pos + 8
+    elif tag == b't':
+        end = data.index(b'\0', pos)
+        return bytes(data[pos:end]).decode('utf-8', 'replace'), end + 1
+    elif tag == b'N':
+        return None, pos
+    elif tag == b'1':
+        return True, pos
+    elif tag == b'0':
+        return False, pos
+    elif tag == b'x':
+        length = struct.unpack_from('>I', data, pos)[0]
+        return bytes(data[pos + 4:pos + 4 + length]), pos + 4 + length
+    elif tag == b'a':
+        return struct.unpack_from('>BBI', data, pos), pos + 6
+    elif tag == b'm':
+        channels = data[pos]
+        return list(data[pos + 1:pos + 1 + channels]), pos + 1 + channels
+    elif tag == b'v':
+        channels = data[pos]
+        return list(struct.unpack_from('>%sI' % channels, data, pos + 1)), pos + 1 + channels * 4
+    elif tag == b'P':
+        props = {}
+        while True:
+            key, pos = _read_tag(data, pos)
+            if key is None:
+                return props, pos
+            length, pos = _read_tag(data, pos)
+            value, pos = _read_tag(data, pos)
+            props[key] = value.rstrip(b'\0').decode('utf-8', 'replace')
+    elif tag == b'f':
+        encoding, pos = _read_tag(data, pos)
+        props, pos = _read_tag(data, pos)
+        return (encoding, props), pos
+    raise PulseError('Unknown tag %r at %s' % (tag, pos - 1))
+
+def read_tags(data):
+    ''' Returns the values of a tag struct as list '''
+    data = bytearray(data)
+    values = []
+    pos = 0
+    while pos < len(data):
+        value, pos = _read_tag(data, pos)
+        values.append(value)
+    return values
+
+def parse_sinks(values):
+    ''' Returns the sinks of a sink info reply as dicts '''
+    sinks = []
+    for i in range(0, len(values) - SINK_FIELDS + 1, SINK_FIELDS):
+        fields = values[i:i + SINK_FIELDS]
+        sinks.append({'index': fields[0], 'name': fields[1], 'description': fields[2] or fields[1],
+                      'channels': fields[3][1], 'volume': fields[6], 'muted': fields[7]})
+    return sinks
+
+def to_percent(values):
+    ''' Percent of the loudest channel, 100% is the normal volume of the sink '''
+    return int(round(max(values or [0]) * 100.0 / VOLUME_NORM))
+
+def from_percent(volume, values):
+    ''' Channel volumes for the percent, the balance of the channels is kept '''
+    target = int(round(volume * VOLUME_NORM / 100.0))
+    loudest = max(values or [0])
+    if len(set(values)) <= 1 or loudest == 0:
+        return [target] * max(1, len(values))
+    return [int(round(value * target / float(loudest))) for value in values]
+
+#------------------------------------------------------------------------------
+# Connection
+#------------------------------------------------------------------------------
+
+def socket_path():
+    ''' The socket of the server like libpulse finds it: PULSE_SERVER, the user runtime folder, the system server '''
+    server = os.environ.get('PULSE_SERVER', '')
+    for entry in server.split():
+        if entry.startswith('unix:'):
+            return entry[5:]
+        if entry.startswith('/'):
+            return entry
+    runtime = os.environ.get('XDG_RUNTIME_DIR') or '/run/user/%s' % os.getuid()
+    for path in [os.path.join(runtime, 'pulse', 'native'), '/var/run/pulse/native']:
+        if os.path.exists(path):
+            return path
+    return os.path.join(runtime, 'pulse', 'native')
+
+def available():
+    return hasattr(socket, 'AF_UNIX') and os.path.exists(socket_path())
+
+def _cookie():
+    paths = [os.environ.get('PULSE_COOKIE', ''), os.path.expanduser('~/.config/pulse/cookie'),
+             os.path.expanduser('~/.pulse-cookie')]
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                cookie = f.read(COOKIE_LENGTH)
+            if len(cookie) == COOKIE_LENGTH:
+                return cookie
+        except (IOError, OSError):
+            pass
+    # Local clients are accepted by their user id anyway
+    return b'\0' * COOKIE_LENGTH
+
+
+class PulseConnection(object):
+    ''' A persistent connection to the sound server.
+
+    A reader thread takes the replies and the events, so commands of several
+    threads can wait for their replies at the same time. on_event is called
+    with the event type and the index, and with None if the connection is lost.
+    '''
+
+    def __init__(self, path=None, timeout=2.0, on_event=None):
+        self.path = path or socket_path()
+        self.timeout = timeout
+        self.on_event = on_event
+        self.sock = None
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.next_tag = 0
+        self.version = None
+
+    def isConnected(self):
+        return self.sock is not None
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except (IOError, OSError) as e:
+            sock.close()
+            raise PulseError('Sound server not reachable at %s: %s' % (self.path, e))
+        sock.settimeout(None)
+        self.sock = sock
+        stats.count('pulse_connect')
+        reader = threading.Thread(target=self._reader, args=(sock,), name='SysVolumePulse')
+        reader.daemon = True
+        reader.start()
+        try:
+            self.version = self.request(COMMAND_AUTH, TagWriter().u32(PROTOCOL_VERSION).arbitrary(_cookie()))[0] & 0xFFFF
+            self.request(COMMAND_SET_CLIENT_NAME, TagWriter().proplist({'application.name': 'Kodi System Volume',
+                                                                        'application.process.id': '%s' % os.getpid()}))
+        except:
+            self.close()
+            raise
+        debug.logInfo('Connected to the sound server %s, protocol %s', self.path, self.version)
+
+    def close(self):
+        sock, self.sock = self.sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except (IOError, OSError):
+                pass
+            sock.close()
+
+    def request(self, command, tags=None):
+        ''' Sends a command and returns the values of the reply '''
+        waiter = [threading.Event(), None]
+        with self.lock:
+            if self.sock is None:
+                raise PulseError('Not connected')
+            tag = self.next_tag
+            self.next_tag = (self.next_tag + 1) & 0x7FFFFFFF
+            payload = TagWriter().u32(command).u32(tag).data + (tags.data if tags is not None else b'')
+            self.pending[tag] = waiter
+            try:
+                self.sock.sendall(HEADER.pack(len(payload), CONTROL_CHANNEL, 0, 0, 0) + bytes(payload))
+            except (IOError, OSError) as e:
+                self.pending.pop(tag, None)
+                raise PulseError('Sending command %s failed: %s' % (command, e))
+        if not waiter[0].wait(self.timeout):
+            with self.lock:
+                self.pending.pop(tag, None)
+            raise PulseError('No reply to command %s within %s seconds' % (command, self.timeout))
+        if isinstance(waiter[1], PulseError):
+            raise waiter[1]
+        return waiter[1]
+
+    def _receive(self, sock, length):
+        data = bytearray()
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if not chunk:
+                raise PulseError('Connection closed by the sound server')
+            data += chunk
+        return data
+
+    def _reader(self, sock):
+        try:
+            while True:
+                length, channel = HEADER.unpack(bytes(self._receive(sock, HEADER.size)))[:2]
+                payload = self._receive(sock, length)
+                if channel != CONTROL_CHANNEL:
+                    continue
+                values = read_tags(payload)
+                if values[0] in (COMMAND_REPLY, COMMAND_ERROR):
+                    with self.lock:
+                        waiter = self.pending.pop(values[1], None)
+                    if waiter is not None:
+                        if values[0] == COMMAND_ERROR:
+                            waiter[1] = PulseError('Sound server error %s' % values[2])
+                        else:
+                            waiter[1] = values[2:]
+                        waiter[0].set()
+                elif values[0] == COMMAND_SUBSCRIBE_EVENT and self.on_event is not None:
+                    self.on_event(values[2], values[3])
+        except Exception as e:
+            error = e
+        with self.lock:
+            # After close the socket is already gone, only a lost connection is reported
+            lost = self.sock is sock
+            if lost:
+                self.sock = None
+            pending, self.pending = self.pending, {}
+        for waiter in pending.values():
+            waiter[1] = PulseError('Connection to the sound server lost')
+            waiter[0].set()
+        if lost:
+            debug.logError('Connection to the sound server lost: %s', error)
+            if self.on_event is not None:
+                self.on_event(None, None)
+
+    # Commands
+
+    def getSink(self, name):
+        sinks = parse_sinks(self.request(COMMAND_GET_SINK_INFO, TagWriter().u32(INVALID_INDEX).string(name)))
+        if not sinks:
+            raise PulseError('Unknown sink %s' % name)
+        return sinks[0]
+
+    def getSinks(self):
+        return parse_sinks(self.request(COMMAND_GET_SINK_INFO_LIST))
+
+    def setSinkVolume(self, index, values):
+        self.request(COMMAND_SET_SINK_VOLUME, TagWriter().u32(index).string(None).cvolume(values))
+
+    def setSinkMute(self, index, mute):
+        self.request(COMMAND_SET_SINK_MUTE, TagWriter().u32(index).string(None).boolean(mute))
+
+    def subscribe(self, mask=SUBSCRIPTION_MASK_SINK):
+        self.request(COMMAND_SUBSCRIBE, TagWriter().u32(mask))
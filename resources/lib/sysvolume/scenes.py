@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import sys
+import threading
+from . import debug, storage
+from .amixer import parse_status
+from .executor import executor
+
+#------------------------------------------------------------------------------
+# Scenes: the levels and switches of all simple controls of the sound cards
+#------------------------------------------------------------------------------
+
+SCENES_FILE = 'scenes.json'
+SIMPLE_CONTENTS = ['amixer', '-c', '{device}', 'scontents']
+MIXER_SCRIPT = ['amixer', '-c', '{device}', '-s']
+
+
+def available():
+    return sys.platform.lower().startswith('linux')
+
+def _control_key(control):
+    return control.name if control.index == 0 else '%s,%s' % (control.name, control.index)
+
+def _snapshot(control):
+    ''' Compact state of a control: raw values and switches per direction, empty parts are left out '''
+    snapshot = {}
+    for key, channels in (('p', control.playback), ('c', control.capture)):
+        raws = [ch.raw for ch in channels if ch.raw is not None]
+        switches = [ch.switch for ch in channels if ch.switch is not None]
+        if raws:
+            snapshot[key] = raws
+        if switches:
+            snapshot[key + 's'] = switches
+    return snapshot
+
+def _switch_value(switches, on, off):
+    if len(set(switches)) == 1:
+        return on if switches[0] else off
+    return ','.join(on if switch else off for switch in switches)
+
+def _lines(key, snapshot):
+    ''' Returns the amixer commands which restore a control '''
+    name, _, index = key.rpartition(',')
+    if not index.isdigit():
+        name, index = key, ''
+    sid = "'%s'%s" % (name, ',' + index if index else '')
+    both = ('p' in snapshot or 'ps' in snapshot) and ('c' in snapshot or 'cs' in snapshot)
+    lines = []
+    for direction, on, off in (('p', 'on', 'off'), ('c', 'cap', 'nocap')):
+        values = []
+        if direction in snapshot:
+            values.append(','.join('%s' % raw for raw in snapshot[direction]))
+        if direction + 's' in snapshot:
+            values.append(_switch_value(snapshot[direction + 's'], on, off))
+        if values:
+            # A control with playback and capture channels needs the direction
+            prefix = ('playback ' if direction == 'p' else 'capture ') if both else ''
+            lines.append('sset %s %s%s' % (sid, prefix, ' '.join(values)))
+    return lines
+
+def read_card(device):
+    ''' Reads the state of all simple controls of a card with one amixer call '''
+    output = executor.execute([arg.format(device=device) for arg in SIMPLE_CONTENTS], key='amixer:%s' % device)
+    controls = {}
+    for control in parse_status(output):
+        snapshot = _snapshot(control)
+        if snapshot:
+            controls[_control_key(control)] = snapshot
+    return controls
+
+def restore_card(device, controls, full=False):
+    ''' Writes the saved controls of a card with one amixer script.
+        Without full only the controls which differ from the current state are written.
+        Returns the number of written controls. '''
+    if not full:
+        current = read_card(device)
+        controls = dict((key, value) for key, value in controls.items() if current.get(key) != value)
+    lines = []
+    for key in sorted(controls):
+        lines.extend(_lines(key, controls[key]))
+    if lines:
+        executor.execute([arg.format(device=device) for arg in MIXER_SCRIPT],
+                         input=''.join(line + '\n' for line in lines), key='amixer:%s' % device)
+    return len(controls)
+
+def _for_devices(devices, func):
+    ''' Calls func for each device, the devices at the same time. Returns the results by device. '''
+    results = {}
+    def run(device):
+        try:
+            results[device] = func(device)
+        except Exception as e:
+            debug.logError('Scene failed for device %s: %s', device, e)
+    threads = [threading.Thread(target=run, args=(device,)) for device in devices]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def _load_scenes():
+    return storage.load_json(storage.profile_path(SCENES_FILE), default={})
+
+#------------------------------------------------------------------------------
+# Public Functions
+#------------------------------------------------------------------------------
+
+def list_scenes():
+    return sorted(_load_scenes())
+
+def save_scene(name, devices):
+    ''' Saves the current state of the devices as scene. Returns False if a device couldn't be read. '''
+    cards = _for_devices(devices, read_card)
+    scenes = _load_scenes()
+    scenes[name] = cards
+    storage.save_json(storage.profile_path(SCENES_FILE), scenes)
+    debug.logInfo('Saved scene %s: %s', name, ', '.join('%s (%s controls)' % (device, len(cards[device])) for device in cards))
+    return len(cards) == len(devices)
+
+def restore_scene(name, full=False):
+    ''' Restores a saved scene. Returns the number of written controls, or None if there is no such scene. '''
+    scene = _load_scenes().get(name)
+    if scene is None:
+        debug.logError('Unknown scene: %s', name)
+        return None
+    written = _for_devices(list(scene), lambda device: restore_card(device, scene[device], full=full))
+    debug.logInfo('Restored scene %s: %s controls written', name, sum(written.values()))
+    return sum(written.values())
+
+def delete_scene(name):
+    scenes = _load_scenes()
+    if scenes.pop(name, None) is None:
+        return False
+    storage.save_json(storage.profile_path(SCENES_FILE), scenes)
+    return True
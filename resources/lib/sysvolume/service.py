@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import json
+import time
+import threading
+from kodi_six import xbmc
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from . import debug, config, commands, client, state, stats, monitor, endpoint
+from .config import settings
+from .mixer import Mixer
+from .coalesce import StepCoalescer
+from .osd import ProgressOsd
+from .executor import executor
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    ''' Handles one command line per connection and replies the mixer state as JSON.
+        The command line is JSON too, {"cmd": "scene", "args": ["movie night"]}, so the
+        arguments may contain spaces. '''
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            cmd = '%s' % request.get('cmd', '').lower()
+            args = ['%s' % arg for arg in request.get('args', [])]
+            start = time.time()
+            reply = self.server.service.execute(cmd, args, osd=request.get('osd', True))
+            stats.record('service.%s' % cmd, time.time() - start, ' '.join([cmd] + args))
+        except Exception as e:
+            debug.logException(e, 'Service command failed')
+            reply = {'error': '%s' % e}
+        self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+
+class CommandServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        self.service = service
+        socketserver.UnixStreamServer.__init__(self, path, CommandHandler)
+
+
+class MixerService(xbmc.Monitor):
+    ''' Background service which owns one mixer instance for all volume commands '''
+
+    def __init__(self):
+        xbmc.Monitor.__init__(self)
+        self.lock = threading.Lock()
+        self.mixer = None
+        self.server = None
+        self.thread = None
+        self.coalescer = None
+        self.options = None
+        # Cancel event of the running or starting fade
+        self.fade_cancel = None
+        self.osd = ProgressOsd()
+        self.monitor = None
+        self.endpoint = None
+
+    def _options(self):
+        return (settings.enable_service, settings.device_name, settings.mixer_name, settings.mixer_group,
+                settings.step_up, settings.step_down, settings.max_volume, settings.volume_curve,
+                settings.coalesce_time, settings.cache_time, settings.publish_state, settings.audio_backend,
+                settings.remote_control, settings.remote_address, settings.remote_port, settings.remote_token)
+
+    def onSettingsChanged(self):
+        config.reloadConfig()
+        if self._options() != self.options:
+            debug.logInfo('Settings changed, restarting mixer service')
+            self.stop()
+            self.start()
+
+    def start(self):
+        self.options = self._options()
+        if not settings.enable_service:
+            debug.logInfo('Mixer service is disabled')
+            return
+        with self.lock:
+            self.mixer = Mixer.create(settings.device_name, settings.mixer_name,
+                                      settings.step_up, settings.step_down,
+                                      settings.max_volume, group=settings.mixer_group)
+            if settings.publish_state:
+                self.monitor = monitor.StateMonitor(self.mixer, self.lock)
+            if settings.remote_control:
+                self.endpoint = endpoint.ControlEndpoint(self, settings.remote_address, settings.remote_port,
+                                                         settings.remote_token)
+                self.mixer.addListener(self.endpoint.onMixerEvent)
+            self.mixer.openSession()
+        if self.monitor is not None:
+            self.monitor.refresh()
+        if settings.coalesce_time > 0:
+            self.coalescer = StepCoalescer(self._change, settings.coalesce_time)
+        path = client.socket_path()
+        try:
+            if not os.path.isdir(settings.addon_profile):
+                os.makedirs(settings.addon_profile)
+            if os.path.exists(path):
+                os.remove(path)
+            self.server = CommandServer(path, self)
+            self.thread = threading.Thread(target=self.server.serve_forever, name='SysVolumeService')
+            self.thread.daemon = True
+            self.thread.start()
+            debug.logInfo('Mixer service listening on %s', path)
+        except Exception as e:
+            debug.logException(e, 'Failed to start the mixer service')
+            self.server = None
+        if self.endpoint is not None:
+            try:
+                self.endpoint.start()
+            except Exception as e:
+                debug.logException(e, 'Failed to start the remote control endpoint')
+                self.endpoint.stop()
+                self.endpoint = None
+
+    def stop(self):
+        self._cancel_fade()
+        if self.coalescer is not None:
+            self.coalescer.flush()
+            self.coalescer = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+            self.thread = None
+            try:
+                os.remove(client.socket_path())
+            except OSError:
+                pass
+        if self.endpoint is not None:
+            self.endpoint.stop()
+            self.endpoint = None
+        if self.monitor is not None:
+            self.monitor.stop()
+            self.monitor = None
+        with self.lock:
+            if self.mixer is not None:
+                self.mixer.closeSession()
+                self.mixer = None
+        self.osd.close()
+        state.flush()
+        debug.logInfo('Command statistics: %s', json.dumps(executor.stats()))
+
+    def _change(self, step):
+        with self.lock:
+            if self.mixer is None:
+                return {'error': 'Mixer service is stopped'}
+            if step != 0:
+                self.mixer.changeVolume(step)
+            return commands.state(self.mixer)
+
+    def _cancel_fade(self):
+        if self.fade_cancel is not None:
+            self.fade_cancel.set()
+            self.fade_cancel = None
+
+    def _fade(self, args, cancel):
+        with self.lock:
+            if self.mixer is None or cancel.is_set():
+                return
+            commands.fade(self.mixer, args, cancel=cancel)
+            reply = commands.state(self.mixer)
+            if self.fade_cancel is cancel:
+                self.fade_cancel = None
+        self._publish(reply)
+
+    def _publish(self, reply, push=True):
+        if self.monitor is not None:
+            monitor.publish(reply['volume'], reply['muted'])
+        if self.endpoint is not None and push:
+            self.endpoint.push(reply)
+
+    def getState(self, refresh=False):
+        ''' The mixer state, with refresh it is read from the mixer '''
+        with self.lock:
+            if self.mixer is None:
+                return {'error': 'Mixer service is stopped'}
+            if refresh:
+                self.mixer.getVolume()
+            return commands.state(self.mixer)
+
+    def execute(self, cmd, args, remote=False, osd=True):
+        ''' Executes a command and shows the new volume, so the calling script can return at once.
+            The steps of the remote endpoint are applied at once, it adds them up and pushes the state itself. '''
+        reply = self._execute(cmd, args, coalesce=not remote)
+        if cmd in commands.COMMANDS and 'error' not in reply:
+            self._publish(reply, push=not remote)
+        if osd and settings.show_progress and commands.shows_osd(cmd, args) and 'error' not in reply:
+            self.osd.show(reply['volume'], reply['muted'])
+            reply = dict(reply, osd=True)
+        return reply
+
+    def _execute(self, cmd, args, coalesce=True):
+        if cmd == 'stats':
+            return {'stats': stats.snapshot(), 'executor': executor.stats()}
+        # A volume command stops a running fade, reading the state doesn't
+        if commands.changes_mixer(cmd, args):
+            self._cancel_fade()
+        elif cmd == 'state' and self.fade_cancel is not None and self.mixer is not None:
+            # The fade keeps the lock until its end, the level of its last step is the state
+            return commands.state(self.mixer)
+        if cmd == 'fade':
+            if self.mixer is None:
+                return {'error': 'Mixer service is stopped'}
+            # The fade runs in the background, so the caller doesn't wait for it
+            self.fade_cancel = threading.Event()
+            thread = threading.Thread(target=self._fade, args=(args, self.fade_cancel), name='SysVolumeFade')
+            thread.daemon = True
+            thread.start()
+            return {'volume': self.mixer.volume, 'muted': self.mixer.muted, 'fade': args}
+        coalescer = self.coalescer
+        if coalescer is not None:
+            if cmd in commands.STEP_COMMANDS and coalesce:
+                return coalescer.change(commands.get_step(self.mixer, cmd, args))
+            # Keep the order of the commands
+            coalescer.flush()
+        with self.lock:
+            if self.mixer is None:
+                return {'error': 'Mixer service is stopped'}
+            if not commands.execute(self.mixer, cmd, args):
+                return {'error': 'Unknown command: %s' % cmd}
+            return commands.state(self.mixer)
+
+    def run(self):
+        debug.logInfo('Mixer service started')
+        self.start()
+        while not self.abortRequested():
+            if self.waitForAbort(10):
+                break
+        self.stop()
+        debug.logInfo('Mixer service stopped')
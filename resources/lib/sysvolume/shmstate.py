@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+''' The mixer state in a small memory mapped file, shared by all processes.
+
+The mixers write the state after each change. Readers map the file once and
+read it without locks and without system calls. A sequence counter, which is
+odd while the state is written, and a checksum make sure that a reader gets a
+consistent state.
+
+Layout, little endian:
+    0   magic 'SVST', layout version (uint16), segment size (uint16)
+    8   sequence counter (uint32)
+    12  volume (int16), muted (uint8), channel count (uint8), time (double),
+        channel levels in percent (8 x uint16)
+    40  crc32 of the bytes 12-39 (uint32)
+'''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import mmap
+import time
+import zlib
+import struct
+import threading
+from . import debug, storage
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SEGMENT_FILE = 'state.mmap'
+MAGIC = b'SVST'
+LAYOUT_VERSION = 1
+SIZE = 64
+MAX_CHANNELS = 8
+READ_RETRIES = 100
+
+HEADER = struct.Struct('<4sHH')
+SEQUENCE = struct.Struct('<I')
+RECORD = struct.Struct('<hBBd%sH' % MAX_CHANNELS)
+CHECKSUM = struct.Struct('<I')
+SEQUENCE_OFFSET = HEADER.size
+RECORD_OFFSET = SEQUENCE_OFFSET + SEQUENCE.size
+CHECKSUM_OFFSET = RECORD_OFFSET + RECORD.size
+
+_segment = None
+_writer = None
+_lock = threading.Lock()
+
+
+def _path():
+    return storage.profile_path(SEGMENT_FILE)
+
+def _checksum(data):
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+class Segment(object):
+    ''' The mapped state file, read only or writable '''
+
+    def __init__(self, path, write=False):
+        self.path = path
+        self.write = write
+        if write:
+            folder = os.path.dirname(path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        else:
+            self.fd = os.open(path, os.O_RDONLY)
+        try:
+            if write:
+                self._lock()
+                try:
+                    self._init()
+                finally:
+                    self._unlock()
+            elif os.fstat(self.fd).st_size < SIZE:
+                raise IOError('State segment %s is incomplete' % path)
+            self.map = mmap.mmap(self.fd, SIZE, access=mmap.ACCESS_WRITE if write else mmap.ACCESS_READ)
+        except:
+            os.close(self.fd)
+            raise
+        magic, version, size = HEADER.unpack(self.map[:HEADER.size])
+        if magic != MAGIC or version != LAYOUT_VERSION or size != SIZE:
+            self.close()
+            raise IOError('Unknown layout of the state segment %s' % path)
+
+    def _init(self):
+        ''' Creates the file of a new or older segment '''
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        if os.fstat(self.fd).st_size >= SIZE and os.read(self.fd, HEADER.size) == HEADER.pack(MAGIC, LAYOUT_VERSION, SIZE):
+            return
+        os.ftruncate(self.fd, SIZE)
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        os.write(self.fd, HEADER.pack(MAGIC, LAYOUT_VERSION, SIZE) + b'\0' * (SIZE - HEADER.size))
+
+    def _lock(self):
+        # Only writers lock, against writers in other processes
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+    def read(self):
+        ''' Returns the state as dict, or None if nothing was written yet '''
+        for i in range(READ_RETRIES):
+            sequence = SEQUENCE.unpack(self.map[SEQUENCE_OFFSET:RECORD_OFFSET])[0]
+            data = self.map[RECORD_OFFSET:CHECKSUM_OFFSET + CHECKSUM.size]
+            if sequence & 1 or SEQUENCE.unpack(self.map[SEQUENCE_OFFSET:RECORD_OFFSET])[0] != sequence:
+                # A writer is busy
+                time.sleep(0)
+                continue
+            if sequence == 0:
+                return None
+            record = data[:RECORD.size]
+            if CHECKSUM.unpack(data[RECORD.size:])[0] != _checksum(record):
+                continue
+            values = RECORD.unpack(record)
+            volume, muted, channels, written = values[:4]
+            return {'volume': volume, 'muted': bool(muted), 'channels': list(values[4:4 + channels]),
+                    'time': written, 'sequence': sequence}
+        debug.logError('No consistent state in %s', self.path)
+        return None
+
+    def update(self, volume, muted, channels=()):
+        ''' Writes the state if it differs from the current one '''
+        channels = [max(0, min(0xFFFF, int(level))) for level in channels][:MAX_CHANNELS]
+        self._lock()
+        try:
+            current = self.read()
+            if current is not None and (current['volume'], current['muted'], current['channels']) == (volume, muted, channels):
+                return False
+            sequence = SEQUENCE.unpack(self.map[SEQUENCE_OFFSET:RECORD_OFFSET])[0]
+            record = RECORD.pack(volume, 1 if muted else 0, len(channels), time.time(),
+                                 *(channels + [0] * (MAX_CHANNELS - len(channels))))
+            self.map[SEQUENCE_OFFSET:RECORD_OFFSET] = SEQUENCE.pack((sequence + 1) & 0xFFFFFFFF)
+            self.map[RECORD_OFFSET:CHECKSUM_OFFSET] = record
+            self.map[CHECKSUM_OFFSET:CHECKSUM_OFFSET + CHECKSUM.size] = CHECKSUM.pack(_checksum(record))
+            # Never 0 again, 0 marks a segment without state
+            self.map[SEQUENCE_OFFSET:RECORD_OFFSET] = SEQUENCE.pack(max(2, (sequence + 2) & 0xFFFFFFFF))
+            return True
+        finally:
+            self._unlock()
+
+#------------------------------------------------------------------------------
+# One mapping per process
+#------------------------------------------------------------------------------
+
+def read():
+    ''' Returns the last state which a mixer of any process has written:
+        {'volume', 'muted', 'channels', 'time', 'sequence'}, or None '''
+    global _segment
+    segment = _writer or _segment
+    if segment is None:
+        with _lock:
+            if _segment is None:
+                try:
+                    _segment = Segment(_path())
+                except (IOError, OSError, ValueError):
+                    # Nothing written yet, the file is mapped at the next call
+                    return None
+            segment = _segment
+    return segment.read()
+
+def write(volume, muted, channels=()):
+    global _writer
+    try:
+        with _lock:
+            if _writer is None:
+                _writer = Segment(_path(), write=True)
+            return _writer.update(volume, muted, channels)
+    except Exception as e:
+        debug.logException(e, 'Failed to write the state segment')
+        return False
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import atexit
+import threading
+from . import debug, config, storage, stats
+
+
+class StateStore(object):
+    ''' Keeps the last volume and mute state in memory.
+
+    Changes are written to a small state file after a short delay, so a burst
+    of volume changes causes one file write instead of two settings writes
+    per change. Unchanged values are not written at all.
+    '''
+
+    STATE_FILE = 'state.json'
+    FLUSH_DELAY = 2.0
+
+    def __init__(self, path, delay=FLUSH_DELAY):
+        self.path = path
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.timer = None
+        self.volume = None
+        self.muted = False
+        self.saved = None
+        self.load()
+
+    def load(self):
+        data = storage.load_json(self.path)
+        with self.lock:
+            if data:
+                self.volume = data.get('volume')
+                self.muted = data.get('muted', False)
+            else:
+                # Take the state which was saved in the settings by older versions
+                last_volume = config.getSetting('last_volume')
+                self.volume = int(last_volume) if last_volume.isdigit() else None
+                self.muted = True if config.getSetting('last_muted') == 'true' else False
+            self.saved = (self.volume, self.muted)
+
+    def get(self):
+        return self.volume, self.muted
+
+    def update(self, volume, muted):
+        with self.lock:
+            if (volume, muted) == (self.volume, self.muted):
+                return
+            self.volume = volume
+            self.muted = muted
+            if self.timer is None and self.delay > 0:
+                self.timer = threading.Timer(self.delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            state = (self.volume, self.muted)
+            if state == self.saved:
+                return
+            try:
+                storage.save_json(self.path, {'volume': self.volume, 'muted': self.muted})
+                self.saved = state
+                stats.count('state_write')
+            except Exception as e:
+                debug.logException(e, 'Failed to save the mixer state')
+
+#------------------------------------------------------------------------------
+# One store per process
+#------------------------------------------------------------------------------
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StateStore(storage.profile_path(StateStore.STATE_FILE))
+            atexit.register(_store.flush)
+    return _store
+
+def flush():
+    if _store is not None:
+        _store.flush()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import time
+import json
+import functools
+import threading
+from collections import deque
+
+#------------------------------------------------------------------------------
+# Performance statistics: timing histograms, counters and the recent operations
+#------------------------------------------------------------------------------
+
+ENABLED = False
+
+try:
+    from .config import settings
+    ENABLED = settings.collect_stats
+except:
+    pass
+
+STATS_FILE = 'stats.json'
+
+# Upper bounds of the histogram buckets in ms
+BUCKETS = [0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+RECENT_SIZE = 200
+
+_lock = threading.Lock()
+_timings = {}
+_counters = {}
+_recent = deque(maxlen=RECENT_SIZE)
+_started = time.time()
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, p):
+        ''' Upper bound of the bucket which contains the percentile '''
+        limit = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= limit and n:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+    def asDict(self):
+        return {'count': self.count, 'avg_ms': round(self.total / self.count, 3) if self.count else 0,
+                'min_ms': round(self.min or 0, 3), 'max_ms': round(self.max, 3),
+                'p50_ms': self.percentile(50), 'p95_ms': self.percentile(95),
+                'buckets': dict(('<=%s' % bound, n) for bound, n in zip(BUCKETS + ['inf'], self.buckets) if n)}
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+def record(name, seconds, info=None):
+    ''' Adds the duration of an operation '''
+    if not ENABLED:
+        return
+    value = seconds * 1000.0
+    with _lock:
+        if name not in _timings:
+            _timings[name] = Histogram()
+        _timings[name].add(value)
+        _recent.append((time.time(), name, value, info))
+
+def count(name, n=1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+def timed(name):
+    ''' Decorator which records the duration of each call '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.time() - start)
+        return wrapper
+    return decorator
+
+def instrument(*methods):
+    ''' Class decorator which records the calls of the methods defined in the class '''
+    def decorator(cls):
+        for method in methods:
+            if method in cls.__dict__:
+                setattr(cls, method, timed('%s.%s' % (cls.__name__, method))(cls.__dict__[method]))
+        return cls
+    return decorator
+
+def snapshot():
+    with _lock:
+        return {'enabled': ENABLED,
+                'uptime_s': int(time.time() - _started),
+                'timings': dict((name, h.asDict()) for name, h in _timings.items()),
+                'counters': dict(_counters),
+                'recent': [{'time': round(t, 3), 'op': name, 'ms': round(value, 3), 'info': info}
+                           for t, name, value, info in _recent]}
+
+def dumps():
+    return json.dumps(snapshot(), sort_keys=True)
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+        _recent.clear()
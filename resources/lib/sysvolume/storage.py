@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import io
+import json
+
+#------------------------------------------------------------------------------
+# Data files in the addon profile folder
+#------------------------------------------------------------------------------
+
+def profile_path(*names):
+    # config writes its settings snapshot with save_json, so it is imported here
+    from .config import settings
+    return os.path.join(settings.addon_profile, *names)
+
+def load_json(path, default=None):
+    ''' Reads a JSON file. Returns the default if it can't be read. '''
+    try:
+        with io.open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+def save_json(path, data):
+    ''' Writes a JSON file into a temp file and renames it, so readers never see a partial file '''
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    tmp = '%s.%s.tmp' % (path, os.getpid())
+    with io.open(tmp, 'w', encoding='utf-8') as f:
+        f.write('%s' % json.dumps(data, separators=(',', ':')))
+    os.rename(tmp, path)
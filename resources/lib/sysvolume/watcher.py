@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2017 Arne Svenson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import re
+import threading
+from . import debug, stats
+from .amixer import spawn
+
+
+class MixerEventWatcher(threading.Thread):
+    ''' Runs "amixer sevents" and calls the callback with the control name
+        whenever a simple control of the card changes its value '''
+
+    COMMAND = ['amixer', '-c', '{device}', 'sevents']
+    RESTART_DELAY = 5.0
+
+    def __init__(self, device_name, callback):
+        threading.Thread.__init__(self, name='SysVolumeWatcher')
+        self.daemon = True
+        self.device_name = device_name
+        self.callback = callback
+        self.process = None
+        self.stopped = threading.Event()
+        self.pattern = re.compile(r"^event value: '(?P<name>.*)',\d+")
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.process, fd = spawn([arg.format(device=self.device_name) for arg in self.COMMAND])
+                stats.count('subprocess')
+                with os.fdopen(fd, 'rb') as output:
+                    for line in self._lines(output):
+                        m = self.pattern.match(line.decode('utf-8', 'replace'))
+                        if m:
+                            self.callback(m.group('name'))
+                self.process.wait()
+            except Exception as e:
+                debug.logError('Mixer event watcher failed: %s', e)
+            if not self.stopped.is_set():
+                # Anything could have changed while no events were read
+                self.callback(None)
+                self.stopped.wait(self.RESTART_DELAY)
+
+    def _lines(self, output):
+        while True:
+            try:
+                line = output.readline()
+            except (IOError, OSError):
+                # The terminal is closed when amixer exits
+                break
+            if not line:
+                break
+            yield line
+
+    def stop(self):
+        self.stopped.set()
+        process = self.process
+        if process is not None:
+            try:
+                process.kill()
+            except OSError:
+                pass